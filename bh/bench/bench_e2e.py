@@ -0,0 +1,209 @@
+'''
+Runs `BHThreadArchiver` end to end against the stand-ins of `harness.py`: a replay server with
+growing synthetic threads in place of the forum, and fake forum channels in place of Discord.
+
+For every number of tracked threads, the archiver is loaded from a generated config and runs passes of
+`fetch_posts` for `--duration` seconds, `--interval` seconds apart. The threads gain `--growth` floors
+per minute in total, spread over the `--active` share of them. Reports the posts archived per minute, the
+lag between a floor appearing and its thread being created, the floors left behind at the end, the floors skipped over, the pages
+the forum served, and the peak memory of the archiver process.
+
+With `--poll-mode adaptive`, `fetch_posts` runs every `--tick` seconds and polls the threads the
+scheduler says are due, starting at `--interval` apart and kept between `--min-interval` and `--max-interval`.
+Comparing the modes with few active threads shows the lag and pages saved by the scheduler:
+    python bench/bench_e2e.py --threads 1000 --active 0.1 --poll-mode fixed
+    python bench/bench_e2e.py --threads 1000 --active 0.1 --poll-mode adaptive
+`--board-listing` checks the board listing before every pass and only polls the threads with new replies.
+With a `--backlog` of many pages, `--backfill-threshold 0` catches up 2 pages per pass instead of backfilling:
+    python bench/bench_e2e.py --threads 10 --initial 2030 --backlog 2000 --backfill-threshold 0
+`--deleted` hides every n-th floor, so floors sit on earlier pages than 20 floors per page would put them.
+
+Every run happens in its own process, so peak memory is measured from a clean start. A run always
+completes its first pass, which fetches every tracked thread: with 10000 threads and pages parsed on the
+event loop, that takes several minutes, `--pool-workers` spreads parsing over worker processes.
+
+Usage: python bench/bench_e2e.py [--threads 10 100 1000 10000] [--duration 60] [--interval 5] [--growth 600] [--active 1.0] [--poll-mode fixed]
+'''
+
+from pathlib import Path
+from typing import Dict, List
+import argparse
+import asyncio
+import csv
+import multiprocessing
+import resource
+import statistics
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from settings import ArchiverSettings
+from archiver import BHThread, BHThreadArchiver
+from boardlisting import BoardWatcher
+from fetcher import configure_fetcher, close_fetcher
+from pagepool import configure_page_pool, get_page_pool
+from ratelimit import configure_rate_limiter
+from harness import BSN, THREAD_NAME, CallLog, FakeBot, FakeForumChannel, ReplayServer, ThreadGrowth, archive_lags
+
+def write_config(path: Path, growth: ThreadGrowth, channels: List[FakeForumChannel], last_floor: int):
+    with path.open("w", encoding="utf8", newline="") as fp:
+        writer = csv.writer(fp)
+        writer.writerow(["channel_id", "bsn", "snA", "last_floor", "gp_thresh", "bp_thresh"])
+        for i, snA in enumerate(growth.snAs()):
+            writer.writerow([channels[i % len(channels)].id, BSN, snA, last_floor, 0, 0])
+
+def percentile(values: List[float], q: float) -> float:
+    if len(values) == 0:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def missed_floors(log: CallLog, last_floors: Dict[int, int], first_floor: int, deleted: int) -> int:
+    '''
+    Number of shown floors up to the last archived floor of every thread that were never posted.
+    '''
+    created = set()
+    for _, name in log.created:
+        match = THREAD_NAME.match(name)
+        if match != None:
+            created.add((int(match.group(1)), int(match.group(2))))
+    return sum(
+        1
+        for snA, last_floor in last_floors.items()
+        for floor in range(first_floor, last_floor + 1)
+        if (deleted <= 1 or floor % deleted != 0) and (snA, floor) not in created
+    )
+
+async def run_archiver(args, num_threads: int) -> Dict[str, float]:
+    growth = ThreadGrowth(num_threads, args.initial, args.growth, time.time(), args.active)
+    server = ReplayServer(growth, args.kind, args.fetch_latency, args.deleted)
+    server.start()
+
+    limiter = configure_rate_limiter(default_limits={server.host: (args.forum_rate, max(1, int(args.forum_rate)))}, default_limit=(1000.0, 1000))
+    configure_fetcher(rate_limiter=limiter)
+    configure_page_pool(args.pool_workers)
+    BHThread.BH_THREAD_TEMPLATE = server.template
+    BoardWatcher.BOARD_TEMPLATE = server.board_template
+    ArchiverSettings.outbox_workers = args.outbox_workers
+    ArchiverSettings.max_concurrent_threads = args.concurrency
+    ArchiverSettings.poll_mode = args.poll_mode
+    ArchiverSettings.poll_initial_interval = args.interval
+    ArchiverSettings.poll_min_interval = args.min_interval
+    ArchiverSettings.poll_max_interval = args.max_interval
+    ArchiverSettings.max_polls_per_minute = args.max_polls
+    ArchiverSettings.board_listing = args.board_listing
+    ArchiverSettings.board_listing_pages = args.listing_pages
+    ArchiverSettings.board_listing_max_age = args.listing_max_age
+    ArchiverSettings.backfill_threshold = args.backfill_threshold
+    ArchiverSettings.backfill_prefetch = args.backfill_prefetch
+    ArchiverSettings.max_backfills = args.max_backfills
+    ArchiverSettings.backfill_report_interval = args.duration / 4
+    # The fixed loop waits `--interval` between passes, the scheduler checks for due threads every `--tick`
+    tick = args.interval if args.poll_mode == "fixed" else args.tick
+
+    log = CallLog()
+    channels = [FakeForumChannel(i + 1, log, args.latency, args.rate_429, args.retry_after, seed=i) for i in range(args.channels)]
+    with tempfile.TemporaryDirectory() as directory:
+        config = Path(directory) / "config.csv"
+        write_config(config, growth, channels, args.initial - args.backlog)
+        archiver = BHThreadArchiver(FakeBot(channels), config, ":memory:", Path(directory) / "state.db")
+        archiver.load_config()
+        if archiver.poster != None:
+            archiver.poster.start()
+
+        start = time.time()
+        passes: List[float] = []
+        while time.time() - start < args.duration:
+            pass_start = time.perf_counter()
+            await archiver.fetch_posts.coro(archiver)
+            passes.append(time.perf_counter() - pass_start)
+            await asyncio.sleep(max(0.0, tick - passes[-1]))
+        elapsed = time.time() - start
+        archiver.cancel_backfills()
+        if archiver.poster != None:
+            await archiver.poster.stop()
+
+        end = time.time()
+        behind = sum(growth.floors(snA, end) for snA in growth.snAs()) - sum(bh_thread.last_floor for bh_thread in archiver.threads)
+        missed = missed_floors(log, {bh_thread.snA: bh_thread.last_floor for bh_thread in archiver.threads}, args.initial - args.backlog + 1, args.deleted)
+        async with aiohttp.ClientSession() as session:
+            async with session.get("http://{}/stats".format(server.host)) as response:
+                server_stats = await response.json()
+        await close_fetcher()
+        get_page_pool().shutdown()
+        archiver.outbox.close()
+    server.stop()
+
+    lags = archive_lags(log, growth)
+    return {
+        "threads": num_threads,
+        "posts_per_minute": len(log.created) * 60.0 / elapsed,
+        "passes": len(passes),
+        "pass_seconds": statistics.mean(passes),
+        "lag_mean": statistics.mean(lags) if len(lags) > 0 else 0.0,
+        "lag_p50": percentile(lags, 0.5),
+        "lag_p95": percentile(lags, 0.95),
+        "lag_max": max(lags) if len(lags) > 0 else 0.0,
+        "behind": behind,
+        "missed": missed,
+        "pages": server_stats["pages"],
+        "not_modified": server_stats["not_modified"],
+        "listings": server_stats["listings"],
+        "rate_limited": log.rate_limited,
+        "peak_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+def run(args, num_threads: int, results: multiprocessing.Queue):
+    results.put(asyncio.run(run_archiver(args, num_threads)))
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("--threads", type=int, nargs="+", default=[10, 100, 1000, 10000], help="Numbers of tracked threads to run with")
+    argparser.add_argument("--duration", type=float, default=60.0, help="Seconds every run lasts")
+    argparser.add_argument("--interval", type=float, default=5.0, help="Seconds between the starts of passes, in place of the 20 minute loop")
+    argparser.add_argument("--growth", type=float, default=600.0, help="New floors per minute over all threads")
+    argparser.add_argument("--active", type=float, default=1.0, help="Share of the threads that gain floors")
+    argparser.add_argument("--initial", type=int, default=30, help="Floors of every thread at the start")
+    argparser.add_argument("--backlog", type=int, default=0, help="Floors of every thread not archived yet at the start")
+    argparser.add_argument("--deleted", type=int, default=0, help="Every this many floors one is deleted, 0 deletes none")
+    argparser.add_argument("--kind", default="plain", help="Kind of post bodies, see forumpages.make_body")
+    argparser.add_argument("--channels", type=int, default=4, help="Forum channels the threads are spread over")
+    argparser.add_argument("--latency", type=float, default=0.05, help="Seconds every Discord call takes")
+    argparser.add_argument("--rate-429", type=float, default=0.0, help="Share of Discord calls answered with 429")
+    argparser.add_argument("--retry-after", type=float, default=1.0)
+    argparser.add_argument("--fetch-latency", type=float, default=0.01, help="Seconds the forum takes to answer")
+    argparser.add_argument("--forum-rate", type=float, default=500.0, help="Forum requests per second")
+    argparser.add_argument("--concurrency", type=int, default=8, help="max_concurrent_threads")
+    argparser.add_argument("--outbox-workers", type=int, default=0)
+    argparser.add_argument("--pool-workers", type=int, default=0, help="process_pool_workers")
+    argparser.add_argument("--poll-mode", default="fixed", choices=["fixed", "adaptive"])
+    argparser.add_argument("--tick", type=float, default=0.5, help="poll_tick, in adaptive mode")
+    argparser.add_argument("--min-interval", type=float, default=1.0, help="poll_min_interval, in adaptive mode")
+    argparser.add_argument("--max-interval", type=float, default=60.0, help="poll_max_interval, in adaptive mode")
+    argparser.add_argument("--board-listing", action="store_true", help="board_listing")
+    argparser.add_argument("--listing-pages", type=int, default=3, help="board_listing_pages")
+    argparser.add_argument("--listing-max-age", type=float, default=0.0, help="board_listing_max_age")
+    argparser.add_argument("--backfill-threshold", type=int, default=4, help="backfill_threshold, 0 catches up 2 pages per pass")
+    argparser.add_argument("--backfill-prefetch", type=int, default=8, help="backfill_prefetch")
+    argparser.add_argument("--max-backfills", type=int, default=2, help="max_backfills")
+    argparser.add_argument("--max-polls", type=float, default=0.0, help="max_polls_per_minute, in adaptive mode")
+    args = argparser.parse_args()
+
+    print("{:>7} {:>9} {:>7} {:>9} {:>9} {:>9} {:>9} {:>9} {:>7} {:>7} {:>8} {:>8} {:>8} {:>6} {:>9}".format(
+        "threads", "posts/min", "passes", "pass s", "lag avg", "lag p50", "lag p95", "lag max", "behind", "missed", "pages", "304s", "listings", "429s", "peak MiB"
+    ))
+    for num_threads in args.threads:
+        results = multiprocessing.Queue()
+        process = multiprocessing.Process(target=run, args=(args, num_threads, results))
+        process.start()
+        result = results.get()
+        process.join()
+        print("{threads:>7} {posts_per_minute:>9.1f} {passes:>7} {pass_seconds:>9.2f} {lag_mean:>9.1f} {lag_p50:>9.1f} {lag_p95:>9.1f} {lag_max:>9.1f} "
+              "{behind:>7} {missed:>7} {pages:>8} {not_modified:>8} {listings:>8} {rate_limited:>6} {peak_mib:>9.1f}".format(**result))
+
+if __name__ == "__main__":
+    main()
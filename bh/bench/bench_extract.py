@@ -0,0 +1,122 @@
+'''
+Compares the single-pass `BahamutPost` extractor with the previous multi-pass extractor, which ran
+one `find_all` and `replace_with` round per kind of element.
+
+The script first checks that both produce identical metadata and content for every kind of
+synthetic post, then reports posts per second for each.
+
+Usage: python bench/bench_extract.py [--repeat 5]
+'''
+
+from pathlib import Path
+from typing import Callable, Dict, List
+from urllib.parse import unquote
+import argparse
+import sys
+import time
+
+from bs4 import BeautifulSoup, Tag
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from bahamut import BahamutPost, get_posts
+from forumpages import make_page
+
+KINDS = ["plain", "images", "embeds", "links", "long", "mixed"]
+URL_PREFIX = "https://forum.gamer.com.tw/"
+
+def legacy_extract(post: Tag, original_link: str = "") -> Dict[str, object]:
+    '''
+    The extractor as it was before the single-pass rewrite. It modifies `post`.
+    '''
+    post_header = post.find("div", attrs={"class": "c-post__header"})
+    try:
+        post_title = post.find("h1", attrs={"class": "c-post__header__title"}).text
+    except:
+        post_title = "No Title"
+    post_floor = post_header.find("a", attrs={"class": "tippy-gpbp"}).attrs["data-floor"]
+    post_href = post_header.find("a", attrs={"class": "tippy-gpbp"}).attrs["href"]
+    post_time = post_header.find("a", attrs={"class": "edittime tippy-post-info"}).attrs["data-mtime"]
+    post_username = post_header.find("a", attrs={"class": "username"}).text
+    post_userid = post_header.find("a", attrs={"class": "userid"}).text
+    post_gp = post_header.find("span", attrs={"class": "postgp"}).span.text
+    post_bp = post_header.find("span", attrs={"class": "postbp"}).span.text
+
+    post_body = post.find("div", attrs={"class": "c-article__content"})
+    for img in post_body.find_all("a", attrs={"class": "photoswipe-image"}):
+        img.replace_with(img.attrs["href"]+"\n")
+    for yt in post_body.find_all("div", attrs={"class": "video-youtube"}):
+        yt_id = yt.find("iframe").attrs["data-src"].split("/")[-1].split("?")[0]
+        yt.replace_with("https://www.youtube.com/watch?v={}".format(yt_id))
+    for tw in post_body.find_all("div", attrs={"class": "video-twitchvod"}):
+        tw_id = tw.find("iframe").attrs["data-src"].split("&")[0].split("=")[-1]
+        tw.replace_with(f"https://www.twitch.tv/{tw_id}")
+    for link in post_body.find_all("a"):
+        real_link = unquote(link.attrs["href"]).split("?url=")[-1]
+        link.replace_with("{} (<{}>)".format(link.text, real_link))
+    for br in post_body.find_all("br"):
+        br.replace_with("\n")
+    for div in post_body.find_all("div"):
+        div.replace_with(div.text.strip()+"\n")
+
+    return {
+        "title": post_title,
+        "floor": int(post_floor),
+        "username": post_username,
+        "userid": post_userid,
+        "link": URL_PREFIX + post_href if post_href != "" else original_link,
+        "time": post_time,
+        "gp": int(post_gp),
+        "bp": int(post_bp) if post_bp != "-" else 0,
+        "content": post_body.text,
+    }
+
+def single_pass_extract(post: Tag, original_link: str = "") -> Dict[str, object]:
+    extracted = BahamutPost(post, original_link)
+    return {**vars(extracted.metadata), "content": extracted.content}
+
+def load_pages(kind: str, num_pages: int = 3) -> List[str]:
+    return [make_page(60076, 1, page, num_pages * 20, kind) for page in range(1, num_pages + 1)]
+
+def check_identical(pages: List[str]) -> int:
+    num_posts = 0
+    for html in pages:
+        legacy_posts = get_posts(BeautifulSoup(html, features="lxml"))
+        new_posts = get_posts(BeautifulSoup(html, features="lxml"))
+        for legacy_post, new_post in zip(legacy_posts, new_posts):
+            expected = legacy_extract(legacy_post, "link")
+            actual = single_pass_extract(new_post, "link")
+            if expected != actual:
+                raise AssertionError("Floor {} differs:\n{!r}\n{!r}".format(expected["floor"], expected, actual))
+            num_posts += 1
+    return num_posts
+
+def measure(extract: Callable[[Tag, str], Dict[str, object]], pages: List[str], repeat: int) -> float:
+    elapsed = 0.0
+    num_posts = 0
+    for _ in range(repeat):
+        # Parse outside the timed section, the legacy extractor modifies the tree
+        soups = [get_posts(BeautifulSoup(html, features="lxml")) for html in pages]
+        start = time.perf_counter()
+        for posts in soups:
+            for post in posts:
+                extract(post, "link")
+                num_posts += 1
+        elapsed += time.perf_counter() - start
+    return num_posts / elapsed
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print("{:8} {:>6} {:>14} {:>14} {:>8}".format("kind", "posts", "legacy post/s", "single post/s", "speedup"))
+    for kind in KINDS:
+        pages = load_pages(kind)
+        num_posts = check_identical(pages)
+        legacy_rate = measure(legacy_extract, pages, args.repeat)
+        new_rate = measure(single_pass_extract, pages, args.repeat)
+        print("{:8} {:>6} {:>14.0f} {:>14.0f} {:>7.2f}x".format(kind, num_posts, legacy_rate, new_rate, new_rate / legacy_rate))
+
+if __name__ == "__main__":
+    main()
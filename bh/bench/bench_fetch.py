@@ -0,0 +1,123 @@
+'''
+Measures how many forum pages per second can be fetched from a local fixture server,
+comparing the old blocking `requests.get` path with the pooled `AsyncFetcher`.
+
+Usage: python bench/bench_fetch.py [--pages 200] [--latency 0.02]
+'''
+
+from pathlib import Path
+from typing import List
+import argparse
+import asyncio
+import sys
+import threading
+import time
+
+from aiohttp import web
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from fetcher import AsyncFetcher
+from forumpages import make_page
+
+BSN = 60076
+SNA = 1
+NUM_FLOORS = 2000
+
+class FixtureServer:
+    '''
+    Serves synthetic thread pages on localhost from a background thread, so that blocking clients
+    can be measured without stalling the server.
+    '''
+
+    def __init__(self, latency: float = 0.0, num_floors: int = NUM_FLOORS):
+        self.latency = latency
+        self.num_floors = num_floors
+        self.port: int = 0
+        self.loop: asyncio.AbstractEventLoop = None
+        self.runner: web.AppRunner = None
+        self.ready = threading.Event()
+        self.pages = {}
+
+    def page(self, bsn: int, snA: int, page: int) -> str:
+        key = (bsn, snA, page)
+        if key not in self.pages:
+            self.pages[key] = make_page(bsn, snA, page, self.num_floors)
+        return self.pages[key]
+
+    async def handle_thread(self, request: web.Request) -> web.Response:
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+        query = request.query
+        html = self.page(int(query.get("bsn", BSN)), int(query.get("snA", SNA)), int(query.get("page", 1)))
+        response = web.Response(text=html, content_type="text/html")
+        response.enable_compression()
+        return response
+
+    async def start_app(self):
+        app = web.Application()
+        app.router.add_get("/C.php", self.handle_thread)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    def run(self):
+        self.loop = asyncio.new_event_loop()
+        self.loop.run_until_complete(self.start_app())
+        self.ready.set()
+        self.loop.run_forever()
+        self.loop.run_until_complete(self.runner.cleanup())
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+        self.ready.wait()
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def url(self, page: int) -> str:
+        return "http://127.0.0.1:{}/C.php?bsn={}&snA={}&page={}".format(self.port, BSN, SNA, page)
+
+def bench_requests(urls: List[str]) -> float:
+    import requests
+    start = time.perf_counter()
+    for url in urls:
+        requests.get(url, timeout=30).text
+    return len(urls) / (time.perf_counter() - start)
+
+async def bench_fetcher(urls: List[str], per_host: int) -> float:
+    async with AsyncFetcher(max_connections=per_host, max_connections_per_host=per_host) as fetcher:
+        start = time.perf_counter()
+        await asyncio.gather(*[fetcher.get_text(url) for url in urls])
+        return len(urls) / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=200, help="number of pages fetched per run")
+    parser.add_argument("--latency", type=float, default=0.02, help="simulated server latency in seconds")
+    args = parser.parse_args()
+
+    server = FixtureServer(latency=args.latency)
+    server.start()
+    num_pages = (NUM_FLOORS + 19) // 20
+    urls = [server.url(i % num_pages + 1) for i in range(args.pages)]
+
+    # Render every page once so the server side cost is not measured
+    for i in range(1, num_pages + 1):
+        server.page(BSN, SNA, i)
+
+    print("{} pages, {:.0f} ms simulated latency".format(args.pages, args.latency * 1000))
+    try:
+        print("requests.get (sequential):  {:8.1f} pages/s".format(bench_requests(urls)))
+    except ImportError:
+        print("requests.get (sequential):  skipped, requests is not installed")
+    for per_host in (1, 4, 8, 16):
+        rate = asyncio.run(bench_fetcher(urls, per_host))
+        print("AsyncFetcher (per host={:2d}): {:8.1f} pages/s".format(per_host, rate))
+
+    server.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+'''
+Compares the bot profiles of `BotProfile` by feeding a synthetic guild and a minute of synthetic
+gateway traffic straight into the parsers of a `discord.Client`, without connecting to Discord.
+
+The guild has `--members` members, of which `--online` are online. A minute of traffic has a presence
+update from every online member, `--messages` messages with as many typing events, and a member update
+per 100 members. Like the gateway, only the events the profile's intents subscribe to are delivered,
+and members and presences are only part of the guild if the profile asks for them.
+
+Reports per profile the events received per minute, the CPU time spent parsing them, and the memory
+held by the connection state after the guild is loaded and after the minute of traffic.
+
+Usage: python bench/bench_intents.py [--members 5000] [--online 1500] [--messages 600] [--minutes 3]
+'''
+
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+import argparse
+import asyncio
+import gc
+import sys
+import time
+import tracemalloc
+
+from discord import Client
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from settings import BotProfile
+
+GUILD_ID = "1"
+TIMESTAMP = "2023-01-01T00:00:00+00:00"
+
+def user(i: int) -> dict:
+    return {"id": str(10**6 + i), "username": "user{}".format(i), "discriminator": "0", "avatar": None, "global_name": None}
+
+def member(i: int) -> dict:
+    return {"user": user(i), "roles": [], "joined_at": TIMESTAMP, "deaf": False, "mute": False, "flags": 0}
+
+def presence(i: int, status: str) -> dict:
+    return {
+        "user": {"id": user(i)["id"]},
+        "guild_id": GUILD_ID,
+        "status": status,
+        "activities": [{"name": "game {}".format(i % 50), "type": 0}],
+        "client_status": {"desktop": status},
+    }
+
+def guild(args, profile: BotProfile) -> dict:
+    '''
+    A GUILD_CREATE payload, with the members a chunking profile would end up with.
+    '''
+    members = [member(i) for i in range(args.members)] if profile.chunk_guilds_at_startup else []
+    presences = [presence(i, "online") for i in range(args.online)] if profile.intents.presences else []
+    return {
+        "id": GUILD_ID,
+        "name": "guild",
+        "icon": None,
+        "owner_id": user(0)["id"],
+        "channels": [
+            {"id": str(100 + i), "type": 0, "name": "channel{}".format(i), "position": i, "guild_id": GUILD_ID, "permission_overwrites": []}
+            for i in range(20)
+        ],
+        "roles": [{"id": GUILD_ID, "name": "@everyone", "permissions": "0", "position": 0, "color": 0, "hoist": False, "managed": False, "mentionable": False}],
+        "members": members,
+        "presences": presences,
+        "member_count": args.members,
+        "emojis": [],
+        "stickers": [],
+        "threads": [],
+        "voice_states": [],
+        "features": [],
+        "large": True,
+    }
+
+def traffic(args, minute: int) -> List[Tuple[str, str, dict]]:
+    '''
+    A minute of gateway events as `(intent, event, payload)`.
+    '''
+    events: List[Tuple[str, str, dict]] = []
+    for i in range(args.online):
+        events.append(("presences", "PRESENCE_UPDATE", presence(i, "idle" if (i + minute) % 2 else "online")))
+    for i in range(args.messages):
+        author = (i * 7 + minute) % args.members
+        channel_id = str(100 + i % 20)
+        events.append(("guild_typing", "TYPING_START", {
+            "channel_id": channel_id, "guild_id": GUILD_ID, "user_id": user(author)["id"], "timestamp": 0, "member": member(author),
+        }))
+        events.append(("guild_messages", "MESSAGE_CREATE", {
+            "id": str(10**9 + minute * args.messages + i), "channel_id": channel_id, "guild_id": GUILD_ID,
+            "author": user(author), "member": {k: v for k, v in member(author).items() if k != "user"},
+            "content": "message {}".format(i), "timestamp": TIMESTAMP, "edited_timestamp": None, "tts": False,
+            "mention_everyone": False, "mentions": [], "mention_roles": [], "attachments": [], "embeds": [], "pinned": False, "type": 0,
+        }))
+    for i in range(args.members // 100):
+        updated = member((i * 97 + minute) % args.members)
+        updated["nick"] = "nick {}".format(minute)
+        events.append(("members", "GUILD_MEMBER_UPDATE", dict(updated, guild_id=GUILD_ID)))
+    return events
+
+async def run(args, name: str) -> Dict[str, float]:
+    profile = BotProfile.get(name)
+    gc.collect()
+    tracemalloc.start()
+    client = Client(**profile.options)
+    state = client._connection
+    parsers: Dict[str, Callable[[dict], None]] = state.parsers
+
+    parsers["GUILD_CREATE"](guild(args, profile))
+    gc.collect()
+    loaded = tracemalloc.get_traced_memory()[0]
+
+    received = 0
+    parse_time = 0.0
+    for minute in range(args.minutes):
+        events = [(event, payload) for intent, event, payload in traffic(args, minute) if getattr(profile.intents, intent)]
+        received += len(events)
+        start = time.process_time()
+        for event, payload in events:
+            parsers[event](payload)
+        parse_time += time.process_time() - start
+        # Let the dispatched events run so their tasks are freed
+        await asyncio.sleep(0)
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    members = len(client.get_guild(int(GUILD_ID)).members)
+    result = {
+        "events": received / args.minutes,
+        "cpu_ms": parse_time * 1000 / args.minutes,
+        "loaded": loaded / 1024 / 1024,
+        "after": after / 1024 / 1024,
+        "members": members,
+    }
+    print("{:>12} {:>12.0f} {:>14.1f} {:>10} {:>11.2f} {:>11.2f}".format(
+        name, result["events"], result["cpu_ms"], members, result["loaded"], result["after"]
+    ))
+    await client.close()
+    return result
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("--members", type=int, default=5000)
+    argparser.add_argument("--online", type=int, default=1500)
+    argparser.add_argument("--messages", type=int, default=600, help="Messages per minute")
+    argparser.add_argument("--minutes", type=int, default=3)
+    argparser.add_argument("--profiles", nargs="+", default=BotProfile.NAMES, choices=BotProfile.NAMES)
+    args = argparser.parse_args()
+
+    print("{:>12} {:>12} {:>14} {:>10} {:>11} {:>11}".format("profile", "events/min", "CPU ms/min", "members", "loaded MB", "after MB"))
+    results = {name: asyncio.run(run(args, name)) for name in args.profiles}
+    if "full" in results:
+        full = results["full"]
+        for name, result in results.items():
+            if name != "full":
+                print("{}: {:.0%} of the events and {:.0%} of the memory of full".format(
+                    name, result["events"] / full["events"], result["after"] / full["after"]
+                ))
+
+if __name__ == "__main__":
+    main()
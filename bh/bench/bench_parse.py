@@ -0,0 +1,71 @@
+'''
+Measures the parse time and peak memory of each page parser backend.
+
+Each backend must give the same title, page count and extracted posts as the full BeautifulSoup parse.
+Peak memory is measured with tracemalloc, which does not see memory allocated inside libxml2, so the
+lxml numbers only cover the Python objects built from the tree.
+
+Usage: python bench/bench_parse.py [--repeat 5]
+'''
+
+from pathlib import Path
+from typing import List
+import argparse
+import gc
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from bahamut import BahamutPost
+from pageparser import PARSERS, PageParser, get_parser
+from forumpages import make_page
+
+KINDS = ["plain", "images", "embeds", "links", "long", "mixed"]
+
+def summarize(parser: PageParser, html: str):
+    page = parser.parse(html)
+    posts = [BahamutPost(post).export(include_header=True) for post in page.get_post_list()]
+    return page.get_title(), page.get_page_count(), posts
+
+def measure_time(parser: PageParser, pages: List[str], repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for html in pages:
+            parser.parse(html).get_post_list()
+    return (time.perf_counter() - start) / (repeat * len(pages))
+
+def measure_peak(parser: PageParser, html: str) -> int:
+    gc.collect()
+    tracemalloc.start()
+    page = parser.parse(html)
+    page.get_post_list()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del page
+    return peak
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("--repeat", type=int, default=5)
+    args = argparser.parse_args()
+
+    print("{:8} {:9} {:>10} {:>12} {:>12}".format("kind", "backend", "page KiB", "ms / page", "peak KiB"))
+    for kind in KINDS:
+        pages = [make_page(60076, 1, page, 100, kind) for page in range(1, 4)]
+        expected = [summarize(get_parser("soup"), html) for html in pages]
+        for name in PARSERS:
+            parser = get_parser(name)
+            if [summarize(parser, html) for html in pages] != expected:
+                raise AssertionError("Backend {} differs from the full parse on {} pages".format(name, kind))
+            print("{:8} {:9} {:>10.0f} {:>12.2f} {:>12.0f}".format(
+                kind,
+                name,
+                len(pages[0].encode("utf8")) / 1024,
+                measure_time(parser, pages, args.repeat) * 1000,
+                measure_peak(parser, pages[0]) / 1024,
+            ))
+
+if __name__ == "__main__":
+    main()
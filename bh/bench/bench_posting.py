@@ -0,0 +1,115 @@
+'''
+Compares the two ways of sending posts longer than a message, against a fake forum channel that
+adds a fixed latency to every call and charges uploads by their size:
+- `attachment`: One `create_thread` call with the post uploaded as a text file
+- `messages`: One `create_thread` call, then the rest of the post as ordered messages in the thread
+
+Both modes follow the steps of `BHThread.archive_post`, including the rate limiter, and report posts
+and characters per second, Discord calls per post and the time spent splitting.
+
+Usage: python bench/bench_posting.py [--posts 40] [--latency 0.08] [--bandwidth 256]
+'''
+
+from pathlib import Path
+from typing import List
+import argparse
+import asyncio
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from bahamut import PostRecord
+from pagepool import extract_page
+from posting import LONG_POST_MODES, prepare_post_content, send_followups, split_message
+from ratelimit import configure_rate_limiter, discord_route, get_rate_limiter
+from forumpages import make_page
+
+class FakeThread:
+
+    def __init__(self, channel: "FakeChannel", id: int):
+        self.channel = channel
+        self.id = id
+
+    async def send(self, content: str):
+        await self.channel.call(len(content.encode("utf8")))
+
+    async def edit(self, **kwargs):
+        await self.channel.call(0)
+
+class FakeChannel:
+
+    def __init__(self, latency: float, bandwidth: float):
+        '''
+        ## Parameters:
+        latency: `float`
+            Seconds added to every call
+        bandwidth: `float`
+            Upload speed in bytes per second
+        '''
+        self.id = 42
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.calls = 0
+        self.threads = 0
+
+    async def call(self, size: int):
+        self.calls += 1
+        await asyncio.sleep(self.latency + size / self.bandwidth)
+
+    async def create_thread(self, name: str, content: str = "", file=None, **kwargs):
+        size = len(content.encode("utf8"))
+        if file != None:
+            size += len(file.fp.getvalue())
+        await self.call(size)
+        self.threads += 1
+        return FakeThread(self, self.threads), None
+
+async def archive(channel: FakeChannel, posts: List[PostRecord], mode: str):
+    limiter = get_rate_limiter()
+    for post in posts:
+        content_kwargs, followups = prepare_post_content(post.info, post.content, post.SEPARATOR, mode=mode)
+        await limiter.wait(discord_route("POST", "/channels/{}/threads".format(channel.id)))
+        thread, _ = await channel.create_thread(name=post.title, **content_kwargs)
+        await send_followups(thread, followups)
+        await limiter.wait(discord_route("PATCH", "/channels/{}".format(thread.id)))
+        await thread.edit(archived=True)
+
+def long_posts(count: int) -> List[PostRecord]:
+    posts: List[PostRecord] = []
+    page = 1
+    while len(posts) < count:
+        html = make_page(60076, 1, page, count * 2, "long")
+        posts += [post for post in extract_page(html, "").posts if len(post.export(include_header=True)) > 2000]
+        page += 1
+    return posts[:count]
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("--posts", type=int, default=40)
+    argparser.add_argument("--latency", type=float, default=0.08)
+    argparser.add_argument("--bandwidth", type=float, default=256, help="Upload speed in KiB per second")
+    argparser.add_argument("--rate", type=float, default=1000.0, help="Discord requests per second allowed per route")
+    args = argparser.parse_args()
+
+    posts = long_posts(args.posts)
+    chars = sum(len(post.content) for post in posts)
+
+    start = time.perf_counter()
+    messages = sum(len(split_message(post.export(include_header=True))) for post in posts)
+    split_ms = (time.perf_counter() - start) * 1000 / len(posts)
+    print("{} posts, {:.0f} characters and {:.1f} messages per post on average, {:.3f} ms to split a post".format(
+        len(posts), chars / len(posts), messages / len(posts), split_ms
+    ))
+
+    print("{:12} {:>10} {:>12} {:>12}".format("mode", "posts / s", "chars / s", "calls / post"))
+    for mode in LONG_POST_MODES:
+        configure_rate_limiter(default_limit=(args.rate, max(1, int(args.rate))))
+        channel = FakeChannel(args.latency, args.bandwidth * 1024)
+        start = time.perf_counter()
+        asyncio.run(archive(channel, posts, mode))
+        elapsed = time.perf_counter() - start
+        print("{:12} {:>10.2f} {:>12.0f} {:>12.1f}".format(mode, len(posts) / elapsed, chars / elapsed, channel.calls / len(posts)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+'''
+Measures every stage of turning a forum page into posts, on the recorded pages of `fixtureset.py`:
+- `parse`: Parsing the HTML with the page parser backend
+- `header`: Reading the thread title and page count
+- `post_list`: Finding the post sections
+- `extract`: `BahamutPost` reading the metadata and body of every post
+- `prepare`: `prepare_post_content` building the message and attachment of every post
+
+Before measuring, the posts extracted from every fixture are checked against the manifest.
+
+For every fixture and stage, reports the throughput (pages or posts per second), the memory blocks
+allocated and still alive after the stage, and the peak memory during the stage. Timing keeps the fastest
+run and runs without tracemalloc, memory is measured in a separate run with it.
+
+Results can be saved and compared with an earlier run, to catch regressions between versions:
+    python bench/bench_stages.py --save before
+    (change the code)
+    python bench/bench_stages.py --compare before
+
+Usage: python bench/bench_stages.py [--repeat 5] [--parser targeted] [--fixtures plain very_long] [--save NAME] [--compare NAME] [--threshold 0.1]
+'''
+
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+import argparse
+import gc
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from bahamut import BahamutPost, PostRecord
+from pageparser import PARSERS, DEFAULT_PARSER, get_parser
+from posting import prepare_post_content
+from fixtureset import Fixture, load_fixtures, verify_fixtures
+
+RESULT_DIR = Path(__file__).resolve().parent / "results"
+STAGES = ["parse", "header", "post_list", "extract", "prepare"]
+
+class StageResult:
+
+    def __init__(self, seconds: float = 0.0, items: int = 0, peak: int = 0, retained: int = 0, blocks: int = 0):
+        self.seconds = seconds # Of the fastest run
+        self.items = items # Pages or posts handled per run
+        self.peak = peak # Bytes
+        self.retained = retained # Bytes still allocated after the stage
+        self.blocks = blocks # Memory blocks still allocated after the stage
+
+    @property
+    def rate(self) -> float:
+        return self.items / self.seconds if self.seconds > 0 else float("inf")
+
+    def to_dict(self) -> dict:
+        return dict(vars(self))
+
+def make_stages(fixture: Fixture, parser_name: str) -> List[Callable[[dict], int]]:
+    '''
+    The stages as functions of a shared state, each returning the number of items it handled.
+    '''
+    parser = get_parser(parser_name)
+
+    def parse(state: dict) -> int:
+        state["page"] = parser.parse(fixture.html)
+        return 1
+
+    def header(state: dict) -> int:
+        page = state["page"]
+        state["title"] = page.get_title()
+        state["num_pages"] = page.get_page_count() if page.get_page_btn_row() != None else 1
+        return 1
+
+    def post_list(state: dict) -> int:
+        state["tags"] = page_tags = state["page"].get_post_list()
+        return len(page_tags)
+
+    def extract(state: dict) -> int:
+        state["posts"] = posts = [BahamutPost(tag, fixture.url).to_record() for tag in state["tags"]]
+        return len(posts)
+
+    def prepare(state: dict) -> int:
+        posts: List[PostRecord] = state["posts"]
+        state["prepared"] = [prepare_post_content(post.info, post.content, post.SEPARATOR) for post in posts]
+        return len(posts)
+
+    return [parse, header, post_list, extract, prepare]
+
+def measure_time(fixture: Fixture, parser_name: str, repeat: int) -> Dict[str, StageResult]:
+    '''
+    Keeps the fastest of `repeat` runs of every stage, which is the least disturbed by other load on the host.
+    '''
+    results = {name: StageResult(seconds=float("inf")) for name in STAGES}
+    for _ in range(repeat):
+        state: dict = {}
+        for name, stage in zip(STAGES, make_stages(fixture, parser_name)):
+            start = time.perf_counter()
+            items = stage(state)
+            results[name].seconds = min(results[name].seconds, time.perf_counter() - start)
+            results[name].items = items
+    return results
+
+def measure_memory(fixture: Fixture, parser_name: str, results: Dict[str, StageResult]):
+    state: dict = {}
+    gc.collect()
+    tracemalloc.start()
+    for name, stage in zip(STAGES, make_stages(fixture, parser_name)):
+        gc.collect()
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        blocks = sys.getallocatedblocks()
+        stage(state)
+        current, peak = tracemalloc.get_traced_memory()
+        results[name].peak = peak - before
+        results[name].retained = current - before
+        results[name].blocks = sys.getallocatedblocks() - blocks
+    tracemalloc.stop()
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def result_path(name: str) -> Path:
+    path = Path(name)
+    return path if path.suffix == ".json" else RESULT_DIR / "{}.json".format(name)
+
+def compare(results: Dict[str, Dict[str, StageResult]], baseline: dict, threshold: float) -> int:
+    '''
+    Prints the change of every stage from the baseline.
+
+    ## Returns
+    `int`
+        Number of stages that got slower or used more peak memory by more than `threshold`
+    '''
+    num_regressions = 0
+    print()
+    print("Compared with {} ({})".format(baseline["meta"].get("commit"), baseline["meta"].get("time")))
+    print("{:12} {:10} {:>10} {:>10}".format("fixture", "stage", "time", "peak"))
+    for fixture_name, stages in results.items():
+        for stage_name, result in stages.items():
+            old = baseline["results"].get(fixture_name, {}).get(stage_name)
+            if old == None:
+                continue
+            time_ratio = result.seconds / old["seconds"] if old["seconds"] > 0 else 1.0
+            peak_ratio = result.peak / old["peak"] if old["peak"] > 0 else 1.0
+            regressed = time_ratio > 1 + threshold or peak_ratio > 1 + threshold
+            num_regressions += regressed
+            print("{:12} {:10} {:>+10.1%} {:>+10.1%} {}".format(
+                fixture_name, stage_name, time_ratio - 1, peak_ratio - 1, "REGRESSION" if regressed else ""
+            ))
+    return num_regressions
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("--repeat", type=int, default=5)
+    argparser.add_argument("--parser", default=DEFAULT_PARSER, choices=list(PARSERS))
+    argparser.add_argument("--fixtures", nargs="+", default=None)
+    argparser.add_argument("--save", metavar="NAME", help="Saves the results to bench/results/NAME.json")
+    argparser.add_argument("--compare", metavar="NAME", help="Compares with bench/results/NAME.json, or a path to a results file")
+    argparser.add_argument("--threshold", type=float, default=0.1, help="Relative slowdown or peak memory growth reported as a regression")
+    args = argparser.parse_args()
+
+    fixtures = load_fixtures(args.fixtures)
+    verify_fixtures(fixtures)
+
+    print("{:12} {:10} {:>6} {:>12} {:>10} {:>10} {:>12}".format("fixture", "stage", "items", "items/s", "ms", "peak KiB", "new blocks"))
+    results: Dict[str, Dict[str, StageResult]] = {}
+    for fixture in fixtures:
+        stages = measure_time(fixture, args.parser, args.repeat)
+        measure_memory(fixture, args.parser, stages)
+        results[fixture.name] = stages
+        for name, result in stages.items():
+            print("{:12} {:10} {:>6} {:>12.0f} {:>10.2f} {:>10.0f} {:>12}".format(
+                fixture.name, name, result.items, result.rate, result.seconds * 1000, result.peak / 1024, result.blocks
+            ))
+
+    if args.save != None:
+        RESULT_DIR.mkdir(exist_ok=True)
+        data = {
+            "meta": {
+                "commit": git_commit(),
+                "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "python": platform.python_version(),
+                "parser": args.parser,
+                "repeat": args.repeat,
+            },
+            "results": {name: {stage: result.to_dict() for stage, result in stages.items()} for name, stages in results.items()},
+        }
+        result_path(args.save).write_text(json.dumps(data, indent=2) + "\n", encoding="utf8")
+        print("Saved to {}".format(result_path(args.save)))
+
+    if args.compare != None:
+        baseline = json.loads(result_path(args.compare).read_text(encoding="utf8"))
+        if baseline["meta"].get("parser") != args.parser:
+            print("The baseline used the {} parser".format(baseline["meta"].get("parser")))
+        if compare(results, baseline, args.threshold) > 0:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
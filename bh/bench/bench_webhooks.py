@@ -0,0 +1,111 @@
+'''
+Measures how much faster threads are created when a forum channel's posts are spread over several
+webhooks, against a local server that limits every webhook like Discord does (`--limit` requests per
+`--window` seconds, announced through `X-RateLimit-*` headers, and 429s past the limit).
+
+The server checks that the threads are created in the order they were published.
+
+Usage: python bench/bench_webhooks.py [--threads 40] [--webhooks 1 2 4] [--latency 0.05]
+'''
+
+from pathlib import Path
+from typing import Dict, List, Tuple
+import argparse
+import asyncio
+import sys
+import time
+
+from aiohttp import web
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+sys.path.append(str(Path(__file__).resolve().parent.parent.parent / "src"))
+
+from ratelimit import RateLimiter
+from webhook import Webhook, WebhookClient, WebhookPublisher
+
+class WebhookServer:
+    '''
+    Accepts thread creations for any webhook, with a fixed window rate limit per webhook.
+    '''
+
+    def __init__(self, limit: int, window: float, latency: float):
+        self.limit = limit
+        self.window = window
+        self.latency = latency
+        self.windows: Dict[str, Tuple[float, int]] = {}
+        self.threads: List[str] = []
+        self.limited = 0
+        self.runner: web.AppRunner = None
+        self.port = 0
+
+    async def execute(self, request: web.Request) -> web.Response:
+        await asyncio.sleep(self.latency)
+        id = request.match_info["id"]
+        now = time.monotonic()
+        start, count = self.windows.get(id, (now, 0))
+        if now - start >= self.window:
+            start, count = now, 0
+        reset_after = self.window - (now - start)
+        if count >= self.limit:
+            self.limited += 1
+            return web.json_response(
+                {"message": "You are being rate limited.", "retry_after": reset_after},
+                status=429,
+                headers={"Retry-After": "{:.3f}".format(reset_after), "X-RateLimit-Limit": str(self.limit), "X-RateLimit-Remaining": "0", "X-RateLimit-Reset-After": "{:.3f}".format(reset_after)},
+            )
+        self.windows[id] = (start, count + 1)
+        payload = await request.json()
+        self.threads.append(payload["thread_name"])
+        return web.json_response(
+            {"id": str(len(self.threads)), "channel_id": str(len(self.threads))},
+            headers={"X-RateLimit-Limit": str(self.limit), "X-RateLimit-Remaining": str(self.limit - count - 1), "X-RateLimit-Reset-After": "{:.3f}".format(reset_after)},
+        )
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/api/webhooks/{id}/{token}", self.execute)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        Webhook.URL_TEMPLATE = "http://127.0.0.1:{}/api/webhooks/{{id}}/{{token}}{{params}}".format(self.port)
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+async def run(args, num_webhooks: int) -> float:
+    server = WebhookServer(args.limit, args.window, args.latency)
+    await server.start()
+    client = WebhookClient(rate_limiter=RateLimiter(default_limit=(1.0, args.limit)))
+    publisher = WebhookPublisher([Webhook(i, "token") for i in range(num_webhooks)], client)
+
+    names = ["post #{}".format(i) for i in range(args.threads)]
+    start = time.perf_counter()
+    await asyncio.gather(*[publisher.publish(name, "content") for name in names])
+    elapsed = time.perf_counter() - start
+
+    await publisher.close()
+    await server.stop()
+    if server.threads != names:
+        raise AssertionError("Threads were created out of order")
+    print("{:>9} {:>10.2f} {:>10.1f} {:>8}".format(num_webhooks, args.threads / elapsed, client.waited, server.limited))
+    return elapsed
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("--threads", type=int, default=40)
+    argparser.add_argument("--webhooks", type=int, nargs="+", default=[1, 2, 4])
+    argparser.add_argument("--latency", type=float, default=0.05)
+    argparser.add_argument("--limit", type=int, default=5)
+    argparser.add_argument("--window", type=float, default=2.0)
+    args = argparser.parse_args()
+
+    print("{:>9} {:>10} {:>10} {:>8}".format("webhooks", "threads/s", "waited s", "429s"))
+    elapsed = {num_webhooks: asyncio.run(run(args, num_webhooks)) for num_webhooks in args.webhooks}
+    baseline = elapsed[args.webhooks[0]]
+    for num_webhooks in args.webhooks[1:]:
+        print("{} webhooks: {:.1f}x the throughput of {}".format(num_webhooks, baseline / elapsed[num_webhooks], args.webhooks[0]))
+
+if __name__ == "__main__":
+    main()
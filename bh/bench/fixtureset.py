@@ -0,0 +1,128 @@
+'''
+Recorded forum pages for the benchmarks, kept under `bench/fixtures`.
+
+Every fixture is a gzipped page and an entry in `fixtures/manifest.json` with its source URL, its
+number of posts and a digest of the posts extracted from it. The digest catches changes to the
+extracted output, so a faster `BahamutPost` or page parser can be checked against the same pages
+it is measured on.
+
+Recording a page from the forum:
+    python bench/fixtureset.py --record NAME URL
+Recording the synthetic pages (plain, images, embeds, links, long):
+    python bench/fixtureset.py --synthetic
+Updating the digests after an intended change to the extracted output:
+    python bench/fixtureset.py --update
+'''
+
+from pathlib import Path
+from typing import Dict, List
+import argparse
+import gzip
+import hashlib
+import json
+import sys
+
+import requests
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from pagepool import extract_page
+from forumpages import make_page
+
+FIXTURE_DIR = Path(__file__).resolve().parent / "fixtures"
+MANIFEST = FIXTURE_DIR / "manifest.json"
+
+# The synthetic pages, by fixture name: the kind of post bodies, see `forumpages.make_body`
+SYNTHETIC = {
+    "plain": "plain",
+    "image_heavy": "images",
+    "embeds": "embeds",
+    "link_dense": "links",
+    "very_long": "long",
+}
+SYNTHETIC_URL = "https://forum.gamer.com.tw/C.php?bsn=60076&snA=1&page=1"
+
+class Fixture:
+
+    def __init__(self, name: str, url: str, html: str):
+        self.name = name
+        self.url = url
+        self.html = html
+
+def load_manifest() -> Dict[str, dict]:
+    if not MANIFEST.exists():
+        return {}
+    return json.loads(MANIFEST.read_text(encoding="utf8"))
+
+def save_manifest(manifest: Dict[str, dict]):
+    MANIFEST.write_text(json.dumps(manifest, ensure_ascii=False, indent=2, sort_keys=True) + "\n", encoding="utf8")
+
+def digest_posts(html: str, url: str) -> tuple:
+    '''
+    ## Returns
+    `tuple`
+        The number of posts extracted by the full BeautifulSoup parse, and a digest of them
+    '''
+    posts = extract_page(html, url, "soup").posts
+    data = json.dumps([post.to_dict() for post in posts], ensure_ascii=False, sort_keys=True)
+    return len(posts), hashlib.sha256(data.encode("utf8")).hexdigest()
+
+def save_fixture(name: str, url: str, html: str, source: str, manifest: Dict[str, dict]):
+    FIXTURE_DIR.mkdir(exist_ok=True)
+    # mtime=0 keeps the file identical when the same page is recorded again
+    (FIXTURE_DIR / "{}.html.gz".format(name)).write_bytes(gzip.compress(html.encode("utf8"), mtime=0))
+    num_posts, digest = digest_posts(html, url)
+    manifest[name] = {"url": url, "source": source, "posts": num_posts, "digest": digest, "bytes": len(html.encode("utf8"))}
+    print("{}: {} posts, {:.0f} KiB".format(name, num_posts, len(html.encode("utf8")) / 1024))
+
+def load_fixtures(names: List[str] = None) -> List[Fixture]:
+    '''
+    Loads the fixtures in the manifest, or only the given ones.
+    '''
+    manifest = load_manifest()
+    if names == None:
+        names = sorted(manifest)
+    fixtures: List[Fixture] = []
+    for name in names:
+        if name not in manifest:
+            raise KeyError("No fixture named {}, run bench/fixtureset.py first".format(name))
+        html = gzip.decompress((FIXTURE_DIR / "{}.html.gz".format(name)).read_bytes()).decode("utf8")
+        fixtures.append(Fixture(name, manifest[name]["url"], html))
+    return fixtures
+
+def verify_fixtures(fixtures: List[Fixture]):
+    '''
+    Checks that the posts extracted from every fixture are the ones recorded in the manifest.
+    '''
+    manifest = load_manifest()
+    for fixture in fixtures:
+        num_posts, digest = digest_posts(fixture.html, fixture.url)
+        if digest != manifest[fixture.name]["digest"]:
+            raise AssertionError("The posts extracted from {} changed ({} posts, {} recorded). Run bench/fixtureset.py --update if this is intended.".format(
+                fixture.name, num_posts, manifest[fixture.name]["posts"]
+            ))
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("--record", nargs=2, metavar=("NAME", "URL"), help="Records a page from the forum")
+    argparser.add_argument("--synthetic", action="store_true", help="Records the synthetic pages")
+    argparser.add_argument("--update", action="store_true", help="Updates the digests of every fixture")
+    args = argparser.parse_args()
+
+    manifest = load_manifest()
+    if args.record != None:
+        name, url = args.record
+        response = requests.get(url, headers={"User-Agent": "Mozilla/5.0"})
+        response.raise_for_status()
+        response.encoding = "utf-8"
+        save_fixture(name, url, response.text, "recorded", manifest)
+    if args.synthetic:
+        for name, kind in SYNTHETIC.items():
+            save_fixture(name, SYNTHETIC_URL, make_page(60076, 1, 1, 20, kind), "synthetic", manifest)
+    if args.update:
+        for fixture in load_fixtures():
+            save_fixture(fixture.name, fixture.url, fixture.html, manifest[fixture.name]["source"], manifest)
+    save_manifest(manifest)
+
+if __name__ == "__main__":
+    main()
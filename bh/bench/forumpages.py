@@ -0,0 +1,318 @@
+'''
+Builds synthetic Bahamut forum pages for the benchmarks.
+
+The markup reproduces the parts the archiver reads: the scrolldown title, the page button row
+and the `section.c-section` posts with their header and `c-article__content` body. A navigation bar,
+inline scripts and a sidebar stand in for the rest of a real page. Board listings (B.php) have a
+`tr.b-list__row` per thread with its post count and last reply time.
+'''
+
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+import random
+import time
+import zlib
+
+POSTS_PER_PAGE = 20
+THREADS_PER_LISTING = 30
+FORUM_TZ = timezone(timedelta(hours=8))
+
+WORDS = ["今天", "直播", "好好笑", "剪輯", "精華", "歌回", "雜談", "抽獎", "新衣裝", "合作", "企劃", "生日",
+         "stream", "clip", "collab", "karaoke", "debut", "anniversary", "highlight"]
+HASHTAGS = ["閒聊", "情報", "精華", "歌回", "心得", "Hololive", "Nijisanji", "VShojo"]
+
+PAGE_TEMPLATE = '''<!DOCTYPE html>
+<html lang="zh-Hant-TW">
+<head><meta charset="utf-8"><title>{title} @場外休憩區 哈啦板 - 巴哈姆特</title>
+<script>var BH_BSN = {bsn}; var BH_SNA = {snA};</script>
+</head>
+<body>
+{chrome}
+<div class="c-menu__scrolldown"><h1 class="title">{title}</h1></div>
+<div class="b-pager pagination">
+<p class="BH-pagebtnA">{page_buttons}</p>
+</div>
+{posts}
+{sidebar}
+<div class="c-section__footer">Copyright © GAMANIA DIGITAL ENTERTAINMENT CO., LTD.</div>
+</body>
+</html>
+'''
+
+POST_TEMPLATE = '''<section class="c-section" id="post_{sn}">
+<div class="c-section__main c-post ">
+<div class="c-post__header">
+{title_tag}<div class="c-post__header__author">
+<a class="floor tippy-gpbp" data-floor="{floor}" href="{href}">{floor} 樓</a>
+<a class="username" href="https://home.gamer.com.tw/{userid}" target="_blank">{username}</a>
+<a class="userid" href="https://home.gamer.com.tw/{userid}" target="_blank">{userid}</a>
+</div>
+<div class="c-post__header__info">
+<a class="edittime tippy-post-info" data-area="C" data-mtime="{time}" href="javascript:;">{time}</a>
+</div>
+<div class="postcount">
+<span class="postgp"><i class="icon-gp"></i><span>{gp}</span></span>
+<span class="postbp"><i class="icon-bp"></i><span>{bp}</span></span>
+</div>
+</div>
+<div class="c-post__body">
+<article class="c-article FM-P2" id="cf{sn}">
+<div class="c-article__content">{body}</div>
+</article>
+</div>
+</div>
+</section>
+<section class="c-section" id="comment_{sn}"><div class="c-reply">Comments</div></section>
+'''
+
+LISTING_TEMPLATE = '''<!DOCTYPE html>
+<html lang="zh-Hant-TW">
+<head><meta charset="utf-8"><title>場外休憩區 哈啦板 - 巴哈姆特</title>
+<script>var BH_BSN = {bsn};</script>
+</head>
+<body>
+{chrome}
+<div class="b-pager pagination">
+<p class="BH-pagebtnA">{page_buttons}</p>
+</div>
+<table class="b-list">
+<tbody>
+{rows}
+</tbody>
+</table>
+{sidebar}
+</body>
+</html>
+'''
+
+LISTING_ROW_TEMPLATE = '''<tr class="b-list__row b-list-item b-imglist-item">
+<td class="b-list__summary"><a class="b-list__summary__sort" href="B.php?bsn={bsn}&subbsn=0">{hashtag}</a></td>
+<td class="b-list__main"><a data-gtm="B頁文章列表-縮圖" href="C.php?bsn={bsn}&snA={snA}&tnum={floors}"><p class="b-list__main__title">{title}</p></a></td>
+<td class="b-list__count"><p class="b-list__count__number"><span title="互動：{floors}">{floors}</span>/<span title="人氣：{views}">{views}</span></p>
+<p class="b-list__count__user"><a href="https://home.gamer.com.tw/{userid}">{userid}</a></p></td>
+<td class="b-list__time"><p class="b-list__time__edittime"><a data-gtm="B頁文章列表-最後回覆" href="C.php?bsn={bsn}&snA={snA}&last=1#down">{last_reply}</a></p>
+<p class="b-list__time__user"><a href="https://home.gamer.com.tw/{replier}">{replier}</a></p></td>
+</tr>
+'''
+
+def make_chrome(rng: random.Random) -> str:
+    '''
+    The navigation bar, menus and inline scripts that surround the posts on a real page.
+    '''
+    menu = "".join('<li class="nav-item"><a href="https://forum.gamer.com.tw/B.php?bsn={}">{}</a></li>'.format(
+        rng.randint(1000, 80000), make_sentence(rng, 2)) for _ in range(150))
+    scripts = "".join("<script>var config{} = {};</script>".format(
+        i, "[" + ",".join(str(rng.randint(0, 99999)) for _ in range(3000)) + "]") for i in range(3))
+    return '<div class="TOP-bh"><ul class="nav">{}</ul></div>{}'.format(menu, scripts)
+
+def make_sidebar(rng: random.Random) -> str:
+    items = "".join('<li class="b-list__row"><a href="C.php?bsn=60076&snA={}">{}</a><span>{}</span></li>'.format(
+        rng.randint(1, 999999), make_sentence(rng, 6), rng.randint(0, 999)) for _ in range(60))
+    return '<aside class="c-sidebar"><ul>{}</ul></aside>'.format(items)
+
+def make_sentence(rng: random.Random, num_words: int = 8) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(num_words))
+
+def make_image(rng: random.Random) -> str:
+    name = "".join(rng.choice("0123456789abcdef") for _ in range(32))
+    return ('<a class="photoswipe-image" href="https://truth.bahamut.com.tw/s01/2022/{name}.JPG" target="_blank">'
+            '<img class="lazyload" data-src="https://truth.bahamut.com.tw/s01/2022/{name}.JPG?w=1000" /></a>').format(name=name)
+
+def make_youtube(rng: random.Random) -> str:
+    video_id = "".join(rng.choice("abcdefghijkABCDEFGHIJK0123456789_-") for _ in range(11))
+    return ('<div class="video-youtube"><div class="video-container">'
+            '<iframe class="lazyload" data-src="https://www.youtube.com/embed/{}?wmode=transparent" allowfullscreen></iframe>'
+            '</div></div>').format(video_id)
+
+def make_twitch(rng: random.Random) -> str:
+    channel = rng.choice(["vshojo", "ironmouse", "nyanners", "projektmelody"])
+    return ('<div class="video-twitchvod"><iframe class="lazyload" '
+            'data-src="https://player.twitch.tv/?channel={}&parent=forum.gamer.com.tw&autoplay=false"></iframe></div>').format(channel)
+
+def make_link(rng: random.Random) -> str:
+    target = "https%3A%2F%2Fexample.com%2F{}%3Fid%3D{}".format(rng.choice(WORDS[12:]), rng.randint(1, 99999))
+    return '<a href="https://ref.gamer.com.tw/redir.php?url={}" target="_blank">{}</a>'.format(target, rng.choice(WORDS))
+
+def make_body(rng: random.Random, kind: str = "mixed", paragraphs: int = 6) -> str:
+    '''
+    Builds the inner HTML of a `c-article__content` block.
+
+    ## Parameters:
+    rng: `random.Random`
+        The random generator, seeded by the caller so pages are reproducible
+    kind: `str`
+        One of "plain", "images", "embeds", "links", "long" or "mixed"
+    paragraphs: `int`
+        Number of `div` paragraphs
+    '''
+    if kind == "long":
+        paragraphs *= 40
+    blocks: List[str] = []
+    for i in range(paragraphs):
+        text = make_sentence(rng, rng.randint(4, 16))
+        if kind in ("links", "mixed") and rng.random() < (0.8 if kind == "links" else 0.3):
+            text += " " + make_link(rng)
+        if rng.random() < 0.15:
+            text += " #{}".format(rng.choice(HASHTAGS))
+        blocks.append("<div>{}<br></div>".format(text))
+        if kind in ("images", "mixed") and rng.random() < (0.7 if kind == "images" else 0.2):
+            blocks.append("<div>{}</div>".format(make_image(rng)))
+        if kind in ("embeds", "mixed") and rng.random() < (0.5 if kind == "embeds" else 0.1):
+            blocks.append(make_youtube(rng) if rng.random() < 0.6 else make_twitch(rng))
+    blocks.append("<div><br></div><div>#{} #{}</div>".format(rng.choice(HASHTAGS), rng.choice(HASHTAGS)))
+    return "\n".join(blocks)
+
+def make_post(rng: random.Random, bsn: int, snA: int, floor: int, title: str, kind: str = "mixed") -> str:
+    sn = snA * 100 + floor
+    userid = "user{:04d}".format(rng.randint(0, 9999))
+    return POST_TEMPLATE.format(
+        sn=sn,
+        title_tag='<h1 class="c-post__header__title">{}</h1>\n'.format(title) if floor == 1 else "",
+        floor=floor,
+        href="C.php?bsn={}&snA={}&sn={}".format(bsn, snA, sn),
+        username="使用者{}".format(userid[-4:]),
+        userid=userid,
+        time="2022-10-{:02d} {:02d}:{:02d}:00".format(1 + floor % 28, floor % 24, floor % 60),
+        gp=rng.randint(0, 50),
+        bp=rng.choice(["-", "-", "-", "1", "3", "5"]),
+        body=make_body(rng, kind),
+    )
+
+def make_page_buttons(page: int, num_pages: int) -> str:
+    buttons = []
+    for i in range(max(1, page - 3), min(num_pages, page + 3) + 1):
+        if i == page:
+            buttons.append('<a class="pagenow">{}</a>'.format(i))
+        else:
+            buttons.append('<a href="?page={}">{}</a>'.format(i, i))
+    if buttons[-1].endswith(">{}</a>".format(num_pages)) == False:
+        buttons.append('<span>...</span><a href="?page={}">{}</a>'.format(num_pages, num_pages))
+    return "".join(buttons)
+
+def visible_floors(num_floors: int, deleted: int = 0) -> int:
+    '''
+    Number of floors shown when every `deleted`-th floor was deleted.
+    '''
+    return num_floors - num_floors // deleted if deleted > 1 else num_floors
+
+def nth_visible_floor(index: int, deleted: int = 0) -> int:
+    '''
+    The floor number of the shown floor at `index`, from 0, when every `deleted`-th floor was deleted.
+    '''
+    if deleted <= 1:
+        return index + 1
+    return index // (deleted - 1) * deleted + index % (deleted - 1) + 1
+
+def make_page(
+    bsn: int,
+    snA: int,
+    page: int,
+    num_floors: int,
+    kind: str = "mixed",
+    title: str = "【情報】VTuber 綜合討論串",
+    seed: Optional[int] = None,
+    chrome: Optional[str] = None,
+    sidebar: Optional[str] = None,
+    deleted: int = 0,
+) -> str:
+    '''
+    Builds a full thread page.
+
+    ## Parameters:
+    bsn: `int`
+        The board ID
+    snA: `int`
+        The thread ID
+    page: `int`
+        The page number, starting from 1
+    num_floors: `int`
+        Total number of floors in the thread, which decides the page count
+    kind: `str`
+        The kind of post bodies, see `make_body`
+    title: `str`
+        The thread title
+    seed: `Optional[int]`
+        Seed for the random generator. Defaults to a value derived from the page, so the same page
+        is always rendered the same way.
+    chrome, sidebar: `Optional[str]`
+        Markup from `make_chrome` and `make_sidebar` to reuse, so that many pages can be rendered
+        quickly. Generated for the page if not given.
+    deleted: `int`
+        Every `deleted`-th floor was deleted and is not shown, so later floors move to earlier pages. 0 deletes none.
+    '''
+    if seed == None:
+        seed = zlib.crc32("{}-{}-{}-{}".format(bsn, snA, page, kind).encode())
+    rng = random.Random(seed)
+    num_visible = visible_floors(num_floors, deleted)
+    num_pages = max(1, (num_visible + POSTS_PER_PAGE - 1) // POSTS_PER_PAGE)
+    shown = range((page - 1) * POSTS_PER_PAGE, min(num_visible, page * POSTS_PER_PAGE))
+    posts = [make_post(rng, bsn, snA, nth_visible_floor(index, deleted), title, kind) for index in shown]
+    return PAGE_TEMPLATE.format(
+        chrome=chrome if chrome != None else make_chrome(rng),
+        sidebar=sidebar if sidebar != None else make_sidebar(rng),
+        title=title,
+        bsn=bsn,
+        snA=snA,
+        page_buttons=make_page_buttons(page, num_pages),
+        posts="".join(posts),
+    )
+
+def listing_time(timestamp: float, now: Optional[float] = None) -> str:
+    '''
+    Shows the time of a last reply like the board listing does: "今日 12:34", "昨日 12:34", "06/15 12:34" or "2023/06/15".
+    '''
+    shown = datetime.fromtimestamp(timestamp, FORUM_TZ)
+    today = datetime.fromtimestamp(time.time() if now == None else now, FORUM_TZ).date()
+    if shown.date() == today:
+        return shown.strftime("今日 %H:%M")
+    if shown.date() == today - timedelta(days=1):
+        return shown.strftime("昨日 %H:%M")
+    if shown.year == today.year:
+        return shown.strftime("%m/%d %H:%M")
+    return shown.strftime("%Y/%m/%d")
+
+def make_listing(
+    bsn: int,
+    page: int,
+    threads: List[Tuple[int, str, int, float]],
+    num_pages: int,
+    chrome: Optional[str] = None,
+    sidebar: Optional[str] = None,
+) -> str:
+    '''
+    Builds a board listing page (B.php).
+
+    ## Parameters:
+    bsn: `int`
+        The board ID
+    page: `int`
+        The page number, starting from 1
+    threads: `List[Tuple[int, str, int, float]]`
+        The snA, title, number of floors and last reply time of every thread on the page, newest reply first
+    num_pages: `int`
+        Number of listing pages
+    chrome, sidebar: `Optional[str]`
+        Markup from `make_chrome` and `make_sidebar` to reuse
+    '''
+    rng = random.Random(zlib.crc32("{}-{}".format(bsn, page).encode()))
+    rows = [
+        LISTING_ROW_TEMPLATE.format(
+            bsn=bsn,
+            snA=snA,
+            title=title,
+            floors=floors,
+            views=floors * 37,
+            hashtag=rng.choice(HASHTAGS),
+            userid="user{}".format(snA % 97),
+            replier="user{}".format((snA + floors) % 97),
+            last_reply=listing_time(last_reply),
+        )
+        for snA, title, floors, last_reply in threads
+    ]
+    return LISTING_TEMPLATE.format(
+        chrome=chrome if chrome != None else make_chrome(rng),
+        sidebar=sidebar if sidebar != None else make_sidebar(rng),
+        bsn=bsn,
+        page_buttons=make_page_buttons(page, num_pages),
+        rows="".join(rows),
+    )
@@ -0,0 +1,317 @@
+'''
+Stand-ins for the forum and for Discord, so the archiver can be run end to end on one machine.
+
+- `ThreadGrowth`: The number of floors of every synthetic thread over time. Each active thread gains
+  floors at a steady rate, staggered so that floors appear across the threads evenly, the others stay quiet.
+- `ReplayServer`: Serves the pages of the synthetic threads from a separate process, as they are at
+  the time of the request. Pages carry an `ETag` and unchanged pages are answered with 304. The board
+  listing lists the threads by their last reply.
+- `FakeForumChannel` and `FakeThread`: Record `create_thread`, `send` and `edit` calls, with a
+  configurable latency and share of 429 responses. A 429 is waited out and retried, like discord.py does.
+- `FakeBot`: Just enough of a bot for `BHThreadArchiver` to look up the fake channels.
+'''
+
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import multiprocessing
+import random
+import re
+import sys
+import time
+
+from aiohttp import web
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from forumpages import POSTS_PER_PAGE, THREADS_PER_LISTING, make_chrome, make_listing, make_page, make_sidebar, visible_floors
+
+BSN = 60076
+FIRST_SNA = 1000
+THREAD_NAME = re.compile(r"^討論串 (\d+) (\d+)樓$")
+
+class ThreadGrowth:
+
+    def __init__(self, num_threads: int, initial_floors: int, floors_per_minute: float, start: float, active_share: float = 1.0):
+        '''
+        ## Parameters:
+        num_threads: `int`
+            Number of threads, with the IDs `FIRST_SNA` onwards
+        initial_floors: `int`
+            Floors of every thread at `start`
+        floors_per_minute: `float`
+            New floors per minute over all threads
+        start: `float`
+            Wall clock time the threads start growing
+        active_share: `float`
+            Share of the threads that gain floors, the first ones
+        '''
+        self.num_threads = num_threads
+        self.num_active = max(1, min(num_threads, round(num_threads * active_share)))
+        self.initial_floors = initial_floors
+        self.rate = floors_per_minute / 60.0 / self.num_active # Floors per second of one active thread
+        self.start = start
+
+    def snAs(self) -> List[int]:
+        return list(range(FIRST_SNA, FIRST_SNA + self.num_threads))
+
+    def active(self, snA: int) -> bool:
+        return snA - FIRST_SNA < self.num_active
+
+    def phase(self, snA: int) -> float:
+        return (snA - FIRST_SNA) / self.num_active
+
+    def floors(self, snA: int, now: float) -> int:
+        if self.rate <= 0 or not self.active(snA):
+            return self.initial_floors
+        return self.initial_floors + int(max(0.0, now - self.start) * self.rate + self.phase(snA))
+
+    def appeared(self, snA: int, floor: int) -> float:
+        '''
+        Wall clock time a floor appeared on the forum.
+        '''
+        if floor <= self.initial_floors or self.rate <= 0:
+            return self.start
+        return self.start + (floor - self.initial_floors - self.phase(snA)) / self.rate
+
+    def last_reply(self, snA: int, now: float) -> float:
+        '''
+        Wall clock time of the last floor of a thread. The initial floors were posted the day before.
+        '''
+        num_floors = self.floors(snA, now)
+        if num_floors <= self.initial_floors:
+            return self.start - 86400
+        return self.appeared(snA, num_floors)
+
+class ReplayServer:
+    '''
+    Serves `/C.php?bsn=&snA=&page=` for the threads of a `ThreadGrowth`, and their listing at `/B.php?bsn=&page=`,
+    from a child process. Pages past the last one are answered with the last page, like the forum does.
+    '''
+
+    CACHE_SIZE = 512 # Rendered pages kept in memory
+
+    def __init__(self, growth: ThreadGrowth, kind: str = "plain", latency: float = 0.0, deleted: int = 0):
+        '''
+        ## Parameters:
+        growth: `ThreadGrowth`
+            The floors of the threads over time
+        kind: `str`
+            The kind of post bodies, see `forumpages.make_body`
+        latency: `float`
+            Seconds every request takes
+        deleted: `int`
+            Every `deleted`-th floor of every thread is deleted and not shown. 0 deletes none.
+        '''
+        self.growth = growth
+        self.kind = kind
+        self.latency = latency
+        self.deleted = deleted
+        self.port = 0
+        self.process: Optional[multiprocessing.Process] = None
+
+    def start(self):
+        ports = multiprocessing.Queue()
+        self.process = multiprocessing.Process(target=self.serve, args=(ports,), daemon=True)
+        self.process.start()
+        self.port = ports.get()
+
+    def stop(self):
+        if self.process != None:
+            self.process.terminate()
+            self.process.join()
+            self.process = None
+
+    @property
+    def template(self) -> str:
+        '''
+        The page URL template, for `BHThread.BH_THREAD_TEMPLATE`.
+        '''
+        return "http://127.0.0.1:{}/C.php?bsn={{board}}&snA={{thread}}&page={{page}}".format(self.port)
+
+    @property
+    def board_template(self) -> str:
+        '''
+        The listing URL template, for `BoardWatcher.BOARD_TEMPLATE`.
+        '''
+        return "http://127.0.0.1:{}/B.php?bsn={{board}}&page={{page}}".format(self.port)
+
+    @property
+    def host(self) -> str:
+        return "127.0.0.1:{}".format(self.port)
+
+    def serve(self, ports: multiprocessing.Queue):
+        pages: "OrderedDict[tuple, str]" = OrderedDict()
+        requests = {"pages": 0, "not_modified": 0, "listings": 0}
+        # Every page shares the same surroundings, rendering them is most of the cost of a page
+        rng = random.Random(0)
+        chrome, sidebar = make_chrome(rng), make_sidebar(rng)
+
+        def render(snA: int, page: int, num_floors: int) -> str:
+            key = (snA, page, num_floors)
+            html = pages.get(key)
+            if html == None:
+                html = make_page(BSN, snA, page, num_floors, self.kind, title="討論串 {}".format(snA), chrome=chrome, sidebar=sidebar, deleted=self.deleted)
+                pages[key] = html
+                if len(pages) > self.CACHE_SIZE:
+                    pages.popitem(last=False)
+            return html
+
+        async def handle_thread(request: web.Request) -> web.Response:
+            if self.latency > 0:
+                await asyncio.sleep(self.latency)
+            snA = int(request.query["snA"])
+            num_floors = self.growth.floors(snA, time.time())
+            num_visible = visible_floors(num_floors, self.deleted)
+            num_pages = max(1, (num_visible + POSTS_PER_PAGE - 1) // POSTS_PER_PAGE)
+            page = min(int(request.query.get("page", 1)), num_pages)
+            # A page changes when its floors or the page count change
+            floors_on_page = min(num_visible, page * POSTS_PER_PAGE) - (page - 1) * POSTS_PER_PAGE
+            etag = '"{}-{}-{}-{}"'.format(snA, page, floors_on_page, num_pages)
+            if request.headers.get("If-None-Match") == etag:
+                requests["not_modified"] += 1
+                return web.Response(status=304, headers={"ETag": etag})
+            requests["pages"] += 1
+            # Every floor of the page is rendered as it was, only the page buttons follow the page count
+            return web.Response(text=render(snA, page, num_floors), content_type="text/html", headers={"ETag": etag})
+
+        async def handle_board(request: web.Request) -> web.Response:
+            if self.latency > 0:
+                await asyncio.sleep(self.latency)
+            now = time.time()
+            threads = [
+                (snA, "討論串 {}".format(snA), self.growth.floors(snA, now), self.growth.last_reply(snA, now))
+                for snA in self.growth.snAs()
+            ]
+            threads.sort(key=lambda thread: thread[3], reverse=True)
+            num_pages = max(1, (len(threads) + THREADS_PER_LISTING - 1) // THREADS_PER_LISTING)
+            page = min(int(request.query.get("page", 1)), num_pages)
+            requests["listings"] += 1
+            html = make_listing(BSN, page, threads[(page - 1) * THREADS_PER_LISTING:page * THREADS_PER_LISTING], num_pages, chrome, sidebar)
+            return web.Response(text=html, content_type="text/html")
+
+        async def handle_stats(request: web.Request) -> web.Response:
+            return web.json_response(requests)
+
+        async def run():
+            app = web.Application()
+            app.router.add_get("/C.php", handle_thread)
+            app.router.add_get("/B.php", handle_board)
+            app.router.add_get("/stats", handle_stats)
+            runner = web.AppRunner(app, access_log=None)
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            ports.put(site._server.sockets[0].getsockname()[1])
+            await asyncio.Event().wait()
+
+        asyncio.run(run())
+
+class CallLog:
+    '''
+    Every call made to the fake channels.
+    '''
+
+    def __init__(self):
+        self.created: List[Tuple[float, str]] = [] # Wall clock time and name of every created thread
+        self.messages = 0
+        self.edits = 0
+        self.rate_limited = 0
+        self.rate_limit_wait = 0.0
+
+class FakeThread:
+
+    def __init__(self, channel: "FakeForumChannel", id: int, name: str):
+        self.channel = channel
+        self.id = id
+        self.name = name
+        self.archived = False
+
+    async def send(self, content: str = "", **kwargs):
+        await self.channel.call()
+        self.channel.log.messages += 1
+
+    async def edit(self, archived: Optional[bool] = None, **kwargs):
+        await self.channel.call()
+        if archived != None:
+            self.archived = archived
+        self.channel.log.edits += 1
+        return self
+
+class FakeGuild:
+
+    def __init__(self, id: int):
+        self.id = id
+
+class FakeForumChannel:
+
+    def __init__(self, id: int, log: CallLog, latency: float = 0.05, rate_429: float = 0.0, retry_after: float = 1.0, seed: int = 0):
+        '''
+        ## Parameters:
+        id: `int`
+            The channel ID
+        log: `CallLog`
+            Where the calls are recorded
+        latency: `float`
+            Seconds every call takes
+        rate_429: `float`
+            Share of calls answered with 429, from 0 to 1
+        retry_after: `float`
+            Seconds a 429 asks to wait
+        '''
+        self.id = id
+        self.name = "channel-{}".format(id)
+        self.guild = FakeGuild(1)
+        self.available_tags = []
+        self.log = log
+        self.latency = latency
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.threads: Dict[int, FakeThread] = {}
+
+    async def call(self):
+        await asyncio.sleep(self.latency)
+        while self.random.random() < self.rate_429:
+            self.log.rate_limited += 1
+            self.log.rate_limit_wait += self.retry_after
+            await asyncio.sleep(self.retry_after + self.latency)
+
+    async def create_thread(self, name: str, content: str = "", file=None, applied_tags=None, **kwargs):
+        await self.call()
+        thread = FakeThread(self, self.id * 1000000 + len(self.threads) + 1, name)
+        self.threads[thread.id] = thread
+        self.log.created.append((time.time(), name))
+        return thread, None
+
+    def get_thread(self, thread_id: int) -> Optional[FakeThread]:
+        return self.threads.get(thread_id)
+
+class FakeBot:
+
+    def __init__(self, channels: List[FakeForumChannel]):
+        self.channels = {channel.id: channel for channel in channels}
+        self.shard_id = None
+        self.shard_count = None
+
+    def get_channel(self, channel_id: int) -> Optional[FakeForumChannel]:
+        return self.channels.get(channel_id)
+
+    async def fetch_channel(self, channel_id: int) -> FakeForumChannel:
+        return self.channels[channel_id]
+
+    def add_listener(self, func, name: Optional[str] = None):
+        pass
+
+def archive_lags(log: CallLog, growth: ThreadGrowth) -> List[float]:
+    '''
+    Seconds between a floor appearing on the forum and its thread being created, for every created thread.
+    '''
+    lags: List[float] = []
+    for created, name in log.created:
+        match = THREAD_NAME.match(name)
+        if match != None:
+            snA, floor = int(match.group(1)), int(match.group(2))
+            lags.append(created - growth.appeared(snA, floor))
+    return lags
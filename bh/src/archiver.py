@@ -1,42 +1,35 @@
 
 from pathlib import Path
-import requests
-from typing import Tuple, Union, List
-from time import sleep
-from bs4 import Tag, BeautifulSoup
+from typing import TYPE_CHECKING, Tuple, Union, List, Dict, Optional
 import asyncio
-from collections import defaultdict
-
-import pandas as pd
-from pandas import DataFrame
+import multiprocessing
+import time
 
 from discord.ext import commands, tasks
-from discord import Guild, File, Thread
+from discord import Guild, Thread
 from discord.ext.commands import Context
 from discord.channel import ForumChannel
 
-from settings import BotEssentials
-from bahamut import BahamutPost, get_webpage, get_posts
-from mycredentials import BOT_TOKEN
-
-
+from settings import BotEssentials, ArchiverSettings
+from bahamut import PostRecord
+from fetcher import configure_fetcher, close_fetcher, get_fetcher
+from pagecache import PageCache, CachedPage, fingerprint
+from statestore import StateStore, ArchiveLedger, FloorIndex
+from ratelimit import FORUM_HOST, configure_rate_limiter, get_rate_limiter, discord_route
+from pagepool import PageRecord, configure_page_pool, get_page_pool
+from posting import prepare_post_content, send_followups
+from outbox import Outbox, OutboxItem, OutboxPoster
+from tagresolver import TagResolvers
+from sharding import local_shards, owns_channel, shard_ranges
+from metrics import INTERVAL_BUCKETS, PASS_BUCKETS, MetricsServer, get_metrics
+from scheduler import PollScheduler, ThreadKey
+from boardlisting import BoardWatcher
+from backfill import BackfillProgress, format_duration, prefetch_in_order
+
+if TYPE_CHECKING:
+    # The webhook client lives with the other bot modules under /src, and is only imported when webhooks are set
+    from webhook import WebhookPublisher
 
-class BHPage(BeautifulSoup):
-
-    def get_title(self):
-        scrolldown_header: Tag = self.find("div", attrs={"class": "c-menu__scrolldown"})
-        title = scrolldown_header.find("h1", attrs={"class": "title"}).text
-        return title
-
-    def get_post_list(soup: BeautifulSoup) -> List[Tag]:
-        sections: List[Tag] = soup.find_all("section", attrs={"class": "c-section"})
-        return [tag for tag in sections if "id" in tag.attrs and tag.attrs["id"].startswith("post")]
-    
-    def get_page_btn_row(self) -> Tag:
-        return self.find("p", attrs={"class": "BH-pagebtnA"})
-    
-    def get_page_btn_list(self) -> List[Tag]:
-        return self.get_page_btn_row().find_all("a")
 
 class BHThread:
 
@@ -46,7 +39,17 @@ class BHThread:
     snA: int
     last_floor: int
     title: str
-    first_page: BHPage
+    num_pages: int
+    caught_up: bool
+    backfill_progress: Optional[BackfillProgress]
+    page_cache: Optional[PageCache]
+    state_store: Optional[StateStore]
+    ledger: Optional[ArchiveLedger]
+    floor_index: Optional[FloorIndex]
+    outbox: Optional[Outbox]
+    publisher: Optional["WebhookPublisher"]
+    tag_resolvers: TagResolvers
+    bot: Optional[commands.Bot]
 
     @property
     def start_floor(self):
@@ -58,11 +61,39 @@ class BHThread:
     @property
     def start_page(self):
         """
-        The page number we should continue from
+        The page number we should continue from, the page that holds the start floor
+        if it is in the floor index, or an estimate from 20 floors per page
         """
+        if self.floor_index != None:
+            page = self.floor_index.page_of(self.bsn, self.snA, self.start_floor)
+            if page != None:
+                return page
         return (self.last_floor // 20) + 1
 
-    def __init__(self, channel: ForumChannel, bsn: int, snA: int, last_floor: int, gp_thresh: int, bp_thresh: int):
+    @property
+    def pages_behind(self):
+        """
+        Number of pages from the one we should continue from to the last one
+        """
+        return self.num_pages - self.start_page + 1
+
+    def __init__(
+        self,
+        channel: ForumChannel,
+        bsn: int,
+        snA: int,
+        last_floor: int,
+        gp_thresh: int,
+        bp_thresh: int,
+        page_cache: Optional[PageCache] = None,
+        state_store: Optional[StateStore] = None,
+        ledger: Optional[ArchiveLedger] = None,
+        outbox: Optional[Outbox] = None,
+        publisher: Optional["WebhookPublisher"] = None,
+        tag_resolvers: Optional[TagResolvers] = None,
+        floor_index: Optional[FloorIndex] = None,
+        bot: Optional[commands.Bot] = None,
+    ):
         self.channel = channel
         self.bsn = bsn
         self.snA = snA
@@ -70,6 +101,16 @@ class BHThread:
         self.title = "No Title"
         self.gp_thresh = gp_thresh
         self.bp_thresh = bp_thresh
+        self.page_cache = page_cache
+        self.state_store = state_store
+        self.ledger = ledger
+        self.floor_index = floor_index
+        self.outbox = outbox
+        self.publisher = publisher
+        self.tag_resolvers = tag_resolvers if tag_resolvers != None else TagResolvers()
+        self.bot = bot
+        self.caught_up = False
+        self.backfill_progress = None
     
     def page_url(self, page: int = 1):
         """
@@ -109,58 +150,225 @@ class BHThread:
         self.channel = channel
     
     def get_info(self) -> List[int]:
-        return [self.channel.id, self.bsn, self.snA, self.last_floor]
+        return [self.channel.id, self.bsn, self.snA, self.last_floor, self.gp_thresh, self.bp_thresh]
+
+    def save_progress(self):
+        """
+        Writes the last archived floor to the state store.
+        """
+        if self.state_store != None:
+            self.state_store.set_last_floor(self.channel.id, self.bsn, self.snA, self.last_floor)
     
+    def index_page(self, page: int, posts: List[PostRecord]):
+        """
+        Records the first and last floor of a parsed page in the floor index.
+        """
+        if self.floor_index != None and len(posts) > 0:
+            self.floor_index.record(self.bsn, self.snA, page, int(posts[0].floor), int(posts[-1].floor), len(posts))
+
     def get_page_range(self, pages_per_batch: int = 2) -> Tuple[int, int]:
-        page_start = self.start_page
+        # Deleted floors leave fewer pages than the estimate, new floors are then on the last page
+        page_start = max(1, min(self.start_page, self.num_pages))
         page_end = min(self.num_pages + 1, page_start + pages_per_batch)
         return (page_start, page_end)
 
-    def get_page_count(self):
-        page_count = self.first_page.get_page_btn_list()[-1].text
-        return int(page_count)
-
     async def fetch_thread_posts(self):
+        pages = await self.fetch_thread_pages()
+        await self.archive_pages(pages)
 
-        # Get webpage
-        response: requests.Response = get_webpage(self.page_url())
-        self.first_page = BHPage(response.text, features="lxml")
+    async def fetch_page(self, page: int) -> Tuple[Optional[str], CachedPage]:
+        """
+        Fetches a page of the thread, unless it has not changed since it was last archived.
+
+        ## Parameter(s)
+        page: `int`
+            The page number
 
-        # Get thread title
-        self.title = self.first_page.get_title()
+        ## Returns
+        `Tuple[Optional[str], CachedPage]`
+            The HTML of the page, or `None` if the page is unchanged, and its cache entry
+        """
+        cached = None
+        if self.page_cache != None:
+            cached = self.page_cache.get(self.bsn, self.snA, page)
+            if cached != None and cached.last_floor > self.last_floor:
+                # The progress was moved back, so the page has to be archived again
+                cached = None
+
+        metrics = get_metrics()
+        fetches = metrics.counter("bh_page_fetches_total", "Pages fetched from the forum, by result")
+        with metrics.histogram("bh_page_fetch_seconds", "Time spent fetching a page from the forum").time():
+            result = await get_fetcher().fetch(self.page_url(page), headers=cached.conditional_headers if cached != None else None)
+        if cached != None and result.status == 304:
+            fetches.inc(result="not_modified")
+            return None, cached
+        if not result.ok:
+            fetches.inc(result="error")
+        result.raise_for_status()
+
+        digest = fingerprint(result.text)
+        if cached != None and cached.digest == digest:
+            fetches.inc(result="unchanged")
+            return None, cached
+        fetches.inc(result="changed")
+        entry = CachedPage(self.bsn, self.snA, page, digest, result.headers.get("ETag"), result.headers.get("Last-Modified"))
+        return result.text, entry
+
+    def store_page(self, entry: CachedPage):
+        """
+        Marks a page as archived up to the current floor.
+        """
+        if self.page_cache != None:
+            entry.last_floor = self.last_floor
+            self.page_cache.put(entry)
 
-        # Get total number of pages
-        self.num_pages = self.get_page_count()
+    async def fetch_thread_pages(self) -> List[Tuple[str, List[PostRecord], CachedPage]]:
+        """
+        Fetches the pages of the thread that may contain new posts, without archiving them.
+        Pages that have not changed since they were archived are left out.
+
+        ## Returns
+        `List[Tuple[str, List[PostRecord], CachedPage]]`
+            The URL, the extracted posts and the cache entry of each page, in page order
+        """
+        page_pool = get_page_pool()
+
+        # Get webpage
+        first_html, first_entry = await self.fetch_page(1)
+        if first_html != None:
+            first_page: PageRecord = await page_pool.extract(
+                first_html,
+                self.page_url(),
+                ArchiverSettings.page_parser,
+                with_header=True,
+                with_posts=(self.start_page == 1),
+            )
+
+            self.index_page(1, first_page.posts)
+
+            # Get thread title
+            self.title = first_page.title
+
+            # Get total number of pages
+            self.num_pages = first_page.num_pages
+
+            first_entry.title = self.title
+            first_entry.num_pages = self.num_pages
+        else:
+            self.title = first_entry.title
+            self.num_pages = first_entry.num_pages
 
         # Get page range
         page_start: int
         page_end: int
         page_start, page_end = self.get_page_range()
+        # Whether this poll reaches the last page
+        self.caught_up = page_end > self.num_pages
+
+        if page_start == 1 and first_html != None and self.start_page != 1:
+            # The estimate pointed past the last page, so the posts of the first page are needed after all
+            first_page = await page_pool.extract(first_html, self.page_url(), ArchiverSettings.page_parser)
+            self.index_page(1, first_page.posts)
+
+        if page_start > 1 and first_html != None:
+            # Every floor of the first page was archived before
+            self.store_page(first_entry)
 
+        pages: List[Tuple[str, List[PostRecord], CachedPage]] = []
         for page_num in range(page_start, page_end):
             page_url = self.page_url(page=page_num)
 
             # Fetch the posts for the page
-            response: requests.Response = get_webpage(page_url)
-            bh_page = BHPage(response.text, features="lxml")
-            page_post_list: List[Tag] = bh_page.get_post_list()
+            if page_num == 1:
+                if first_html == None:
+                    continue
+                page_post_list = first_page.posts
+                entry = first_entry
+            else:
+                page = await self.fetch_page_posts(page_num)
+                if page == None:
+                    continue
+                page_url, page_post_list, entry = page
+
+            pages.append((page_url, page_post_list, entry))
+
+        if page_start > 1 and len(pages) > 0 and pages[0][0] == self.page_url(page=page_start):
+            first_posts = pages[0][1]
+            if len(first_posts) > 0 and int(first_posts[0].floor) > self.start_floor:
+                # Floors deleted since the page was indexed moved the start floor to an earlier page
+                page = await self.fetch_page_posts(page_start - 1)
+                if page != None:
+                    pages.insert(0, page)
+        return pages
+
+    async def fetch_page_posts(self, page: int) -> Optional[Tuple[str, List[PostRecord], CachedPage]]:
+        """
+        Fetches a page and extracts its posts.
+
+        ## Returns
+        `Optional[Tuple[str, List[PostRecord], CachedPage]]`
+            The URL, the extracted posts and the cache entry of the page, or `None` if it has not changed since it was archived
+        """
+        page_url = self.page_url(page=page)
+        html, entry = await self.fetch_page(page)
+        if html == None:
+            return None
+        page_record: PageRecord = await get_page_pool().extract(html, page_url, ArchiverSettings.page_parser)
+        self.index_page(page, page_record.posts)
+        return page_url, page_record.posts, entry
+
+    async def backfill(self, prefetch: int, report_interval: float = 60.0):
+        """
+        Archives every page from the one we should continue from to the last one known, with up to
+        `prefetch` pages fetched ahead of the page being posted. Posts are still archived in floor order.
 
+        ## Parameter(s)
+        prefetch: `int`
+            Pages fetched ahead of posting at most, which bounds the memory used
+        report_interval: `float`
+            Seconds between the progress reports
+        """
+        first_page, last_page = self.start_page, self.num_pages
+        progress = BackfillProgress(first_page, last_page, report_interval)
+        self.backfill_progress = progress
+        backfill_pages = get_metrics().counter("bh_backfill_pages_total", "Pages archived by backfills")
+        print("[BACKFILL] bsn={}&snA={}: catching up pages {} to {}".format(self.bsn, self.snA, first_page, last_page))
+        try:
+            page_num = first_page
+            async for page in prefetch_in_order(self.fetch_page_posts, first_page, last_page, prefetch):
+                if page != None:
+                    page_url, page_post_list, entry = page
+                    await self.archive_page(page_post_list, page_url)
+                    self.store_page(entry)
+                backfill_pages.inc()
+                progress.page_done(page_num)
+                page_num += 1
+                if progress.should_report():
+                    print("[BACKFILL] bsn={}&snA={}: {}".format(self.bsn, self.snA, progress))
+        finally:
+            self.backfill_progress = None
+
+    async def archive_pages(self, pages: List[Tuple[str, List[PostRecord], CachedPage]]):
+        for page_url, page_post_list, entry in pages:
             await self.archive_page(page_post_list, page_url)
+            self.store_page(entry)
     
-    def skip_floor(self, post: BahamutPost):
+    def skip_floor(self, post: PostRecord):
+        skipped = get_metrics().counter("bh_posts_skipped_total", "Posts left out by skip_floor, by reason")
         if int(post.floor) < self.start_floor:
+            skipped.inc(reason="archived")
             return True
         elif post.gp < self.gp_thresh:
+            skipped.inc(reason="gp")
             return True
         elif self.bp_thresh > 0 and post.bp >= self.bp_thresh:
+            skipped.inc(reason="bp")
             return True
         return False
 
-    async def archive_page(self, posts_raw: List[Tag], page_url: str):
-
-        for post_raw in posts_raw:
-            post = BahamutPost(post_raw, page_url)
+    async def archive_page(self, posts: List[PostRecord], page_url: str):
 
+        for post in posts:
             if self.skip_floor(post):
                 continue
 
@@ -168,90 +376,388 @@ class BHThread:
 
             # Update last floor 
             self.last_floor = int(post.floor)
-            sleep(5)
-
-    def prepare_thread_content(self, post: BahamutPost) -> dict:
-        post_content = post.content
-        post_info = post.info
-        full_content = post_info + post.SEPARATOR + post_content
-
-        if len(full_content) > 2000: # Longer posts are sent as text files
-            path = Path("temp/content.txt")
-            with path.open("w", encoding="utf8") as fp:
-                fp.write(post_content)
-            content_kwargs = {
-                "content": post_info,
-                "file": File(path)
-            }
-        else:
-            content_kwargs = {
-                "content": full_content
-            }
-        
-        return content_kwargs
+            self.save_progress()
+
+    def prepare_thread_content(self, post: PostRecord) -> Tuple[dict, List[str]]:
+        return prepare_post_content(
+            post.info,
+            post.content,
+            post.SEPARATOR,
+            mode=ArchiverSettings.long_post_mode,
+            compress_threshold=ArchiverSettings.attachment_compress_threshold,
+        )
 
-    async def archive_post(self, post: BahamutPost):
+    async def archive_post(self, post: PostRecord):
+        """
+        Posts a post to the channel, or leaves it in the outbox for the poster workers.
+        """
         post.title = self.title
-        post_hashtags = post.hashtags
-        applied_tags = [tag for tag in self.channel.available_tags if tag.name in post_hashtags]
+        if self.outbox != None:
+            self.outbox.enqueue(self.channel.id, self.bsn, self.snA, post)
+            return
+        await self.send_post(post)
+
+    async def send_post(self, post: PostRecord):
+        if self.ledger != None and self.ledger.get(self.channel.id, self.bsn, self.snA, post.floor) != None:
+            print("[ARCHIVE] bsn={}&snA={} #{} was already archived, skipped".format(self.bsn, self.snA, post.floor))
+            return
 
         thread_kwargs = {
             "name": f"{post.title} {post.floor}樓",
-            "applied_tags": applied_tags[:5],
+            "applied_tags": self.tag_resolvers.resolve(self.channel, post.hashtags),
         }
-        content_kwargs = self.prepare_thread_content(post)
+        content_kwargs, followups = self.prepare_thread_content(post)
+
+        limiter = get_rate_limiter()
+        metrics = get_metrics()
+        calls = metrics.histogram("bh_discord_call_seconds", "Time spent in Discord calls, by call")
+        if self.publisher != None:
+            with calls.time(call="webhook_publish"):
+                thread_id = await self.publish_post(post, thread_kwargs, content_kwargs, followups)
+            # The bot archives the thread, since webhooks cannot edit channels
+            thread = self.channel.get_thread(thread_id)
+        else:
+            await limiter.wait(discord_route("POST", "/channels/{}/threads".format(self.channel.id)))
+            with calls.time(call="create_thread"):
+                thread, _ = await self.channel.create_thread(
+                    **thread_kwargs,
+                    **content_kwargs
+                )
+            if self.ledger != None:
+                self.ledger.record(self.channel.id, self.bsn, self.snA, post.floor, thread.id)
+            await send_followups(thread, followups)
+            thread_id = thread.id
+        await limiter.wait(discord_route("PATCH", "/channels/{}".format(thread_id)))
+        with calls.time(call="edit"):
+            if thread != None:
+                await thread.edit(archived=True)
+            elif self.bot != None:
+                # Not in the cache yet, archived by its ID instead of fetching it first
+                await self.bot.http.edit_channel(thread_id, archived=True)
+            else:
+                thread = await self.channel.guild.fetch_channel(thread_id)
+                await thread.edit(archived=True)
+        metrics.counter("bh_posts_archived_total", "Posts posted to Discord").inc()
+
+    async def publish_post(self, post: PostRecord, thread_kwargs: dict, content_kwargs: dict, followups: List[str]) -> int:
+        """
+        Creates the thread of a post through the webhooks of the channel.
 
-        thread, _ = await self.channel.create_thread(
-            **thread_kwargs,
-            **content_kwargs
+        ## Returns
+        `int`
+            The ID of the thread
+        """
+        thread_id = await self.publisher.publish(
+            thread_kwargs["name"],
+            content_kwargs["content"],
+            applied_tags=[tag.id for tag in thread_kwargs["applied_tags"]],
+            files=[content_kwargs["file"]] if "file" in content_kwargs else None,
         )
-        await thread.edit(archived=True)
+        if self.ledger != None:
+            self.ledger.record(self.channel.id, self.bsn, self.snA, post.floor, thread_id)
+        await self.publisher.send_followups(thread_id, followups)
+        return thread_id
 
 class BHThreadArchiver(commands.Cog):
     BH_THREAD_TEMPLATE = "https://forum.gamer.com.tw/C.php?bsn={board}&snA={thread}"
     
-    def __init__(self, bot: commands.Bot, config_file: Union[Path, str]) -> None:
+    def __init__(
+        self,
+        bot: commands.Bot,
+        config_file: Union[Path, str],
+        page_cache_file: Union[Path, str] = ":memory:",
+        state_file: Union[Path, str] = ":memory:",
+    ) -> None:
         self.bot: commands.Bot = bot
         self.threads: List[BHThread] = []
         self.config_file = Path(config_file)
+        self.page_cache = PageCache(page_cache_file)
+        self.state_store = StateStore(state_file)
+        self.ledger = ArchiveLedger(state_file)
+        self.floor_index = FloorIndex(state_file)
+        self.outbox = Outbox(state_file)
+        self.poster: Optional[OutboxPoster] = None
+        self.publishers = self.build_publishers()
+        self.tag_resolvers = TagResolvers(ArchiverSettings.tag_aliases)
+        self.tag_resolvers.attach(bot)
+        self.scheduler: Optional[PollScheduler[BHThread]] = None
+        if ArchiverSettings.poll_mode == "adaptive":
+            self.scheduler = PollScheduler(
+                min_interval=ArchiverSettings.poll_min_interval,
+                max_interval=ArchiverSettings.poll_max_interval,
+                initial_interval=ArchiverSettings.poll_initial_interval,
+                max_polls_per_minute=ArchiverSettings.max_polls_per_minute,
+            )
+            # The loop only checks for due threads, every thread keeps its own interval
+            self.fetch_posts.change_interval(seconds=ArchiverSettings.poll_tick)
+        self.backfills: Dict[ThreadKey, asyncio.Task] = {}
+        self.backfill_semaphore = asyncio.Semaphore(max(1, ArchiverSettings.max_backfills))
+        self.board_watcher: Optional[BoardWatcher] = None
+        if ArchiverSettings.board_listing:
+            self.board_watcher = BoardWatcher(ArchiverSettings.board_listing_pages, ArchiverSettings.board_listing_max_age)
+        self.metrics_server: Optional[MetricsServer] = None
+        if ArchiverSettings.metrics_port > 0:
+            self.metrics_server = MetricsServer(get_metrics(), ArchiverSettings.metrics_host, self.metrics_port())
+        if ArchiverSettings.outbox_workers > 0:
+            self.poster = OutboxPoster(
+                self.outbox,
+                self.send_outbox_item,
+                workers=ArchiverSettings.outbox_workers,
+                retry_base=ArchiverSettings.outbox_retry_base,
+                retry_max=ArchiverSettings.outbox_retry_max,
+                max_attempts=ArchiverSettings.outbox_max_attempts,
+            )
+
+    def build_publishers(self) -> Dict[int, "WebhookPublisher"]:
+        """
+        Creates a webhook publisher for every channel with webhooks in `ArchiverSettings.webhooks`.
+        """
+        if len(ArchiverSettings.webhooks) == 0:
+            return {}
+
+        # The webhook client lives with the other bot modules under /src
+        from webhook import Webhook, WebhookPublisher, get_webhook_client
+        return {
+            channel_id: WebhookPublisher([Webhook.from_url(url) for url in urls], get_webhook_client())
+            for channel_id, urls in ArchiverSettings.webhooks.items()
+            if len(urls) > 0
+        }
+
+    def metrics_port(self) -> int:
+        '''
+        Shard processes serve their metrics on `metrics_port` plus their first shard ID, so their ports do not collide.
+        '''
+        shards = local_shards(self.bot)
+        if shards == None or ArchiverSettings.shard_processes <= 1:
+            return ArchiverSettings.metrics_port
+        return ArchiverSettings.metrics_port + min(shards)
 
     def load_config(self):
+        # Threads being backfilled keep their object, which holds the floor the backfill is at
+        backfilling = {self.thread_key(bh_thread): bh_thread for bh_thread in self.threads if self.thread_key(bh_thread) in self.backfills}
         # Clear previous data
         self.threads.clear()
 
-        # Load from config file
-        with self.config_file.open(encoding="utf8") as fp:
-            config: DataFrame = pd.read_csv(fp, index_col=None, dtype=defaultdict(lambda: "Int64"))
-            self.columns = config.columns
-            for _, row in config.iterrows():
-                channel = self.bot.get_channel(row["channel_id"])
-                self.threads.append(BHThread(
-                    channel,
-                    row["bsn"],
-                    row["snA"], 
-                    row["last_floor"],
-                    row["gp_thresh"],
-                    row["bp_thresh"],
-                ))
-        
+        # The config file is only imported the first time, the state store keeps the progress afterwards
+        self.state_store.import_csv(self.config_file)
+        num_skipped = 0
+        for channel_id, bsn, snA, last_floor, gp_thresh, bp_thresh in self.state_store.load_threads():
+            channel = self.bot.get_channel(channel_id)
+            if not owns_channel(self.bot, channel):
+                # Polled by the process serving the channel's shard
+                num_skipped += 1
+                continue
+            bh_thread = backfilling.pop((channel_id, bsn, snA), None)
+            if bh_thread != None:
+                bh_thread.gp_thresh = gp_thresh
+                bh_thread.bp_thresh = bp_thresh
+                self.threads.append(bh_thread)
+                continue
+            self.threads.append(BHThread(
+                channel,
+                bsn,
+                snA,
+                last_floor,
+                gp_thresh,
+                bp_thresh,
+                self.page_cache,
+                self.state_store,
+                self.ledger,
+                self.outbox if self.poster != None else None,
+                self.publishers.get(channel_id),
+                self.tag_resolvers,
+                self.floor_index,
+                self.bot,
+            ))
+        for key in backfilling:
+            # No longer tracked here
+            self.backfills[key].cancel()
+
+        shards = local_shards(self.bot)
+        if self.poster != None:
+            self.poster.channels = None if shards == None else {bh_thread.channel.id for bh_thread in self.threads}
+        if shards != None:
+            print("[CONFIG] Shards {}: {} threads, {} left to other shards or unknown channels".format(sorted(shards), len(self.threads), num_skipped))
+        elif num_skipped > 0:
+            print("[CONFIG] {} threads skipped, their channels were not found".format(num_skipped))
+        self.schedule_threads()
         print("[CONFIG] Config Loaded.")
 
+    @staticmethod
+    def thread_key(bh_thread: BHThread) -> ThreadKey:
+        return (bh_thread.channel.id, bh_thread.bsn, bh_thread.snA)
+
+    def schedule_threads(self):
+        """
+        Adds the loaded threads to the scheduler, keeping the intervals of the threads it already had.
+        """
+        if self.scheduler == None:
+            return
+        keys = set()
+        for bh_thread in self.threads:
+            key = self.thread_key(bh_thread)
+            keys.add(key)
+            self.scheduler.add(key, bh_thread)
+        self.scheduler.keep(keys)
+
     def save_config(self):
-        # columns = ["channel_id", "bsn", "snA", "last_floor"]
-        config = DataFrame([bh_thread.get_info() for bh_thread in self.threads], columns=self.columns)
-        with self.config_file.open("w", encoding="utf8") as fp:
-            config.to_csv(fp, index=False, lineterminator="\n")
+        self.state_store.save_threads([bh_thread.get_info() for bh_thread in self.threads])
         print("[CONFIG] Config Saved.")
 
-    def cog_unload(self):
+    @commands.Cog.listener()
+    async def on_ready(self):
+        # The cog is loaded through its own asyncio.run before bot.run starts the bot's loop,
+        # so the server is started here to live in the loop that keeps running
+        if self.metrics_server != None:
+            await self.metrics_server.start()
+
+    async def cog_unload(self):
         self.fetch_posts.cancel()
+        self.cancel_backfills()
+        if self.metrics_server != None:
+            await self.metrics_server.stop()
+        if self.poster != None:
+            await self.poster.stop()
+        for publisher in self.publishers.values():
+            await publisher.close()
+        await close_fetcher()
+        get_page_pool().shutdown()
+
+    async def send_outbox_item(self, item: OutboxItem):
+        """
+        Posts an item of the outbox to its channel.
+        """
+        channel = self.bot.get_channel(item.channel_id)
+        if channel == None:
+            channel = await self.bot.fetch_channel(item.channel_id)
+        bh_thread = BHThread(channel, item.bsn, item.snA, item.floor - 1, 0, 0, ledger=self.ledger, publisher=self.publishers.get(item.channel_id), tag_resolvers=self.tag_resolvers, bot=self.bot)
+        await bh_thread.send_post(item.post)
+
+    async def poll_thread(self, bh_thread: BHThread, semaphore: asyncio.Semaphore, previous: Optional[asyncio.Task]):
+        """
+        Fetches a thread while holding the semaphore, then archives its posts once the previous
+        thread of the same channel is done, so every channel receives its posts in config order.
+        """
+        async with semaphore:
+            pages = await bh_thread.fetch_thread_pages()
+        if previous != None:
+            await asyncio.wait([previous])
+        await bh_thread.archive_pages(pages)
+        if ArchiverSettings.backfill_threshold > 0 and bh_thread.pages_behind > ArchiverSettings.backfill_threshold:
+            self.start_backfill(bh_thread)
+
+    def start_backfill(self, bh_thread: BHThread):
+        """
+        Catches up a thread in the background. The thread is left out of the passes until it is done.
+        """
+        key = self.thread_key(bh_thread)
+        if key not in self.backfills:
+            self.backfills[key] = asyncio.create_task(self.run_backfill(bh_thread))
+
+    async def run_backfill(self, bh_thread: BHThread):
+        key = self.thread_key(bh_thread)
+        last_floor = bh_thread.last_floor
+        try:
+            async with self.backfill_semaphore:
+                await bh_thread.backfill(ArchiverSettings.backfill_prefetch, ArchiverSettings.backfill_report_interval)
+            print("[BACKFILL] bsn={}&snA={}: caught up to floor {}, back to polling".format(bh_thread.bsn, bh_thread.snA, bh_thread.last_floor))
+        except Exception as e:
+            print("[BACKFILL] bsn={}&snA={} stopped at floor {}: {!r}".format(bh_thread.bsn, bh_thread.snA, bh_thread.last_floor, e))
+        finally:
+            self.backfills.pop(key, None)
+            if self.scheduler != None:
+                self.scheduler.reschedule(key, bh_thread.last_floor - last_floor)
+
+    def cancel_backfills(self):
+        for task in list(self.backfills.values()):
+            task.cancel()
+
+    def due_threads(self) -> List[BHThread]:
+        """
+        The threads to poll in this pass: every thread, or the due ones in adaptive mode.
+        """
+        if self.scheduler == None:
+            return list(self.threads)
+        return [bh_thread for _, bh_thread in self.scheduler.pop_due()]
+
+    def reschedule_threads(self, threads: List[BHThread], last_floors: List[int], results: list):
+        if self.scheduler == None:
+            return
+        intervals = get_metrics().histogram("bh_poll_interval_seconds", "Interval set for the next poll of a thread", INTERVAL_BUCKETS)
+        for bh_thread, last_floor, result in zip(threads, last_floors, results):
+            interval = self.scheduler.reschedule(
+                self.thread_key(bh_thread),
+                bh_thread.last_floor - last_floor,
+                failed=isinstance(result, Exception),
+            )
+            if interval != None:
+                intervals.observe(interval)
+
+    async def moved_threads(self, threads: List[BHThread]) -> List[BHThread]:
+        """
+        Leaves out the threads that the board listings show without new replies. They count as quiet polls for the scheduler.
+        """
+        moved = await self.board_watcher.moved([self.thread_key(bh_thread) for bh_thread in threads])
+        num_unchanged = len(threads) - len(moved)
+        if num_unchanged > 0:
+            print("[BOARD] {} of {} threads have new replies".format(len(threads) - num_unchanged, len(threads)))
+        return [bh_thread for bh_thread in threads if self.thread_key(bh_thread) in moved]
 
     @tasks.loop(minutes=20)
     async def fetch_posts(self):
+        threads = self.due_threads()
+        last_floors = [bh_thread.last_floor for bh_thread in threads]
+        results: Dict[ThreadKey, object] = {}
+        try:
+            # Threads being backfilled are polled again once their backfill is done
+            await self.run_pass([bh_thread for bh_thread in threads if self.thread_key(bh_thread) not in self.backfills], results)
+        finally:
+            # Threads taken from the scheduler are only polled again once rescheduled, even if the pass failed.
+            # Those left out or not polled count as quiet polls.
+            self.reschedule_threads(threads, last_floors, [results.get(self.thread_key(bh_thread)) for bh_thread in threads])
+
+    async def run_pass(self, threads: List[BHThread], results: Dict[ThreadKey, object]):
+        """
+        Polls the threads and archives their new posts. The result of every polled thread is put in `results`.
+        """
+        if self.board_watcher != None and len(threads) > 0:
+            threads = await self.moved_threads(threads)
+        if self.scheduler != None and len(threads) == 0:
+            return
         print("[LOOP] Loop started")
-        for bh_thread in self.threads:
-            await bh_thread.fetch_thread_posts()
-        print("[LOOP] Loop completed successfully")
+        start_time = time.perf_counter()
+
+        semaphore = asyncio.Semaphore(ArchiverSettings.max_concurrent_threads)
+        last_task: Dict[int, asyncio.Task] = {}
+        polls: List[asyncio.Task] = []
+        for bh_thread in threads:
+            channel_id = bh_thread.channel.id
+            task = asyncio.create_task(self.poll_thread(bh_thread, semaphore, last_task.get(channel_id)))
+            last_task[channel_id] = task
+            polls.append(task)
+
+        results.update(zip(map(self.thread_key, threads), await asyncio.gather(*polls, return_exceptions=True)))
+        metrics = get_metrics()
+        thread_polls = metrics.counter("bh_thread_polls_total", "Thread polls, by result")
+        num_failed = 0
+        for bh_thread in threads:
+            result = results[self.thread_key(bh_thread)]
+            if isinstance(result, Exception):
+                num_failed += 1
+                thread_polls.inc(result="failed")
+                print("[LOOP] bsn={}&snA={} failed: {!r}".format(bh_thread.bsn, bh_thread.snA, result))
+            else:
+                thread_polls.inc(result="ok")
+                if self.board_watcher != None and bh_thread.caught_up:
+                    self.board_watcher.confirm(self.thread_key(bh_thread))
+
+        duration = time.perf_counter() - start_time
+        metrics.histogram("bh_loop_pass_seconds", "Time a pass over every tracked thread took", PASS_BUCKETS).observe(duration)
+        print("[LOOP] Loop completed in {:.1f}s ({} threads, {} failed)".format(duration, len(threads), num_failed))
+        if self.poster != None:
+            print("[OUTBOX] {}".format(self.poster.stats()))
+        if self.scheduler == None and duration > self.fetch_posts.minutes * 60:
+            print("[LOOP] The pass took longer than the loop interval, consider raising max_concurrent_threads")
     
     @fetch_posts.after_loop
     async def fetch_posts_stopped(self):
@@ -263,16 +769,22 @@ class BHThreadArchiver(commands.Cog):
     async def start(self, ctx: Context):
         self.load_config()
         self.fetch_posts.start()
+        if self.poster != None:
+            self.poster.start()
         await ctx.send("已開始獲取討論串貼文。")
 
     @commands.command()
     async def pause(self, ctx: Context):
         self.fetch_posts.stop()
+        self.cancel_backfills()
         await ctx.send("已下令暫停獲取討論串貼文，機器人將在本輪作業結束後停止。")
 
     @commands.command()
     async def stop(self, ctx: Context):
         self.fetch_posts.cancel()
+        self.cancel_backfills()
+        if self.poster != None:
+            await self.poster.stop()
         await ctx.send("已強制停止。")
 
     @commands.command()
@@ -280,12 +792,56 @@ class BHThreadArchiver(commands.Cog):
         self.load_config()
         await ctx.send("已重新讀取目標討論串清單")
 
+    @commands.command(name="import-config")
+    async def import_config(self, ctx: Context):
+        num_rows = self.state_store.import_csv(self.config_file, force=True)
+        self.load_config()
+        await ctx.send("已從設定檔匯入{}個討論串".format(num_rows))
+
+    @commands.command(name="outbox")
+    async def outbox_status(self, ctx: Context):
+        if self.poster == None:
+            await ctx.send("未啟用發文佇列，貼文會直接發送。")
+            return
+        stats = self.poster.stats()
+        await ctx.send("發文佇列：待發送{}則，失敗{}則，發送中{}則，每分鐘發送{:.1f}則，最舊的已等待{:.0f}秒".format(
+            stats.depth, stats.failed, stats.in_flight, stats.drained_per_minute, stats.oldest_age
+        ))
+
+    @commands.command(name="outbox-retry")
+    async def outbox_retry(self, ctx: Context):
+        num_items = self.outbox.requeue_failed()
+        await ctx.send("已將{}則失敗的貼文放回發文佇列".format(num_items))
+
+    @commands.command(name="stats")
+    @commands.is_owner()
+    async def stats(self, ctx: Context):
+        metrics = get_metrics()
+        lines = ["運行時間：{:.0f}秒".format(time.time() - metrics.started)] + metrics.summary()
+        if self.poster != None:
+            lines.append("outbox: {}".format(self.poster.stats()))
+        if self.scheduler != None and len(self.scheduler) > 0:
+            intervals = sorted(self.scheduler.intervals())
+            next_due = self.scheduler.next_due()
+            lines.append("scheduler: {} threads, median interval {:.0f}s, next poll in {}".format(
+                len(intervals), intervals[len(intervals) // 2], "-" if next_due == None else "{:.0f}s".format(next_due)
+            ))
+        # Stay under the message limit, one code block per message
+        message: List[str] = []
+        for line in lines:
+            if sum(len(l) + 1 for l in message) + len(line) > 1900:
+                await ctx.send("```\n{}\n```".format("\n".join(message)))
+                message = []
+            message.append(line)
+        await ctx.send("```\n{}\n```".format("\n".join(message)))
+
     @commands.command(name="archive-all")
     async def archive_all(self, ctx: Context, id: int):
         threads: List[Thread] = ctx.guild.get_channel(id).threads
+        limiter = get_rate_limiter()
         for thread in threads:
+            await limiter.wait(discord_route("PATCH", "/channels/{}".format(thread.id)))
             await thread.edit(archived=True)
-            sleep(1)
         await ctx.send("已關閉所有DC討論串")
     
     @commands.command(name="list")
@@ -293,19 +849,64 @@ class BHThreadArchiver(commands.Cog):
         thread_list: List[str] = []
         for thr in self.threads:
             if thr.channel.guild == ctx.guild:
-                thread_list.append("{}: bsn={}&snA={} {}樓".format(thr.channel.name, thr.bsn, thr.snA, thr.last_floor))
+                line = "{}: bsn={}&snA={} {}樓".format(thr.channel.name, thr.bsn, thr.snA, thr.last_floor)
+                if thr.backfill_progress != None:
+                    progress = thr.backfill_progress
+                    eta = progress.eta
+                    line += "（補檔中：第{}/{}頁，預計剩餘{}）".format(progress.page, progress.last_page, "-" if eta == None else format_duration(eta))
+                thread_list.append(line)
         await ctx.send("\n".join(thread_list))
 
 async def setup(bot: commands.Bot) -> None:
     # await bot.add_cog(BHThreadArchiver(bot, "config/bhvtb_config.json"))
-    await bot.add_cog(BHThreadArchiver(bot, "config/config.csv"))
+    await bot.add_cog(BHThreadArchiver(bot, "config/config.csv", ArchiverSettings.page_cache_file, ArchiverSettings.state_file))
 
-def main():
+def run_bot(shard_ids: Optional[List[int]] = None):
+    '''
+    Runs the archiver bot, connecting the given shards or all of them.
+    '''
     # Setting up the bot
-    BotEssentials.setup_bot()
+    limiter = configure_rate_limiter(
+        default_limits={FORUM_HOST: (ArchiverSettings.forum_rate, ArchiverSettings.forum_burst)},
+    )
+    BotEssentials.setup_bot(
+        http_trace=limiter.trace_config(),
+        profile=ArchiverSettings.bot_profile,
+        sharded=ArchiverSettings.auto_shard,
+        shard_count=ArchiverSettings.shard_count,
+        shard_ids=shard_ids,
+    )
+    configure_fetcher(
+        max_connections=ArchiverSettings.max_connections,
+        max_connections_per_host=ArchiverSettings.max_connections_per_host,
+        timeout=ArchiverSettings.fetch_timeout,
+        connect_timeout=ArchiverSettings.connect_timeout,
+        rate_limiter=limiter,
+    )
+    configure_page_pool(ArchiverSettings.process_pool_workers)
+
+    # Imported here so the archiver can be driven by the benchmarks without credentials
+    from mycredentials import BOT_TOKEN
 
     asyncio.run(setup(BotEssentials.bot))
     BotEssentials.bot.run(BOT_TOKEN)
 
+def main():
+    if ArchiverSettings.shard_processes <= 1:
+        run_bot()
+        return
+
+    if ArchiverSettings.shard_count == None:
+        raise ValueError("shard_processes needs shard_count to be set")
+    processes: List[multiprocessing.Process] = []
+    for first, last in shard_ranges(ArchiverSettings.shard_count, ArchiverSettings.shard_processes):
+        shard_ids = list(range(first, last + 1))
+        process = multiprocessing.Process(target=run_bot, args=(shard_ids,), name="shards-{}-{}".format(first, last))
+        process.start()
+        print("[SHARD] Started shards {}-{} of {} in process {}".format(first, last, ArchiverSettings.shard_count, process.pid))
+        processes.append(process)
+    for process in processes:
+        process.join()
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
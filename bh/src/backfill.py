@@ -0,0 +1,103 @@
+'''
+Catching up a thread that is many pages behind, in place of a few pages per pass.
+
+The missing pages are fetched ahead of posting, at most a window of pages at a time, so memory stays
+bounded and the forum rate limiter paces the fetches. Pages are handed over in page order, so posting
+keeps the order of the floors.
+'''
+
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Deque, Optional, TypeVar
+import asyncio
+import time
+
+T = TypeVar("T")
+
+async def prefetch_in_order(fetch: Callable[[int], Awaitable[T]], first: int, last: int, window: int) -> AsyncIterator[T]:
+    '''
+    Fetches pages `first` to `last` with up to `window` of them fetched or waiting at a time, and yields them in order.
+    Pages still being fetched are cancelled when the iteration stops.
+
+    ## Parameters:
+    fetch: `Callable[[int], Awaitable[T]]`
+        Fetches a page by its number
+    first, last: `int`
+        The page range, both included
+    window: `int`
+        Pages fetched ahead of the one being used
+    '''
+    pending: Deque[asyncio.Task] = deque()
+    next_page = first
+    try:
+        while next_page <= last or len(pending) > 0:
+            while next_page <= last and len(pending) < max(1, window):
+                pending.append(asyncio.create_task(fetch(next_page)))
+                next_page += 1
+            yield await pending.popleft()
+    finally:
+        for task in pending:
+            task.cancel()
+
+def format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return "{}h{:02d}m".format(seconds // 3600, seconds % 3600 // 60)
+    return "{}m{:02d}s".format(seconds // 60, seconds % 60)
+
+class BackfillProgress:
+
+    def __init__(self, first_page: int, last_page: int, report_interval: float = 60.0):
+        '''
+        ## Parameters:
+        first_page, last_page: `int`
+            The pages to catch up, both included
+        report_interval: `float`
+            Seconds between two reports of `should_report`
+        '''
+        self.first_page = first_page
+        self.last_page = last_page
+        self.report_interval = report_interval
+        self.pages_done = 0
+        self.page = first_page - 1 # Last page posted
+        self.started = time.monotonic()
+        self.reported = self.started
+
+    @property
+    def total_pages(self) -> int:
+        return self.last_page - self.first_page + 1
+
+    @property
+    def pages_per_minute(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return self.pages_done * 60.0 / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> Optional[float]:
+        '''
+        Seconds left at the rate so far, or `None` before the first page is done.
+        '''
+        if self.pages_done == 0:
+            return None
+        remaining = self.last_page - self.page
+        return remaining * (time.monotonic() - self.started) / self.pages_done
+
+    def page_done(self, page: int):
+        self.page = page
+        self.pages_done += 1
+
+    def should_report(self) -> bool:
+        now = time.monotonic()
+        if now - self.reported < self.report_interval:
+            return False
+        self.reported = now
+        return True
+
+    def __str__(self) -> str:
+        eta = self.eta
+        return "page {}/{} ({:.0%}), {:.1f} pages/min, ETA {}".format(
+            self.page,
+            self.last_page,
+            (self.page - self.first_page + 1) / self.total_pages if self.total_pages > 0 else 1.0,
+            self.pages_per_minute,
+            "-" if eta == None else format_duration(eta),
+        )
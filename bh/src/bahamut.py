@@ -1,12 +1,15 @@
 
-from typing import List
+from typing import Dict, List, Optional, Tuple
 import requests
-from bs4 import BeautifulSoup, Tag
-from urllib.parse import unquote, urlparse
+from bs4 import BeautifulSoup, Tag, NavigableString, CData
+from urllib.parse import unquote, urlparse, parse_qs
 import re
 
+from fetcher import HEADERS, get_fetcher
+
 # Global variables
 URL_PREFIX = "https://forum.gamer.com.tw/"
+TEXT_TYPES = (NavigableString, CData)
 
 class PostMetadata:
 
@@ -33,19 +36,18 @@ class PostMetadata:
             bp = self.bp
         )
 
-class BahamutPost:
-    URL_PREFIX = "https://forum.gamer.com.tw/"
+class PostRecord:
+    '''
+    The extracted parts of a post, without the HTML it came from.
+    Records can be pickled, so they can be sent back from worker processes.
+    '''
     SEPARATOR = "\n--------------------------------------\n"
 
-    def __init__(self, post: Tag, original_link: str = ""):
-        self.post: Tag = post
-        self.original_link: str = original_link
-        self.metadata: PostMetadata = None
-        self.content: str = ""
-        self.hashtags: List[str] = []
+    def __init__(self, metadata: PostMetadata = None, content: str = "", hashtags: Optional[List[str]] = None):
+        self.metadata: PostMetadata = metadata
+        self.content: str = content
+        self.hashtags: List[str] = hashtags if hashtags != None else []
 
-        self.extract()
-    
     @property
     def title(self) -> str:
         try:
@@ -94,12 +96,99 @@ class BahamutPost:
     def info(self) -> str:
         return self.metadata.info
 
+    def to_dict(self) -> dict:
+        '''
+        The record as plain values, so it can be stored as JSON.
+        '''
+        return {
+            "metadata": vars(self.metadata) if self.metadata != None else None,
+            "content": self.content,
+            "hashtags": self.hashtags,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "PostRecord":
+        metadata = PostMetadata(**data["metadata"]) if data["metadata"] != None else None
+        return cls(metadata, data["content"], data["hashtags"])
+
+    @property
+    def thread_ids(self) -> Optional[Tuple[int, int]]:
+        '''
+        The board ID (bsn) and thread ID (snA), read from the link of the post, or `None` if the link has none.
+        '''
+        return parse_thread_ids(self.metadata.link)
+
+class BahamutPost(PostRecord):
+    URL_PREFIX = "https://forum.gamer.com.tw/"
+
+    def __init__(self, post: Tag, original_link: str = ""):
+        super().__init__()
+        self.post: Tag = post
+        self.original_link: str = original_link
+
+        self.extract()
+
+    def to_record(self) -> PostRecord:
+        return PostRecord(self.metadata, self.content, self.hashtags)
+
     def extract(self):
         
+        self.scan_post()
         self.extract_post_header()
         self.extract_post_body()
         self.extract_hashtags_from_text()
 
+    @staticmethod
+    def header_field(name: str, classes: List[str]) -> Optional[str]:
+        '''
+        Tells which header value an element holds, if any.
+        '''
+        if name == "a":
+            if "tippy-gpbp" in classes:
+                return "floor"
+            elif "username" in classes:
+                return "username"
+            elif "userid" in classes:
+                return "userid"
+            elif " ".join(classes) == "edittime tippy-post-info":
+                return "time"
+        elif name == "span":
+            if "postgp" in classes:
+                return "gp"
+            elif "postbp" in classes:
+                return "bp"
+        elif name == "h1" and "c-post__header__title" in classes:
+            return "title"
+        return None
+
+    def scan_post(self):
+        '''
+        Walks the post once in document order, and collects the header elements and the content block.
+        The content block is not entered here, it is rendered by `extract_post_body`.
+        '''
+        self.header_tags: Dict[str, Tag] = {}
+        self.body_tag: Optional[Tag] = None
+        header_found = False
+
+        stack: List[Tuple[Tag, bool]] = [(self.post, False)]
+        while stack:
+            tag, in_header = stack.pop()
+            classes = tag.get("class") or []
+
+            if tag.name == "div" and self.body_tag == None and "c-article__content" in classes:
+                self.body_tag = tag
+                continue
+            if tag.name == "div" and not header_found and "c-post__header" in classes:
+                header_found = True
+                in_header = True
+
+            field = self.header_field(tag.name, classes)
+            if field != None and field not in self.header_tags and (in_header or field == "title"):
+                self.header_tags[field] = tag
+
+            children = [child for child in tag.contents if isinstance(child, Tag)]
+            stack.extend((child, in_header) for child in reversed(children))
+
     def extract_post_header(self):
         '''
         Extracts the header from a post.
@@ -110,19 +199,21 @@ class BahamutPost:
         original_link: `str`
             The original link of the webpage
         '''
+        if not hasattr(self, "header_tags"):
+            self.scan_post()
+        header_tags = self.header_tags
 
-        post_header = self.post.find("div", attrs={"class": "c-post__header"})
         try:
-            post_title = self.post.find("h1", attrs={"class": "c-post__header__title"}).text
+            post_title = header_tags["title"].text
         except:
             post_title = "No Title"
-        post_floor = post_header.find("a", attrs={"class": "tippy-gpbp"}).attrs["data-floor"]
-        post_href = post_header.find("a", attrs={"class": "tippy-gpbp"}).attrs["href"]
-        post_time = post_header.find("a", attrs={"class": "edittime tippy-post-info"}).attrs["data-mtime"]
-        post_username = post_header.find("a", attrs={"class": "username"}).text
-        post_userid = post_header.find("a", attrs={"class": "userid"}).text
-        post_gp = post_header.find("span", attrs={"class": "postgp"}).span.text
-        post_bp = post_header.find("span", attrs={"class": "postbp"}).span.text
+        post_floor = header_tags["floor"].attrs["data-floor"]
+        post_href = header_tags["floor"].attrs["href"]
+        post_time = header_tags["time"].attrs["data-mtime"]
+        post_username = header_tags["username"].text
+        post_userid = header_tags["userid"].text
+        post_gp = header_tags["gp"].span.text
+        post_bp = header_tags["bp"].span.text
         # print("#{} by {}({})".format(post_floor, post_username, post_userid))
         
         if post_href != "":
@@ -147,67 +238,97 @@ class BahamutPost:
         Extracts the main content from a post, and convert it into a pure text format.
         All images, hyperlinks and embeds are replaced with a URL linking to the original content.
 
-        ## Parameters:
-        post: `Tag`
-            A single post, in HTML format
+        The post is rendered in a single walk without modifying it:
+        - Images become their URL and a newline
+        - YouTube and Twitch embeds become the URL of the video or channel
+        - Hyperlinks become `text (<URL>)`
+        - `br` becomes a newline
+        - The outermost `div`s are stripped and end with a newline
         '''
-        post_body = self.post.find("div", attrs={"class": "c-article__content"})
-
-        # Replace image Tag with image URL
-        for img in post_body.find_all("a", attrs={"class": "photoswipe-image"}):
-            img: Tag
-            img = img.replace_with(img.attrs["href"]+"\n")
-
-        # Replace YouTube embeds with origininal video URL
-        for yt in post_body.find_all("div", attrs={"class": "video-youtube"}):
-            yt: Tag
-            yt_id = yt.find("iframe").attrs["data-src"].split("/")[-1].split("?")[0]
-            yt_link = "https://www.youtube.com/watch?v={}".format(yt_id)
-            yt = yt.replace_with(yt_link)
-
-        # Replace Twitch embeds with origininal channel URL
-        for tw in post_body.find_all("div", attrs={"class": "video-twitchvod"}):
-            tw: Tag
-            tw_id = tw.find("iframe").attrs["data-src"].split("&")[0].split("=")[-1]
-            tw_link = f"https://www.twitch.tv/{tw_id}"
-            tw = tw.replace_with(tw_link)
-
-        # Replace hyperlink Tag with original URL
-        for link in post_body.find_all("a"):
-            link: Tag
-            real_link = unquote(link.attrs["href"]).split("?url=")[-1]
-            link = link.replace_with("{} (<{}>)".format(link.text, real_link))
-        # print(post_body)
-
-        # Replace br Tags with newlines
-        for br in post_body.find_all("br"):
-            br: Tag
-            br = br.replace_with("\n")
-
-        # Replace div Tags and add newlines
-        for div in post_body.find_all("div"):
-            div: Tag
-            div = div.replace_with(div.text.strip()+"\n")
-        # print(post_body)
-
-        self.content = post_body.text
+        if not hasattr(self, "body_tag"):
+            self.scan_post()
+
+        output: List[str] = []
+        self.render(self.body_tag, output, self.RENDER_BODY)
+        self.content = "".join(output)
+
+    RENDER_BODY = 0 # Directly under the content block
+    RENDER_DIV = 1 # Inside a div that is already being rendered
+    RENDER_LINK = 2 # Inside the text of a hyperlink
+
+    def render(self, tag: Tag, output: List[str], mode: int):
+        for node in tag.contents:
+            if not isinstance(node, Tag):
+                # Comments, scripts and styles are not part of the text
+                if type(node) in TEXT_TYPES:
+                    output.append(node)
+                continue
+
+            name = node.name
+            classes = node.get("class") or []
+            if name == "a" and "photoswipe-image" in classes:
+                output.append(node.attrs["href"] + "\n")
+            elif name == "div" and "video-youtube" in classes:
+                yt_id = node.find("iframe").attrs["data-src"].split("/")[-1].split("?")[0]
+                output.append("https://www.youtube.com/watch?v={}".format(yt_id))
+            elif name == "div" and "video-twitchvod" in classes:
+                tw_id = node.find("iframe").attrs["data-src"].split("&")[0].split("=")[-1]
+                output.append(f"https://www.twitch.tv/{tw_id}")
+            elif name == "a" and mode != self.RENDER_LINK:
+                link_text: List[str] = []
+                self.render(node, link_text, self.RENDER_LINK)
+                real_link = unquote(node.attrs["href"]).split("?url=")[-1]
+                output.append("{} (<{}>)".format("".join(link_text), real_link))
+            elif name == "br":
+                if mode != self.RENDER_LINK:
+                    output.append("\n")
+            elif name == "div" and mode == self.RENDER_BODY:
+                div_text: List[str] = []
+                self.render(node, div_text, self.RENDER_DIV)
+                output.append("".join(div_text).strip() + "\n")
+            else:
+                self.render(node, output, mode)
 
     def extract_hashtags_from_text(self):
         hashtags = re.findall("(#)(\w+)(\Z|\W)", self.content)
         # print(hashtags)
         self.hashtags = [tag[1] for tag in hashtags]
 
+def parse_thread_ids(url: str) -> Optional[Tuple[int, int]]:
+    '''
+    The board ID (bsn) and thread ID (snA) in the query of a thread URL, or `None` if it has none.
+    '''
+    query = parse_qs(urlparse(url).query)
+    try:
+        return int(query["bsn"][0]), int(query["snA"][0])
+    except (KeyError, ValueError):
+        return None
+
 def get_posts(soup: BeautifulSoup) -> List[Tag]:
     sections: List[Tag] = soup.find_all("section", attrs={"class": "c-section"})
     return [tag for tag in sections if "id" in tag.attrs and tag.attrs["id"].startswith("post")]
 
 def get_webpage(url: str) -> requests.Response:
-    headers = {"user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
-               "AppleWebKit/537.36 (KHTML, like Gecko)"
-               "Chrome/84.0.4147.105 Safari/537.36"}
-    response: requests.Response = requests.get(url, headers=headers)
+    '''
+    Blocking fetch, only meant for command line use. Use `fetch_webpage` inside the bot.
+    '''
+    response: requests.Response = requests.get(url, headers=HEADERS, timeout=30)
     return response
 
+async def fetch_webpage(url: str) -> str:
+    '''
+    Fetches a webpage through the shared connection pool without blocking the event loop.
+
+    ## Parameters:
+    url: `str`
+        The URL of the webpage
+
+    ## Returns
+    `str`
+        The HTML of the webpage
+    '''
+    return await get_fetcher().get_text(url)
+
 def main():
     test_link = input("Enter URL: ")
     print(urlparse(test_link))
@@ -1,10 +1,7 @@
 
 from pathlib import Path
-import requests
-from typing import Union, List, Tuple, Optional
+from typing import Dict, Union, List, Tuple, Optional
 from abc import ABC, abstractmethod
-from time import sleep
-from bs4 import Tag, BeautifulSoup
 
 import discord
 from discord.ext import commands
@@ -14,7 +11,14 @@ from discord.app_commands import CommandTree, ContextMenu, Command, Group, descr
 from discord.channel import ForumChannel
 
 from settings import SharedVariables
-from bahamut import BahamutPost, get_webpage, get_posts
+from bahamut import PostRecord, fetch_webpage, parse_thread_ids
+from fetcher import close_fetcher
+from pagepool import PageRecord, get_page_pool
+from statestore import ArchiveLedger
+from ratelimit import get_rate_limiter, discord_route
+from posting import prepare_post_content, send_followups
+from channelcache import get_channel_cache
+from tagresolver import TagResolvers
 
 class ChannelDropdown(discord.ui.Select):
 
@@ -40,10 +44,23 @@ class SelectMessage(discord.ui.View):
         self.add_item(self.confirm_button)
 
 class BahamutAchiver(commands.Cog):
+
+    # How posts longer than a message are sent: "attachment" or "messages"
+    long_post_mode: str = "attachment"
+
+    # Other hashtags that mean a forum tag, by tag name. Names are matched ignoring case and width.
+    tag_aliases: Dict[str, List[str]] = {}
     
-    def __init__(self, bot: commands.Bot) -> None:
+    def __init__(self, bot: commands.Bot, ledger_file: Union[Path, str] = "config/state.db") -> None:
         self.bot: commands.Bot = bot
         self.selected_channel: ForumChannel = None
+        self.ledger = ArchiveLedger(ledger_file)
+        self.tag_resolvers = TagResolvers(self.tag_aliases)
+        self.tag_resolvers.attach(bot)
+
+    async def cog_unload(self):
+        await close_fetcher()
+        get_page_pool().shutdown()
     
     
     @app_commands.command(name="bh-archive", description="Archive a post at bahamut as a DC forum post")
@@ -62,19 +79,16 @@ class BahamutAchiver(commands.Cog):
         
         # Ask user to select a channel if not selected before
         if self.selected_channel == None:
-            all_channels = await interaction.guild.fetch_channels()
-            forum_channels = [channel for channel in all_channels if type(channel) is ForumChannel]
+            forum_channels = await get_channel_cache().forum_channels(interaction.guild)
             self.selected_channel = await self.ask_select_channel(interaction, forum_channels)
 
-        response: requests.Response = get_webpage(post_url)
-        soup = BeautifulSoup(response.text, features="lxml")
-        pages_btn_row = soup.find("p", attrs={"class": "BH-pagebtnA"})
-        posts: List[Tag] = get_posts(soup)
+        html = await fetch_webpage(post_url)
+        page: PageRecord = await get_page_pool().extract(html, post_url, with_header=True)
+        posts: List[PostRecord] = page.posts
         
         match archive_range.value:
             case 1: # Main Post
-                post = BahamutPost(posts[0], post_url)
-                thread: Thread = await self.archive_post(post)
+                thread: Thread = await self.archive_post(posts[0], page_url=post_url)
                 
                 # Send final message
                 await interaction.followup.send(
@@ -90,7 +104,7 @@ class BahamutAchiver(commands.Cog):
                     content="Threads created at {}:\n{}".format(self.selected_channel.name, thread_urls),
                     ephemeral=False
                 )
-            case 3 if pages_btn_row == None:
+            case 3 if page.num_pages == 1:
                 created_threads = await self.archive_page(posts, post_url)
                 thread_urls = "\n".join([thr.jump_url for thr in created_threads])
 
@@ -100,7 +114,7 @@ class BahamutAchiver(commands.Cog):
                     ephemeral=False
                 )
             case 3: # Whole Thread
-                num_pages = int(pages_btn_row.find_all("a")[-1].text)
+                num_pages = page.num_pages
                 print(num_pages)
                 user = interaction.user
                 channel = interaction.channel
@@ -109,9 +123,8 @@ class BahamutAchiver(commands.Cog):
                     print(f"Page url: {page_url}")
 
                     # Fetch the posts for the page
-                    response: requests.Response = get_webpage(page_url)
-                    soup = BeautifulSoup(response.text, features="lxml")
-                    page_posts: List[Tag] = get_posts(soup)
+                    html = await fetch_webpage(page_url)
+                    page_posts: List[PostRecord] = (await get_page_pool().extract(html, page_url)).posts
 
                     created_threads = await self.archive_page(page_posts, page_url)
                     thread_urls = "\n".join([thr.jump_url for thr in created_threads])
@@ -120,55 +133,74 @@ class BahamutAchiver(commands.Cog):
                     await channel.send(
                         content="[Page{}] {}, Threads are created at {}:\n{}".format(i, user.mention, self.selected_channel.name, thread_urls),
                     )
-                    sleep(10)
             case _:
                 # Send message
                 await interaction.followup.send(
                     content="Option {} not supported yet".format(archive_range.name), ephemeral=True
                 )
 
-    async def archive_page(self, posts_raw: List[Tag], page_url: str) -> List[Thread]:
+    async def archive_page(self, posts: List[PostRecord], page_url: str) -> List[Thread]:
         created_threads: List[Thread] = []
-        thread_title = BahamutPost(posts_raw[0]).title
-        for post_raw in posts_raw:
-            post = BahamutPost(post_raw, page_url)
-            thread: Thread = await self.archive_post(post, thread_title=thread_title)
+        thread_title = posts[0].title
+        for post in posts:
+            thread: Thread = await self.archive_post(post, thread_title=thread_title, page_url=page_url)
             created_threads.append(thread)
-            sleep(2)
         
         return created_threads
     
-    async def archive_post(self, post: BahamutPost, thread_title: str="") -> Thread:
+    async def find_archived_thread(self, post: PostRecord, thread_ids: Tuple[int, int]) -> Optional[Thread]:
+        '''
+        Looks up the thread a post was already archived as in the selected channel.
+        '''
+        bsn, snA = thread_ids
+        thread_id = self.ledger.get(self.selected_channel.id, bsn, snA, post.floor)
+        if thread_id == None:
+            return None
+        thread = self.selected_channel.get_thread(thread_id)
+        if thread != None:
+            return thread
+        try:
+            return await self.bot.fetch_channel(thread_id)
+        except discord.NotFound:
+            # The thread was deleted, so the post can be archived again
+            self.ledger.forget(self.selected_channel.id, bsn, snA, post.floor)
+            return None
+
+    async def archive_post(self, post: PostRecord, thread_title: str="", page_url: str="") -> Thread:
+        # The ledger is keyed by the thread of the page the command was given, or else of the post's own link
+        thread_ids = parse_thread_ids(page_url) or post.thread_ids
+        if thread_ids == None:
+            print("[LOG] #{} has no bsn and snA in {!r}, archived without checking earlier archives".format(post.floor, page_url or post.metadata.link))
+        else:
+            archived_thread = await self.find_archived_thread(post, thread_ids)
+            if archived_thread != None:
+                print("[LOG] #{} was already archived at {}".format(post.floor, archived_thread.jump_url))
+                return archived_thread
+
         if post.title == "No Title":
             post.title = thread_title
-        post_content = post.export(include_header=True)
-        post_hashtags = post.hashtags
-        applied_tags = [tag for tag in self.selected_channel.available_tags if tag.name in post_hashtags]
-
-        if len(post_content) > 2000: # Longer posts Are sent as text files
-            with Path("content.txt").open("w") as fp:
-                fp.write(post_content)
-            with Path("content.txt")as path:
-                # Create the thread
-                thread, _ = await self.selected_channel.create_thread(
-                    name=f"{post.title} \#{post.floor}",
-                    file=discord.File(path),
-                    applied_tags=applied_tags
-                )
-                return thread
-        else:
-            # Create the thread
-            thread, _ = await self.selected_channel.create_thread(
-                name=f"{post.title} \#{post.floor}",
-                content=post_content,
-                applied_tags=applied_tags
-            )
-            return thread
+        content_kwargs, followups = prepare_post_content(
+            post.info, post.content, post.SEPARATOR, mode=self.long_post_mode, header_in_file=True
+        )
+        applied_tags = self.tag_resolvers.resolve(self.selected_channel, post.hashtags)
+        await get_rate_limiter().wait(discord_route("POST", "/channels/{}/threads".format(self.selected_channel.id)))
+
+        # Create the thread
+        thread, _ = await self.selected_channel.create_thread(
+            name=f"{post.title} \#{post.floor}",
+            applied_tags=applied_tags,
+            **content_kwargs
+        )
+
+        if thread_ids != None:
+            bsn, snA = thread_ids
+            self.ledger.record(self.selected_channel.id, bsn, snA, post.floor, thread.id)
+        await send_followups(thread, followups)
+        return thread
 
     @app_commands.command(name="bh-set-channel", description="Set default channel to send the archive to")
     async def bh_select_channel(self, interaction: Interaction):
-        all_channels = await interaction.guild.fetch_channels()
-        forum_channels = [channel for channel in all_channels if type(channel) is ForumChannel]
+        forum_channels = await get_channel_cache().forum_channels(interaction.guild)
         self.selected_channel = await self.ask_select_channel(interaction, forum_channels)
         await interaction.followup.send(
             content="Forum channel set to: {}".format(self.selected_channel.name),
@@ -206,4 +238,5 @@ class BahamutAchiver(commands.Cog):
 
 
 async def setup(bot: commands.Bot) -> None:
+  get_channel_cache().attach(bot)
   await bot.add_cog(BahamutAchiver(bot))
\ No newline at end of file
@@ -0,0 +1,251 @@
+'''
+Finds the tracked threads that got new replies from the board listing (B.php), so only those are polled.
+
+The listing shows the threads of a board by their last reply, newest first, with the reply count and the
+time of the last reply. One listing page per board replaces fetching page 1 of every tracked thread:
+- A listed thread moved if its reply count or last reply time changed since it was last caught up.
+- A thread not on the fetched pages has not moved, if the oldest listed reply is older than the time it was
+  last caught up: every thread with a newer reply would be listed above it.
+Everything else, including every thread never caught up before, is polled as usual.
+'''
+
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, urlparse
+import asyncio
+import re
+import time
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+from fetcher import get_fetcher
+from metrics import get_metrics
+from scheduler import ThreadKey
+
+BOARD_TEMPLATE = "https://forum.gamer.com.tw/B.php?bsn={board}&page={page}"
+FORUM_TZ = timezone(timedelta(hours=8))
+# Listing rows carry several classes, which a strainer does not match by one of them
+LISTING_STRAINER = SoupStrainer("tr")
+
+TODAY = re.compile(r"^今日\s*(\d{1,2}):(\d{2})$")
+YESTERDAY = re.compile(r"^昨日\s*(\d{1,2}):(\d{2})$")
+MONTH_DAY = re.compile(r"^(\d{1,2})/(\d{1,2})\s+(\d{1,2}):(\d{2})$")
+FULL_DATE = re.compile(r"^(\d{4})[/-](\d{1,2})[/-](\d{1,2})(?:\s+(\d{1,2}):(\d{2})(?::\d{2})?)?$")
+
+def reply_time_bound(text: str, now: Optional[float] = None) -> Optional[float]:
+    '''
+    The latest time a reply shown as `text` in the listing can have been made.
+    The listing shows minutes at most, and only the date for old replies.
+
+    ## Parameters:
+    text: `str`
+        Such as "今日 12:34", "昨日 12:34", "06/15 12:34" or "2023/06/15"
+    now: `Optional[float]`
+        The time the listing was fetched. Defaults to now.
+
+    ## Returns
+    `Optional[float]`
+        A POSIX timestamp, or `None` if the text is not understood
+    '''
+    today = datetime.fromtimestamp(time.time() if now == None else now, FORUM_TZ)
+    text = text.strip()
+    for pattern, days in [(TODAY, 0), (YESTERDAY, -1)]:
+        match = pattern.match(text)
+        if match != None:
+            shown = today.replace(hour=int(match.group(1)), minute=int(match.group(2)), second=0, microsecond=0)
+            return (shown + timedelta(days=days, minutes=1)).timestamp()
+    try:
+        match = MONTH_DAY.match(text)
+        if match != None:
+            shown = datetime(today.year, int(match.group(1)), int(match.group(2)), int(match.group(3)), int(match.group(4)), tzinfo=FORUM_TZ)
+            if shown > today + timedelta(days=1):
+                # Shown without the year, from last year
+                shown = shown.replace(year=today.year - 1)
+            return (shown + timedelta(minutes=1)).timestamp()
+        match = FULL_DATE.match(text)
+        if match != None:
+            year, month, day = int(match.group(1)), int(match.group(2)), int(match.group(3))
+            if match.group(4) == None:
+                return (datetime(year, month, day, tzinfo=FORUM_TZ) + timedelta(days=1)).timestamp()
+            return (datetime(year, month, day, int(match.group(4)), int(match.group(5)), tzinfo=FORUM_TZ) + timedelta(minutes=1)).timestamp()
+    except ValueError:
+        # Not a valid date
+        pass
+    return None
+
+class ListingEntry:
+
+    def __init__(self, snA: int, replies: Optional[int], last_reply: str, last_reply_bound: Optional[float]):
+        self.snA = snA
+        self.replies = replies
+        self.last_reply = last_reply # As shown in the listing
+        self.last_reply_bound = last_reply_bound # Latest possible time of the last reply
+
+    @property
+    def marker(self) -> Tuple[Optional[int], str]:
+        '''
+        What changes when the thread gets a reply.
+        '''
+        return (self.replies, self.last_reply)
+
+def parse_int(text: Optional[str]) -> Optional[int]:
+    try:
+        return int(text.replace(",", "").strip())
+    except (AttributeError, ValueError):
+        return None
+
+def parse_listing(html: str, now: Optional[float] = None) -> List[ListingEntry]:
+    '''
+    Reads the threads of a listing page, in the order they are listed.
+    '''
+    soup = BeautifulSoup(html, features="lxml", parse_only=LISTING_STRAINER)
+    entries: List[ListingEntry] = []
+    for row in soup.find_all("tr", class_="b-list__row"):
+        link = row.find("a", href=re.compile(r"C\.php\?.*snA="))
+        if link == None:
+            continue
+        query = parse_qs(urlparse(link["href"]).query)
+        snA = parse_int(query["snA"][0])
+        if snA == None:
+            continue
+        # tnum is the number of posts, the count column is the number of interactions
+        replies = parse_int(query["tnum"][0]) if "tnum" in query else None
+        if replies == None:
+            count = row.select_one(".b-list__count__number span")
+            replies = parse_int(count.get_text()) if count != None else None
+        edittime = row.select_one(".b-list__time__edittime")
+        last_reply = edittime.get_text(strip=True) if edittime != None else ""
+        entries.append(ListingEntry(snA, replies, last_reply, reply_time_bound(last_reply, now)))
+    return entries
+
+class CaughtUp:
+
+    def __init__(self, checked: float, marker: Optional[Tuple[Optional[int], str]]):
+        self.checked = checked # Time of the listing the thread was polled after
+        self.marker = marker # The thread's listing entry then, if it was listed
+
+class BoardWatcher:
+
+    BOARD_TEMPLATE: str = BOARD_TEMPLATE
+
+    def __init__(self, max_pages: int = 3, max_age: float = 0.0):
+        '''
+        ## Parameters:
+        max_pages: `int`
+            Listing pages fetched per board at most. Pages are fetched until every tracked
+            thread of the board is listed or known not to have moved.
+        max_age: `float`
+            Seconds a listing is reused for before it is fetched again
+        '''
+        self.max_pages = max_pages
+        self.max_age = max_age
+        self.listings: Dict[int, Tuple[float, Dict[int, ListingEntry], Optional[float]]] = {}
+        self.caught_up: Dict[ThreadKey, CaughtUp] = {}
+        self.pending: Dict[ThreadKey, CaughtUp] = {}
+
+    def listing_url(self, bsn: int, page: int) -> str:
+        return self.BOARD_TEMPLATE.format(board=bsn, page=page)
+
+    async def fetch_listing(self, bsn: int, since: Optional[float]) -> Tuple[float, Dict[int, ListingEntry], Optional[float]]:
+        '''
+        Fetches listing pages of a board until the oldest listed reply is older than `since`.
+
+        ## Returns
+        `Tuple[float, Dict[int, ListingEntry], Optional[float]]`
+            The time the listing was fetched, the listed threads by snA, and the latest time the oldest
+            listed reply can have been made. Threads with newer replies are all listed.
+        '''
+        fetches = get_metrics().counter("bh_board_listing_fetches_total", "Board listing pages fetched, by result")
+        fetched = time.time()
+        entries: Dict[int, ListingEntry] = {}
+        oldest: Optional[float] = None
+        for page in range(1, self.max_pages + 1):
+            result = await get_fetcher().fetch(self.listing_url(bsn, page))
+            if not result.ok:
+                fetches.inc(result="error")
+            result.raise_for_status()
+            fetches.inc(result="ok")
+            page_entries = parse_listing(result.text, fetched)
+            for entry in page_entries:
+                entries.setdefault(entry.snA, entry)
+            # Sticky threads are listed first whatever their last reply, so the last row is the oldest
+            if len(page_entries) == 0 or page_entries[-1].last_reply_bound == None:
+                break
+            oldest = page_entries[-1].last_reply_bound
+            if since == None or oldest <= since:
+                break
+        return fetched, entries, oldest
+
+    def has_moved(self, key: ThreadKey, fetched: float, entries: Dict[int, ListingEntry], oldest: Optional[float]) -> bool:
+        '''
+        Whether a thread may have new replies since it was last caught up. Remembers its listing entry for `confirm` if so.
+        '''
+        entry = entries.get(key[2])
+        marker = entry.marker if entry != None else None
+        caught_up = self.caught_up.get(key)
+        if caught_up == None:
+            moved = True
+        elif entry != None and caught_up.marker != None:
+            moved = entry.marker != caught_up.marker
+        elif entry != None:
+            moved = entry.last_reply_bound == None or entry.last_reply_bound > caught_up.checked
+        else:
+            moved = oldest == None or oldest > caught_up.checked
+        if moved:
+            self.pending[key] = CaughtUp(fetched, marker)
+        else:
+            # Still caught up as of this listing
+            self.caught_up[key] = CaughtUp(max(fetched, caught_up.checked), marker if marker != None else caught_up.marker)
+        return moved
+
+    async def moved(self, keys: Iterable[ThreadKey]) -> Set[ThreadKey]:
+        '''
+        Fetches the listing of every board of the given threads once.
+
+        ## Returns
+        `Set[ThreadKey]`
+            The threads that may have new replies. Every thread of a board whose listing failed is included.
+        '''
+        keys = list(keys)
+        boards: Dict[int, List[ThreadKey]] = {}
+        for key in keys:
+            boards.setdefault(key[1], []).append(key)
+
+        async def refresh(bsn: int):
+            listing = self.listings.get(bsn)
+            if listing != None and time.time() - listing[0] < self.max_age:
+                return
+            # Far enough back to cover the earliest caught-up thread of the board that is not listed
+            checked = [self.caught_up[key].checked for key in boards[bsn] if key in self.caught_up]
+            self.listings[bsn] = await self.fetch_listing(bsn, min(checked) if len(checked) > 0 else None)
+
+        results = await asyncio.gather(*[refresh(bsn) for bsn in boards], return_exceptions=True)
+        listing_threads = get_metrics().counter("bh_board_listing_threads_total", "Tracked threads checked against the board listing, by result")
+        moved: Set[ThreadKey] = set()
+        for bsn, result in zip(boards, results):
+            if isinstance(result, Exception):
+                print("[BOARD] bsn={} listing failed: {!r}".format(bsn, result))
+                self.listings.pop(bsn, None)
+                moved.update(boards[bsn])
+                listing_threads.inc(len(boards[bsn]), result="failed")
+                continue
+            fetched, entries, oldest = self.listings[bsn]
+            for key in boards[bsn]:
+                if self.has_moved(key, fetched, entries, oldest):
+                    moved.add(key)
+                    listing_threads.inc(result="moved")
+                else:
+                    listing_threads.inc(result="unchanged")
+        return moved
+
+    def confirm(self, key: ThreadKey):
+        '''
+        Marks a thread as caught up with the listing it was polled after.
+        '''
+        pending = self.pending.pop(key, None)
+        if pending != None:
+            self.caught_up[key] = pending
+
+    def forget(self, key: ThreadKey):
+        self.caught_up.pop(key, None)
+        self.pending.pop(key, None)
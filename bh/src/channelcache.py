@@ -0,0 +1,125 @@
+'''
+An in-memory index of every guild's channels and forum tags.
+
+Commands used to call `guild.fetch_channels()`, a REST request, every time they looked up a channel.
+The index is built from the channels the gateway already keeps in `guild.channels`, and a guild's index
+is dropped whenever one of its channels is created, updated or deleted, so lookups are answered from
+memory and are never stale.
+'''
+
+from typing import Dict, List, Optional, Set
+
+from discord import ChannelType, ForumChannel, ForumTag, Guild
+from discord.abc import GuildChannel
+from discord.ext.commands import Bot
+
+class GuildIndex:
+
+    def __init__(self, channels: List[GuildChannel]):
+        '''
+        ## Parameters:
+        channels: `List[GuildChannel]`
+            Every channel of the guild
+        '''
+        channels = sorted(channels, key=lambda channel: (channel.position, channel.id))
+        self.by_id: Dict[int, GuildChannel] = {channel.id: channel for channel in channels}
+        self.by_name: Dict[str, List[GuildChannel]] = {}
+        for channel in channels:
+            self.by_name.setdefault(channel.name, []).append(channel)
+        self.forums: List[ForumChannel] = [channel for channel in channels if isinstance(channel, ForumChannel)]
+        self.tags: Dict[int, Dict[int, ForumTag]] = {
+            forum.id: {tag.id: tag for tag in forum.available_tags} for forum in self.forums
+        }
+
+    def find(self, name: str, type: Optional[ChannelType] = None) -> Optional[GuildChannel]:
+        '''
+        Finds the first channel with the name, and the type if given.
+        '''
+        for channel in self.by_name.get(name, []):
+            if type == None or channel.type == type:
+                return channel
+        return None
+
+    def available_tags(self, channel_id: int) -> List[ForumTag]:
+        '''
+        The tags of a forum channel, in the channel's order. Empty if the channel is not a forum.
+        '''
+        return list(self.tags.get(channel_id, {}).values())
+
+    def get_tag(self, channel_id: int, tag_id: int) -> Optional[ForumTag]:
+        return self.tags.get(channel_id, {}).get(tag_id)
+
+class ChannelCache:
+
+    def __init__(self):
+        self.guilds: Dict[int, GuildIndex] = {}
+        self.attached: Set[int] = set()
+        self.builds = 0 # Number of times an index was built, for checking the hit rate
+
+    def attach(self, bot: Bot):
+        '''
+        Keeps the cache up to date with the channel events of the bot. Attaching the same bot twice does nothing.
+        '''
+        if id(bot) in self.attached:
+            return
+        self.attached.add(id(bot))
+        bot.add_listener(self.on_guild_channel_create)
+        bot.add_listener(self.on_guild_channel_update)
+        bot.add_listener(self.on_guild_channel_delete)
+        bot.add_listener(self.on_guild_remove)
+
+    def invalidate(self, guild_id: int):
+        self.guilds.pop(guild_id, None)
+
+    async def get_index(self, guild: Guild) -> GuildIndex:
+        '''
+        Gets the index of a guild, building it from the gateway's channels if needed.
+        '''
+        index = self.guilds.get(guild.id)
+        if index == None:
+            channels = list(guild.channels)
+            if len(channels) == 0:
+                # The guild has not been received from the gateway yet
+                channels = await guild.fetch_channels()
+            index = GuildIndex(channels)
+            self.guilds[guild.id] = index
+            self.builds += 1
+        return index
+
+    async def find(self, guild: Guild, name: str, type: Optional[ChannelType] = None) -> Optional[GuildChannel]:
+        return (await self.get_index(guild)).find(name, type)
+
+    async def forum_channels(self, guild: Guild) -> List[ForumChannel]:
+        return (await self.get_index(guild)).forums
+
+    async def available_tags(self, guild: Guild, channel_id: int) -> List[ForumTag]:
+        return (await self.get_index(guild)).available_tags(channel_id)
+
+    async def get_tags(self, guild: Guild, channel_id: int, tag_ids: List[int]) -> List[ForumTag]:
+        '''
+        Resolves tag IDs of a forum channel, leaving out the ones it does not have.
+        '''
+        index = await self.get_index(guild)
+        tags = [index.get_tag(channel_id, tag_id) for tag_id in tag_ids]
+        return [tag for tag in tags if tag != None]
+
+    async def on_guild_channel_create(self, channel: GuildChannel):
+        self.invalidate(channel.guild.id)
+
+    async def on_guild_channel_update(self, before: GuildChannel, after: GuildChannel):
+        self.invalidate(after.guild.id)
+
+    async def on_guild_channel_delete(self, channel: GuildChannel):
+        self.invalidate(channel.guild.id)
+
+    async def on_guild_remove(self, guild: Guild):
+        self.invalidate(guild.id)
+
+# The cache shared by every cog in the process
+shared_cache: Optional[ChannelCache] = None
+
+def get_channel_cache() -> ChannelCache:
+    global shared_cache
+    if shared_cache == None:
+        shared_cache = ChannelCache()
+    return shared_cache
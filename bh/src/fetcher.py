@@ -0,0 +1,173 @@
+'''
+An asyncio based webpage fetcher shared by the archivers.
+
+All requests go through one `aiohttp.ClientSession`, so connections to the forum are kept alive
+and reused instead of being opened for every page.
+'''
+
+from typing import Dict, Mapping, Optional
+from urllib.parse import urlparse
+import asyncio
+
+import aiohttp
+from multidict import CIMultiDict
+
+from ratelimit import RateLimiter, get_rate_limiter
+
+try:
+    import brotli # aiohttp decodes "br" responses only if one of these is installed
+    HAS_BROTLI = True
+except ImportError:
+    try:
+        import brotlicffi
+        HAS_BROTLI = True
+    except ImportError:
+        HAS_BROTLI = False
+
+HEADERS = {"user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
+           "AppleWebKit/537.36 (KHTML, like Gecko)"
+           "Chrome/84.0.4147.105 Safari/537.36"}
+
+class FetchError(Exception):
+
+    def __init__(self, url: str, status: int):
+        super().__init__("{} returned status {}".format(url, status))
+        self.url = url
+        self.status = status
+
+class FetchResult:
+
+    def __init__(self, url: str, status: int, text: str, headers: Mapping[str, str]):
+        self.url = url
+        self.status = status
+        self.text = text
+        self.headers = headers
+
+    @property
+    def ok(self) -> bool:
+        return 200 <= self.status < 300
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise FetchError(self.url, self.status)
+
+class AsyncFetcher:
+
+    def __init__(
+        self,
+        max_connections: int = 20,
+        max_connections_per_host: int = 4,
+        timeout: float = 30.0,
+        connect_timeout: float = 10.0,
+        rate_limiter: Optional[RateLimiter] = None,
+    ):
+        '''
+        ## Parameters:
+        max_connections: `int`
+            Size of the shared connection pool
+        max_connections_per_host: `int`
+            Number of requests allowed to run at the same time against a single host
+        timeout: `float`
+            Total time in seconds a request may take, including reading the body
+        connect_timeout: `float`
+            Time in seconds allowed for establishing a connection
+        rate_limiter: `Optional[RateLimiter]`
+            Paces the requests sent to each host. No pacing if not given.
+        '''
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=connect_timeout)
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.host_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self.rate_limiter = rate_limiter
+
+    @property
+    def accept_encoding(self) -> str:
+        return "gzip, deflate, br" if HAS_BROTLI else "gzip, deflate"
+
+    async def open(self) -> aiohttp.ClientSession:
+        if self.session == None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                limit_per_host=self.max_connections_per_host,
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=self.timeout,
+                headers={**HEADERS, "accept-encoding": self.accept_encoding},
+            )
+        return self.session
+
+    async def close(self):
+        if self.session != None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+        self.host_semaphores.clear()
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def host_semaphore(self, host: str) -> asyncio.Semaphore:
+        if host not in self.host_semaphores:
+            self.host_semaphores[host] = asyncio.Semaphore(self.max_connections_per_host)
+        return self.host_semaphores[host]
+
+    async def fetch(self, url: str, headers: Optional[Dict[str, str]] = None) -> FetchResult:
+        '''
+        Fetches a webpage.
+
+        ## Parameters:
+        url: `str`
+            The URL of the webpage
+        headers: `Optional[Dict[str, str]]`
+            Extra request headers
+
+        ## Returns
+        `FetchResult`
+        '''
+        session = await self.open()
+        host = urlparse(url).netloc
+        async with self.host_semaphore(host):
+            if self.rate_limiter != None:
+                await self.rate_limiter.wait(host)
+            async with session.get(url, headers=headers) as response:
+                text = await response.text()
+                if self.rate_limiter != None:
+                    self.rate_limiter.update(host, response.status, response.headers)
+                # Header names are case-insensitive, servers send both ETag and Etag
+                return FetchResult(str(response.url), response.status, text, CIMultiDict(response.headers))
+
+    async def get_text(self, url: str) -> str:
+        result = await self.fetch(url)
+        if not result.ok:
+            print("[FETCH] {} returned status {}".format(url, result.status))
+        return result.text
+
+# The fetcher shared by every archiver in the process
+shared_fetcher: Optional[AsyncFetcher] = None
+
+def configure_fetcher(**kwargs) -> AsyncFetcher:
+    '''
+    Replaces the shared fetcher with one built from the given `AsyncFetcher` arguments.
+    Must be called before the first page is fetched.
+    '''
+    global shared_fetcher
+    shared_fetcher = AsyncFetcher(**kwargs)
+    return shared_fetcher
+
+def get_fetcher() -> AsyncFetcher:
+    global shared_fetcher
+    if shared_fetcher == None:
+        shared_fetcher = AsyncFetcher(rate_limiter=get_rate_limiter())
+    return shared_fetcher
+
+async def close_fetcher():
+    '''
+    Closes the connections of the shared fetcher. It reconnects on the next fetch.
+    '''
+    if shared_fetcher != None:
+        await shared_fetcher.close()
@@ -0,0 +1,223 @@
+'''
+Counters and latency histograms of the archiver.
+
+Metrics are kept in memory by a `Metrics` registry shared by the process. They can be read as a short
+summary (the `!stats` command) or in the Prometheus text format, served over HTTP by a `MetricsServer`.
+'''
+
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+import math
+import time
+
+from aiohttp import web
+
+# Upper bounds in seconds, from a fast cache hit to a slow Discord call
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Upper bounds in seconds of a pass over every tracked thread
+PASS_BUCKETS = (1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1200.0, 3600.0)
+# Upper bounds in seconds of the time between two polls of a thread
+INTERVAL_BUCKETS = (60.0, 120.0, 300.0, 600.0, 1200.0, 2400.0, 3600.0, 7200.0, 14400.0, 21600.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+def format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra != None else [])
+    if len(pairs) == 0:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"')) for name, value in pairs) + "}"
+
+def format_value(value: float) -> str:
+    if math.isinf(value):
+        # As the Prometheus text format writes it
+        return "+Inf" if value > 0 else "-Inf"
+    return str(int(value)) if value == int(value) else repr(value)
+
+class Counter:
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = tuple(sorted(labels.items()))
+        self.values[key] = self.values.get(key, 0.0) + amount
+
+    def get(self, **labels: str) -> float:
+        return self.values.get(tuple(sorted(labels.items())), 0.0)
+
+    def render(self) -> List[str]:
+        lines = ["# HELP {} {}".format(self.name, self.help), "# TYPE {} counter".format(self.name)]
+        for labels, value in sorted(self.values.items()):
+            lines.append("{}{} {}".format(self.name, format_labels(labels), format_value(value)))
+        return lines
+
+    def summary(self) -> List[str]:
+        return ["{}{}: {}".format(self.name, format_labels(labels), format_value(value)) for labels, value in sorted(self.values.items())]
+
+class HistogramSeries:
+
+    def __init__(self, buckets: Sequence[float]):
+        self.counts = [0] * (len(buckets) + 1) # The last one counts values above every bound
+        self.count = 0
+        self.sum = 0.0
+
+class Histogram:
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.series: Dict[Labels, HistogramSeries] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(sorted(labels.items()))
+        series = self.series.get(key)
+        if series == None:
+            series = HistogramSeries(self.buckets)
+            self.series[key] = series
+        series.counts[bisect_left(self.buckets, value)] += 1
+        series.count += 1
+        series.sum += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        '''
+        Observes the time spent in a `with` block, including blocks left by an exception.
+        '''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def quantile(self, series: HistogramSeries, q: float) -> float:
+        '''
+        Estimates a quantile from the buckets, as the upper bound of the bucket it falls in.
+        '''
+        rank = q * series.count
+        seen = 0
+        for bound, count in zip(self.buckets, series.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def render(self) -> List[str]:
+        lines = ["# HELP {} {}".format(self.name, self.help), "# TYPE {} histogram".format(self.name)]
+        for labels, series in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series.counts):
+                cumulative += count
+                lines.append("{}_bucket{} {}".format(self.name, format_labels(labels, ("le", format_value(bound))), cumulative))
+            lines.append("{}_bucket{} {}".format(self.name, format_labels(labels, ("le", "+Inf")), series.count))
+            lines.append("{}_sum{} {}".format(self.name, format_labels(labels), repr(series.sum)))
+            lines.append("{}_count{} {}".format(self.name, format_labels(labels), series.count))
+        return lines
+
+    def summary(self) -> List[str]:
+        def format_bound(bound: float) -> str:
+            # Past the top bucket the bound is +Inf, which takes no unit
+            return format_value(bound) if math.isinf(bound) else format_value(bound) + "s"
+
+        return [
+            "{}{}: n={} avg={:.3f}s p50<={} p95<={}".format(
+                self.name, format_labels(labels), series.count, series.sum / series.count,
+                format_bound(self.quantile(series, 0.5)), format_bound(self.quantile(series, 0.95)),
+            )
+            for labels, series in sorted(self.series.items())
+            if series.count > 0
+        ]
+
+class Metrics:
+    '''
+    Every metric of the process, by name.
+    '''
+
+    def __init__(self):
+        self.counters: Dict[str, Counter] = {}
+        self.histograms: Dict[str, Histogram] = {}
+        self.started = time.time()
+
+    def counter(self, name: str, help: str = "") -> Counter:
+        '''
+        Gets a counter, creating it the first time.
+        '''
+        counter = self.counters.get(name)
+        if counter == None:
+            counter = Counter(name, help)
+            self.counters[name] = counter
+        return counter
+
+    def histogram(self, name: str, help: str = "", buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        '''
+        Gets a histogram, creating it with the buckets the first time.
+        '''
+        histogram = self.histograms.get(name)
+        if histogram == None:
+            histogram = Histogram(name, help, buckets)
+            self.histograms[name] = histogram
+        return histogram
+
+    def render(self) -> str:
+        '''
+        The metrics in the Prometheus text exposition format.
+        '''
+        lines: List[str] = []
+        for name in sorted(self.counters):
+            lines.extend(self.counters[name].render())
+        for name in sorted(self.histograms):
+            lines.extend(self.histograms[name].render())
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> List[str]:
+        '''
+        One line per counter and histogram series, for reading in Discord.
+        '''
+        lines: List[str] = []
+        for name in sorted(self.counters):
+            lines.extend(self.counters[name].summary())
+        for name in sorted(self.histograms):
+            lines.extend(self.histograms[name].summary())
+        return lines
+
+class MetricsServer:
+    '''
+    Serves the metrics at `/metrics` for Prometheus to scrape.
+    '''
+
+    def __init__(self, metrics: Metrics, host: str = "127.0.0.1", port: int = 9108):
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self.runner: Optional[web.AppRunner] = None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.metrics.render(), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    async def start(self):
+        if self.runner != None:
+            return
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, self.port)
+        await site.start()
+        print("[METRICS] Serving metrics at http://{}:{}/metrics".format(self.host, self.port))
+
+    async def stop(self):
+        if self.runner != None:
+            await self.runner.cleanup()
+            self.runner = None
+
+# The metrics shared by every module in the process
+shared_metrics: Optional[Metrics] = None
+
+def get_metrics() -> Metrics:
+    global shared_metrics
+    if shared_metrics == None:
+        shared_metrics = Metrics()
+    return shared_metrics
@@ -0,0 +1,280 @@
+'''
+A durable queue between scraping and posting to Discord.
+
+Scrapers enqueue finished posts into a SQLite table and move on, and poster workers drain it in the
+background. Every channel is drained in the order its posts were enqueued, one post at a time, while
+different channels are posted to in parallel. Failed posts stay at the head of their channel and are
+retried with exponential backoff, so a Discord outage only delays them.
+'''
+
+from collections import deque
+from pathlib import Path
+from typing import Awaitable, Callable, Deque, List, Optional, Set, Union
+import asyncio
+import json
+import random
+import sqlite3
+import time
+
+from bahamut import PostRecord
+
+class OutboxItem:
+
+    def __init__(self, id: int, channel_id: int, bsn: int, snA: int, floor: int, post: PostRecord, attempts: int):
+        self.id = id
+        self.channel_id = channel_id
+        self.bsn = bsn
+        self.snA = snA
+        self.floor = floor
+        self.post = post
+        self.attempts = attempts
+
+class OutboxStats:
+
+    def __init__(self, depth: int, failed: int, in_flight: int, drained_per_minute: float, oldest_age: float):
+        self.depth = depth
+        self.failed = failed
+        self.in_flight = in_flight
+        self.drained_per_minute = drained_per_minute
+        self.oldest_age = oldest_age
+
+    def __str__(self) -> str:
+        return "depth {}, failed {}, in flight {}, {:.1f} posts/min, oldest {:.0f}s".format(
+            self.depth, self.failed, self.in_flight, self.drained_per_minute, self.oldest_age
+        )
+
+class Outbox:
+
+    RATE_WINDOW = 60.0 # Seconds of history used for the drain rate
+
+    def __init__(self, path: Union[Path, str]):
+        '''
+        ## Parameters:
+        path: `Union[Path, str]`
+            The SQLite database file, which may be shared with a `StateStore`
+        '''
+        self.path = str(path)
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, channel_id INTEGER, bsn INTEGER, snA INTEGER, floor INTEGER, "
+            "payload TEXT, attempts INTEGER DEFAULT 0, not_before REAL DEFAULT 0, failed INTEGER DEFAULT 0, "
+            "last_error TEXT, enqueued REAL, "
+            "UNIQUE (channel_id, bsn, snA, floor))"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS outbox_channel ON outbox (channel_id, failed, id)")
+        self.connection.commit()
+        self.drained: Deque[float] = deque()
+        self.on_enqueue: Optional[Callable[[], None]] = None
+
+    def enqueue(self, channel_id: int, bsn: int, snA: int, post: PostRecord) -> bool:
+        '''
+        Adds a post to the end of its channel's queue.
+
+        ## Returns
+        `bool`
+            Whether the post was added. A post that is already queued is not added again.
+        '''
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT OR IGNORE INTO outbox (channel_id, bsn, snA, floor, payload, enqueued) VALUES (?, ?, ?, ?, ?, ?)",
+                (channel_id, bsn, snA, int(post.floor), json.dumps(post.to_dict(), ensure_ascii=False), time.time()),
+            )
+        if self.on_enqueue != None:
+            self.on_enqueue()
+        return cursor.rowcount > 0
+
+    def heads(self) -> List[tuple]:
+        '''
+        The oldest pending item of every channel, ordered by when they may be sent.
+        '''
+        return self.connection.execute(
+            "SELECT o.id, o.channel_id, bsn, snA, floor, payload, attempts, not_before FROM outbox AS o "
+            "JOIN (SELECT channel_id, MIN(id) AS id FROM outbox WHERE failed = 0 GROUP BY channel_id) AS h ON o.id = h.id "
+            "ORDER BY not_before, o.id"
+        ).fetchall()
+
+    def claim(self, busy_channels: Set[int], channels: Optional[Set[int]] = None) -> Optional[OutboxItem]:
+        '''
+        Gets the next post that is due, from a channel that is not being posted to.
+
+        ## Parameters:
+        busy_channels: `Set[int]`
+            Channels that are being posted to
+        channels: `Optional[Set[int]]`
+            Only posts of these channels are claimed, if given
+        '''
+        now = time.time()
+        for id, channel_id, bsn, snA, floor, payload, attempts, not_before in self.heads():
+            if channel_id in busy_channels or not_before > now:
+                continue
+            if channels != None and channel_id not in channels:
+                continue
+            return OutboxItem(id, channel_id, bsn, snA, floor, PostRecord.from_dict(json.loads(payload)), attempts)
+        return None
+
+    def next_due(self, busy_channels: Set[int], channels: Optional[Set[int]] = None) -> Optional[float]:
+        '''
+        ## Returns
+        `Optional[float]`
+            Seconds until a post of a free channel is due, or `None` if there is none
+        '''
+        due = [
+            not_before for _, channel_id, _, _, _, _, _, not_before in self.heads()
+            if channel_id not in busy_channels and (channels == None or channel_id in channels)
+        ]
+        return max(0.0, min(due) - time.time()) if len(due) > 0 else None
+
+    def done(self, item: OutboxItem):
+        with self.connection:
+            self.connection.execute("DELETE FROM outbox WHERE id = ?", (item.id,))
+        self.drained.append(time.monotonic())
+
+    def retry(self, item: OutboxItem, delay: float, error: str):
+        with self.connection:
+            self.connection.execute(
+                "UPDATE outbox SET attempts = attempts + 1, not_before = ?, last_error = ? WHERE id = ?",
+                (time.time() + delay, error, item.id),
+            )
+
+    def fail(self, item: OutboxItem, error: str):
+        '''
+        Sets a post aside after too many attempts, so the rest of its channel can be posted.
+        '''
+        with self.connection:
+            self.connection.execute(
+                "UPDATE outbox SET attempts = attempts + 1, failed = 1, last_error = ? WHERE id = ?",
+                (error, item.id),
+            )
+
+    def requeue_failed(self) -> int:
+        '''
+        Puts the failed posts back in their queues, in their original order.
+
+        ## Returns
+        `int`
+            Number of posts put back
+        '''
+        with self.connection:
+            cursor = self.connection.execute("UPDATE outbox SET failed = 0, attempts = 0, not_before = 0 WHERE failed = 1")
+        if self.on_enqueue != None:
+            self.on_enqueue()
+        return cursor.rowcount
+
+    def stats(self, in_flight: int = 0) -> OutboxStats:
+        depth, failed, oldest = self.connection.execute(
+            "SELECT SUM(failed = 0), SUM(failed = 1), MIN(enqueued) FROM outbox"
+        ).fetchone()
+        now = time.monotonic()
+        while len(self.drained) > 0 and self.drained[0] < now - self.RATE_WINDOW:
+            self.drained.popleft()
+        return OutboxStats(
+            depth or 0,
+            failed or 0,
+            in_flight,
+            len(self.drained) * 60.0 / self.RATE_WINDOW,
+            time.time() - oldest if oldest != None else 0.0,
+        )
+
+    def close(self):
+        self.connection.close()
+
+class OutboxPoster:
+    '''
+    Worker tasks that drain an `Outbox`.
+    '''
+
+    IDLE_WAIT = 5.0 # Longest a worker sleeps before checking the outbox again
+
+    def __init__(
+        self,
+        outbox: Outbox,
+        send: Callable[[OutboxItem], Awaitable[None]],
+        workers: int = 1,
+        retry_base: float = 5.0,
+        retry_max: float = 600.0,
+        max_attempts: int = 0,
+    ):
+        '''
+        ## Parameters:
+        outbox: `Outbox`
+            The queue to drain
+        send: `Callable[[OutboxItem], Awaitable[None]]`
+            Posts an item, raising an exception if it has to be retried
+        workers: `int`
+            Number of channels posted to at the same time
+        retry_base, retry_max: `float`
+            The first retry delay in seconds, doubled after every failure up to `retry_max`
+        max_attempts: `int`
+            Posts that failed this many times are set aside. `0` retries forever.
+        '''
+        self.outbox = outbox
+        self.send = send
+        self.workers = workers
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.max_attempts = max_attempts
+        self.in_flight: Set[int] = set()
+        # Channels this poster drains, all of them if None. Processes serving different shards share the outbox.
+        self.channels: Optional[Set[int]] = None
+        self.wakeup = asyncio.Event()
+        self.tasks: List[asyncio.Task] = []
+        outbox.on_enqueue = self.wakeup.set
+
+    @property
+    def running(self) -> bool:
+        return len(self.tasks) > 0
+
+    def start(self):
+        if self.running:
+            return
+        self.tasks = [asyncio.create_task(self.work()) for _ in range(self.workers)]
+        print("[OUTBOX] Started {} poster workers, {}".format(self.workers, self.stats()))
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    def stats(self) -> OutboxStats:
+        return self.outbox.stats(len(self.in_flight))
+
+    def retry_delay(self, attempts: int) -> float:
+        delay = min(self.retry_max, self.retry_base * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    async def work(self):
+        while True:
+            self.wakeup.clear()
+            item = self.outbox.claim(self.in_flight, self.channels)
+            if item == None:
+                due = self.outbox.next_due(self.in_flight, self.channels)
+                timeout = self.IDLE_WAIT if due == None else min(due, self.IDLE_WAIT)
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self.in_flight.add(item.channel_id)
+            try:
+                await self.send(item)
+            except Exception as e:
+                attempts = item.attempts + 1
+                if self.max_attempts > 0 and attempts >= self.max_attempts:
+                    self.outbox.fail(item, repr(e))
+                    print("[OUTBOX] bsn={}&snA={} #{} failed {} times and was set aside: {!r}".format(item.bsn, item.snA, item.floor, attempts, e))
+                else:
+                    delay = self.retry_delay(attempts)
+                    self.outbox.retry(item, delay, repr(e))
+                    print("[OUTBOX] bsn={}&snA={} #{} failed, retrying in {:.0f}s: {!r}".format(item.bsn, item.snA, item.floor, delay, e))
+            else:
+                self.outbox.done(item)
+            finally:
+                self.in_flight.discard(item.channel_id)
+                self.wakeup.set()
@@ -0,0 +1,94 @@
+'''
+A persistent cache of the thread pages that have already been archived.
+
+Each page is stored with its `ETag`, `Last-Modified` and a fingerprint of its content, so the next poll can
+send a conditional request and skip parsing the page when it has not changed.
+'''
+
+from pathlib import Path
+from typing import Dict, Optional, Union
+import hashlib
+import re
+import sqlite3
+
+SCRIPT_PATTERN = re.compile(r"<script\b.*?</script>", re.DOTALL | re.IGNORECASE)
+
+def fingerprint(html: str) -> str:
+    '''
+    Hashes a page without its scripts, which carry tokens that change on every request.
+    '''
+    return hashlib.sha1(SCRIPT_PATTERN.sub("", html).encode("utf8")).hexdigest()
+
+class CachedPage:
+
+    def __init__(
+        self,
+        bsn: int,
+        snA: int,
+        page: int,
+        digest: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+        title: Optional[str] = None,
+        num_pages: Optional[int] = None,
+        last_floor: int = 0,
+    ):
+        self.bsn = bsn
+        self.snA = snA
+        self.page = page
+        self.digest = digest
+        self.etag = etag
+        self.last_modified = last_modified
+        self.title = title
+        self.num_pages = num_pages
+        self.last_floor = last_floor
+
+    @property
+    def conditional_headers(self) -> Dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+class PageCache:
+
+    COLUMNS = ["bsn", "snA", "page", "digest", "etag", "last_modified", "title", "num_pages", "last_floor"]
+
+    def __init__(self, path: Union[Path, str]):
+        '''
+        ## Parameters:
+        path: `Union[Path, str]`
+            The SQLite database file. Use ":memory:" for a cache that is not persisted.
+        '''
+        self.path = str(path)
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "bsn INTEGER, snA INTEGER, page INTEGER, digest TEXT, etag TEXT, last_modified TEXT, "
+            "title TEXT, num_pages INTEGER, last_floor INTEGER, "
+            "PRIMARY KEY (bsn, snA, page))"
+        )
+        self.connection.commit()
+
+    def get(self, bsn: int, snA: int, page: int) -> Optional[CachedPage]:
+        row = self.connection.execute(
+            "SELECT {} FROM pages WHERE bsn = ? AND snA = ? AND page = ?".format(", ".join(self.COLUMNS)),
+            (bsn, snA, page),
+        ).fetchone()
+        if row == None:
+            return None
+        return CachedPage(*row)
+
+    def put(self, entry: CachedPage):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO pages ({}) VALUES ({})".format(", ".join(self.COLUMNS), ", ".join("?" * len(self.COLUMNS))),
+            tuple(getattr(entry, column) for column in self.COLUMNS),
+        )
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
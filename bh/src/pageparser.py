@@ -0,0 +1,138 @@
+'''
+Parser backends for Bahamut thread pages.
+
+Only a few parts of a thread page are used: the title, the page button row and the post sections.
+- `soup`: Builds the full BeautifulSoup tree, as the archiver always did
+- `targeted`: BeautifulSoup, but only the parts above are built
+- `lxml`: Locates the parts with lxml XPath queries, and only builds BeautifulSoup trees for the posts
+
+Every backend returns a `ParsedPage`, whose posts are BeautifulSoup `Tag`s that `BahamutPost` can extract.
+'''
+
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+
+from bs4 import BeautifulSoup, SoupStrainer, Tag
+
+class ParsedPage(ABC):
+
+    @abstractmethod
+    def get_title(self) -> str:
+        pass
+
+    @abstractmethod
+    def get_post_list(self) -> List[Tag]:
+        pass
+
+    @abstractmethod
+    def get_page_btn_row(self):
+        pass
+
+    @abstractmethod
+    def get_page_btn_list(self) -> list:
+        pass
+
+    @abstractmethod
+    def get_page_count(self) -> int:
+        pass
+
+class BHPage(BeautifulSoup, ParsedPage):
+
+    def get_title(self):
+        scrolldown_header: Tag = self.find("div", attrs={"class": "c-menu__scrolldown"})
+        title = scrolldown_header.find("h1", attrs={"class": "title"}).text
+        return title
+
+    def get_post_list(soup: BeautifulSoup) -> List[Tag]:
+        sections: List[Tag] = soup.find_all("section", attrs={"class": "c-section"})
+        return [tag for tag in sections if "id" in tag.attrs and tag.attrs["id"].startswith("post")]
+
+    def get_page_btn_row(self) -> Tag:
+        return self.find("p", attrs={"class": "BH-pagebtnA"})
+
+    def get_page_btn_list(self) -> List[Tag]:
+        return self.get_page_btn_row().find_all("a")
+
+    def get_page_count(self) -> int:
+        return int(self.get_page_btn_list()[-1].text)
+
+class LxmlPage(ParsedPage):
+
+    def __init__(self, html: str):
+        from lxml import html as lxml_html
+        self.lxml_html = lxml_html
+        self.root = lxml_html.fromstring(html)
+
+    @staticmethod
+    def class_xpath(tag: str, class_name: str) -> str:
+        return "//{}[contains(concat(' ', normalize-space(@class), ' '), ' {} ')]".format(tag, class_name)
+
+    def get_title(self) -> str:
+        titles = self.root.xpath(self.class_xpath("div", "c-menu__scrolldown") + self.class_xpath("h1", "title"))
+        return titles[0].text_content()
+
+    def get_post_list(self) -> List[Tag]:
+        posts: List[Tag] = []
+        for section in self.root.xpath(self.class_xpath("section", "c-section") + "[starts-with(@id, 'post')]"):
+            section_html = self.lxml_html.tostring(section, encoding="unicode", with_tail=False)
+            posts.append(BeautifulSoup(section_html, features="lxml").section)
+        return posts
+
+    def get_page_btn_row(self):
+        rows = self.root.xpath(self.class_xpath("p", "BH-pagebtnA"))
+        return rows[0] if len(rows) > 0 else None
+
+    def get_page_btn_list(self) -> list:
+        return self.get_page_btn_row().xpath(".//a")
+
+    def get_page_count(self) -> int:
+        return int(self.get_page_btn_list()[-1].text_content())
+
+class PageParser(ABC):
+
+    name: str
+
+    @abstractmethod
+    def parse(self, html: str) -> ParsedPage:
+        pass
+
+class SoupParser(PageParser):
+
+    name = "soup"
+
+    def parse(self, html: str) -> ParsedPage:
+        return BHPage(html, features="lxml")
+
+class TargetedSoupParser(PageParser):
+
+    name = "targeted"
+    STRAINER = SoupStrainer(["section", "p", "div"], class_=["c-section", "BH-pagebtnA", "c-menu__scrolldown"])
+
+    def parse(self, html: str) -> ParsedPage:
+        return BHPage(html, features="lxml", parse_only=self.STRAINER)
+
+class LxmlParser(PageParser):
+
+    name = "lxml"
+
+    def parse(self, html: str) -> ParsedPage:
+        return LxmlPage(html)
+
+PARSERS = {parser.name: parser for parser in [SoupParser, TargetedSoupParser, LxmlParser]}
+DEFAULT_PARSER = TargetedSoupParser.name
+
+parser_instances: Dict[str, PageParser] = {}
+
+def get_parser(name: Optional[str] = None) -> PageParser:
+    '''
+    Gets a parser backend by name.
+
+    ## Parameters:
+    name: `Optional[str]`
+        One of "soup", "targeted" or "lxml". Defaults to "targeted".
+    '''
+    if name == None:
+        name = DEFAULT_PARSER
+    if name not in parser_instances:
+        parser_instances[name] = PARSERS[name]()
+    return parser_instances[name]
@@ -0,0 +1,97 @@
+'''
+Turns fetched pages into post records, optionally in worker processes.
+
+Parsing a page and extracting its posts is CPU bound. With `max_workers` set, the work runs in a
+`ProcessPoolExecutor` and only compact `PostRecord`s travel back to the event loop, so a busy host
+can use all of its cores. Without it, pages are handled on the event loop as before.
+'''
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+import asyncio
+
+from bahamut import BahamutPost, PostRecord
+from pageparser import get_parser
+from metrics import get_metrics
+
+class PageRecord:
+
+    def __init__(self, posts: List[PostRecord], title: Optional[str] = None, num_pages: Optional[int] = None):
+        self.posts = posts
+        self.title = title
+        self.num_pages = num_pages
+
+def extract_page(html: str, page_url: str, parser_name: Optional[str] = None, with_header: bool = False, with_posts: bool = True) -> PageRecord:
+    '''
+    Parses a page and extracts its posts.
+
+    ## Parameters:
+    html: `str`
+        The HTML of the page
+    page_url: `str`
+        The URL of the page, used as the link of posts without their own
+    parser_name: `Optional[str]`
+        The page parser backend
+    with_header: `bool`
+        Whether to also read the thread title and page count
+    with_posts: `bool`
+        Whether to extract the posts
+
+    ## Returns
+    `PageRecord`
+    '''
+    page = get_parser(parser_name).parse(html)
+    posts = [BahamutPost(post, page_url).to_record() for post in page.get_post_list()] if with_posts else []
+    if with_header:
+        # Threads with a single page have no page buttons
+        num_pages = page.get_page_count() if page.get_page_btn_row() != None else 1
+        return PageRecord(posts, page.get_title(), num_pages)
+    return PageRecord(posts)
+
+class PagePool:
+
+    def __init__(self, max_workers: int = 0):
+        '''
+        ## Parameters:
+        max_workers: `int`
+            Number of worker processes. `0` handles pages on the event loop.
+        '''
+        self.max_workers = max_workers
+        self.executor: Optional[ProcessPoolExecutor] = None
+
+    async def extract(self, html: str, page_url: str, parser_name: Optional[str] = None, with_header: bool = False, with_posts: bool = True) -> PageRecord:
+        '''
+        Runs `extract_page`, in a worker process if the pool has any.
+        '''
+        histogram = get_metrics().histogram("bh_page_parse_seconds", "Time spent parsing a page and extracting its posts")
+        with histogram.time(parser=parser_name or "default"):
+            if self.max_workers <= 0:
+                return extract_page(html, page_url, parser_name, with_header, with_posts)
+            if self.executor == None:
+                self.executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, extract_page, html, page_url, parser_name, with_header, with_posts)
+
+    def shutdown(self):
+        if self.executor != None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+# The pool shared by every archiver in the process
+shared_pool: Optional[PagePool] = None
+
+def configure_page_pool(max_workers: int) -> PagePool:
+    '''
+    Replaces the shared pool. Must be called before the first page is handled.
+    '''
+    global shared_pool
+    if shared_pool != None:
+        shared_pool.shutdown()
+    shared_pool = PagePool(max_workers)
+    return shared_pool
+
+def get_page_pool() -> PagePool:
+    global shared_pool
+    if shared_pool == None:
+        shared_pool = PagePool()
+    return shared_pool
@@ -0,0 +1,149 @@
+'''
+Helpers for turning archived posts into Discord messages.
+
+Posts longer than a single message are sent in one of two ways:
+- `attachment`: The header as the message, and the post as a text file. `/bh-archive` puts the header in the file as well.
+- `messages`: The post split at paragraph and URL boundaries, sent as ordered messages in the thread
+'''
+
+from typing import List, Optional, Tuple
+import gzip
+import io
+import re
+
+from discord import File, Thread
+
+from ratelimit import discord_route, get_rate_limiter
+
+MESSAGE_LIMIT = 2000 # Characters allowed in a single message
+COMPRESS_THRESHOLD = 1024 * 1024 # Attachments larger than this many bytes are compressed
+LONG_POST_MODES = ("attachment", "messages")
+
+URL_PATTERN = re.compile(r"https?://\S+")
+# Places a message may be split, best first. Sentence ends are kept with the text before them.
+BREAKS = [("\n\n", False), ("\n", False), ("。", True), ("！", True), ("？", True), (". ", True), (" ", False)]
+
+def text_file(content: str, filename: str = "content.txt", compress_threshold: Optional[int] = COMPRESS_THRESHOLD) -> File:
+    '''
+    Builds a text attachment in memory, so nothing is written to disk and concurrent archives
+    cannot overwrite each other's files.
+
+    ## Parameters:
+    content: `str`
+        The text of the attachment
+    filename: `str`
+        The file name shown in Discord
+    compress_threshold: `Optional[int]`
+        Attachments larger than this many bytes are gzip compressed and get a `.gz` suffix.
+        `None` never compresses.
+
+    ## Returns
+    `discord.File`
+    '''
+    data = content.encode("utf8")
+    if compress_threshold != None and len(data) > compress_threshold:
+        data = gzip.compress(data)
+        filename += ".gz"
+    return File(io.BytesIO(data), filename=filename)
+
+def find_break(text: str, limit: int) -> int:
+    '''
+    Finds where to end the first message of `text`, which is longer than `limit`.
+    Breaks in the second half of the message are preferred, so messages do not end up very short.
+    '''
+    window = text[:limit + 2]
+    for min_index in (limit // 2, 1):
+        for separator, keep in BREAKS:
+            index = window.rfind(separator, 0, limit + 1)
+            if index < 0:
+                continue
+            if keep:
+                index += len(separator)
+            if min_index <= index <= limit:
+                return index
+    # No break at all: cut at the limit, but not inside a URL
+    for match in URL_PATTERN.finditer(window):
+        if match.start() < limit < match.end() and match.start() > 0:
+            return match.start()
+    return limit
+
+def split_message(content: str, limit: int = MESSAGE_LIMIT) -> List[str]:
+    '''
+    Splits text into messages that fit in Discord's limit.
+    Paragraphs are kept together where possible, and URLs are never cut unless a single URL is longer than a message.
+
+    ## Parameters:
+    content: `str`
+        The text to split
+    limit: `int`
+        Maximum number of characters in a message
+
+    ## Returns
+    `List[str]`
+        The messages, in order
+    '''
+    messages: List[str] = []
+    rest = content.strip()
+    while len(rest) > limit:
+        index = find_break(rest, limit)
+        messages.append(rest[:index].rstrip())
+        rest = rest[index:].lstrip()
+    if len(rest) > 0:
+        messages.append(rest)
+    return messages
+
+def prepare_post_content(
+    header: str,
+    body: str,
+    separator: str,
+    mode: str = "attachment",
+    compress_threshold: Optional[int] = COMPRESS_THRESHOLD,
+    header_in_file: bool = False,
+) -> Tuple[dict, List[str]]:
+    '''
+    Prepares the messages of an archived post.
+
+    ## Parameters:
+    header: `str`
+        The information of the post, always kept in the first message
+    body: `str`
+        The content of the post
+    separator: `str`
+        Put between the header and the content
+    mode: `str`
+        How posts longer than a message are sent, one of `LONG_POST_MODES`
+    compress_threshold: `Optional[int]`
+        See `text_file`
+    header_in_file: `bool`
+        In the `attachment` mode, send the header and the content together as the file, with no message
+
+    ## Returns
+    `Tuple[dict, List[str]]`
+        The content arguments of the first message, and the messages that follow it in the thread
+    '''
+    full_content = header + separator + body
+    if len(full_content) <= MESSAGE_LIMIT:
+        return {"content": full_content}, []
+
+    match mode:
+        case "attachment" if header_in_file:
+            return {"file": text_file(full_content, compress_threshold=compress_threshold)}, []
+        case "attachment":
+            return {"content": header, "file": text_file(body, compress_threshold=compress_threshold)}, []
+        case "messages":
+            messages = split_message(full_content)
+            return {"content": messages[0]}, messages[1:]
+        case _:
+            raise ValueError("Unknown long post mode: {}".format(mode))
+
+async def send_followups(thread: Thread, messages: List[str]):
+    '''
+    Sends the rest of a split post into its thread.
+    Each message is awaited before the next one is sent, so they always appear in order, and they
+    are paced only by the thread's message bucket rather than fixed delays.
+    '''
+    limiter = get_rate_limiter()
+    route = discord_route("POST", "/channels/{}/messages".format(thread.id))
+    for message in messages:
+        await limiter.wait(route)
+        await thread.send(content=message)
@@ -0,0 +1,282 @@
+'''
+Non-blocking pacing for requests sent to Discord and to the forum.
+
+Every route (a Discord endpoint, or the forum host) gets its own token bucket. Like Discord, Discord routes
+are told apart by their major parameter (the channel, guild or webhook ID) and grouped by the
+`X-RateLimit-Bucket` hash once it is known. The buckets start with conservative defaults and are corrected
+by the rate limit headers of the actual responses:
+- Discord: `X-RateLimit-Limit`, `X-RateLimit-Remaining`, `X-RateLimit-Reset-After` and `Retry-After`
+- Forum: `Retry-After` on 429 and 503 responses
+
+Buckets left idle are dropped, so a bucket per archived thread does not pile up. Every Discord request
+also takes a token of a bucket shared by all routes, so that editing many threads at once is paced as well.
+
+References:
+    https://discord.com/developers/docs/topics/rate-limits
+'''
+
+from typing import Dict, Mapping, Optional, Tuple
+from urllib.parse import urlparse
+import asyncio
+import re
+import time
+
+import aiohttp
+
+from metrics import get_metrics
+
+DISCORD_HOST = "discord.com"
+FORUM_HOST = "forum.gamer.com.tw"
+API_PREFIX = re.compile(r"^/api(/v\d+)?")
+MAJOR_PARAMETER = re.compile(r"^/(?:channels|guilds|webhooks)/(\d+)")
+
+
+def discord_route(method: str, path: str) -> str:
+    '''
+    Builds the key of a Discord route, such as `POST /channels/123/threads`.
+
+    ## Parameters:
+    method: `str`
+        The HTTP method
+    path: `str`
+        The endpoint path, with or without the `/api/v10` prefix
+    '''
+    return "{} {}".format(method.upper(), API_PREFIX.sub("", path))
+
+def route_label(key: str) -> str:
+    '''
+    The route with its IDs left out, such as `POST /channels/{id}/threads`, to group metrics by endpoint.
+    '''
+    return re.sub(r"/\d+", "/{id}", key)
+
+def major_parameter(key: str) -> Optional[str]:
+    '''
+    The ID that Discord keeps separate limits for, such as the channel of `POST /channels/123/messages`.
+    '''
+    _, _, path = key.partition(" ")
+    match = MAJOR_PARAMETER.match(path)
+    return match.group(1) if match != None else None
+
+def parse_float(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+class TokenBucket:
+
+    def __init__(self, rate: float, capacity: int):
+        '''
+        ## Parameters:
+        rate: `float`
+            Number of tokens regained per second
+        capacity: `int`
+            Maximum number of tokens, i.e. the largest burst allowed
+        '''
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = asyncio.Lock()
+
+    def refill(self, now: float):
+        if self.updated < self.blocked_until <= now:
+            # The server side window was reset
+            self.tokens = float(self.capacity)
+        else:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        '''
+        Seconds to wait before the next token is available.
+        '''
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self.refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self) -> float:
+        '''
+        Waits for a token without blocking the event loop. Waiters are served in order.
+
+        ## Returns
+        `float`
+            Seconds spent waiting
+        '''
+        waited = 0.0
+        async with self.lock:
+            delay = self.delay()
+            while delay > 0:
+                await asyncio.sleep(delay)
+                waited += delay
+                delay = self.delay()
+            self.tokens -= 1
+        return waited
+
+    def block(self, seconds: float):
+        '''
+        Holds every request on this bucket for the given time.
+        '''
+        self.tokens = 0.0
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def update(self, limit: Optional[float], remaining: Optional[float], reset_after: Optional[float]):
+        if limit != None and limit >= 1:
+            self.capacity = int(limit)
+            if reset_after != None and reset_after > 0 and remaining != None and remaining >= limit - 1:
+                # The first request of a window, so the window resets after its whole length
+                self.rate = limit / reset_after
+        if remaining != None:
+            self.tokens = min(self.tokens, remaining)
+            if remaining < 1 and reset_after != None:
+                self.block(reset_after)
+
+class RateLimiter:
+
+    def __init__(
+        self,
+        default_limits: Optional[Dict[str, Tuple[float, int]]] = None,
+        default_limit: Tuple[float, int] = (1.0, 5),
+        discord_limit: Tuple[float, int] = (50.0, 50),
+        idle_timeout: float = 300.0,
+    ):
+        '''
+        ## Parameters:
+        default_limits: `Optional[Dict[str, Tuple[float, int]]]`
+            Initial `(rate, capacity)` of specific keys, such as a forum host
+        default_limit: `Tuple[float, int]`
+            Initial `(rate, capacity)` of every other key. Discord allows 5 requests per 5 seconds
+            on most routes, and corrects the bucket through its headers.
+        discord_limit: `Tuple[float, int]`
+            `(rate, capacity)` shared by every Discord request, on top of the bucket of its route.
+            Discord allows 50 requests per second over the whole bot.
+        idle_timeout: `float`
+            Seconds after which an unused bucket is dropped
+        '''
+        self.default_limits = default_limits if default_limits != None else {}
+        self.default_limit = default_limit
+        self.idle_timeout = idle_timeout
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.discord_bucket = TokenBucket(*discord_limit)
+        self.bucket_hashes: Dict[str, str] = {} # X-RateLimit-Bucket of every route, by route_label
+        self.learned_limits: Dict[str, Tuple[float, int]] = {} # Limits of every bucket hash or route seen in responses
+        self.global_until = 0.0
+        self.swept = time.monotonic()
+
+    def bucket_key(self, key: str) -> str:
+        '''
+        The bucket of a route: its Discord bucket hash, or the route without IDs, and its major parameter.
+        Hosts are their own bucket.
+        '''
+        if " " not in key:
+            return key
+        label = route_label(key)
+        return "{}:{}".format(self.bucket_hashes.get(label, label), major_parameter(key) or "")
+
+    def bucket(self, key: str) -> TokenBucket:
+        self.sweep()
+        bucket_key = self.bucket_key(key)
+        if bucket_key not in self.buckets:
+            group = bucket_key.rpartition(":")[0] if " " in key else key
+            rate, capacity = self.default_limits.get(key, self.learned_limits.get(group, self.default_limit))
+            self.buckets[bucket_key] = TokenBucket(rate, capacity)
+        return self.buckets[bucket_key]
+
+    def sweep(self):
+        '''
+        Drops the buckets that were not used for `idle_timeout` seconds and are not holding requests back.
+        '''
+        now = time.monotonic()
+        if now - self.swept < self.idle_timeout / 2:
+            return
+        self.swept = now
+        for key, bucket in list(self.buckets.items()):
+            if now - bucket.updated > self.idle_timeout and now >= bucket.blocked_until and not bucket.lock.locked():
+                del self.buckets[key]
+
+    async def wait(self, key: str) -> float:
+        '''
+        Waits until a request on the route is allowed.
+
+        ## Parameters:
+        key: `str`
+            The route, either from `discord_route` or a host name
+
+        ## Returns
+        `float`
+            Seconds spent waiting
+        '''
+        waited = 0.0
+        if " " in key:
+            # Discord routes also share the global limit
+            delay = self.global_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                waited += delay
+            waited += await self.discord_bucket.acquire()
+        waited += await self.bucket(key).acquire()
+        get_metrics().histogram("bh_rate_limit_wait_seconds", "Time requests waited for their rate limit bucket").observe(waited, route=route_label(key))
+        return waited
+
+    def update(self, key: str, status: int, headers: Mapping[str, str]):
+        '''
+        Adjusts the bucket of a route with the headers of its response.
+        '''
+        if " " in key and headers.get("X-RateLimit-Bucket") != None:
+            self.bucket_hashes[route_label(key)] = headers["X-RateLimit-Bucket"]
+        bucket = self.bucket(key)
+        bucket.update(
+            parse_float(headers.get("X-RateLimit-Limit")),
+            parse_float(headers.get("X-RateLimit-Remaining")),
+            parse_float(headers.get("X-RateLimit-Reset-After")),
+        )
+        # Buckets of other IDs of the route start from what was learned here
+        self.learned_limits[self.bucket_key(key).rpartition(":")[0] if " " in key else key] = (bucket.rate, bucket.capacity)
+        if status in (429, 503):
+            retry_after = parse_float(headers.get("Retry-After"))
+            if retry_after == None:
+                retry_after = parse_float(headers.get("X-RateLimit-Reset-After"))
+            if retry_after == None:
+                retry_after = 1.0
+            if headers.get("X-RateLimit-Global", "").lower() == "true":
+                self.global_until = max(self.global_until, time.monotonic() + retry_after)
+            else:
+                bucket.block(retry_after)
+            print("[RATELIMIT] {} is limited for {:.1f}s".format(key, retry_after))
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        '''
+        Builds a trace config that feeds the headers of every Discord response into the limiter.
+        Pass it to the bot as `http_trace`, since discord.py does not expose the headers otherwise.
+        '''
+        async def on_request_end(session, context, params: aiohttp.TraceRequestEndParams):
+            url = urlparse(str(params.url))
+            if url.netloc.endswith(DISCORD_HOST):
+                self.update(discord_route(params.method, url.path), params.response.status, params.response.headers)
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_end.append(on_request_end)
+        return trace_config
+
+# The limiter shared by every archiver in the process
+shared_limiter: Optional[RateLimiter] = None
+
+def configure_rate_limiter(**kwargs) -> RateLimiter:
+    '''
+    Replaces the shared limiter with one built from the given `RateLimiter` arguments.
+    Must be called before the first request is sent.
+    '''
+    global shared_limiter
+    shared_limiter = RateLimiter(**kwargs)
+    return shared_limiter
+
+def get_rate_limiter() -> RateLimiter:
+    global shared_limiter
+    if shared_limiter == None:
+        shared_limiter = RateLimiter(default_limits={FORUM_HOST: (1.0, 4)})
+    return shared_limiter
@@ -0,0 +1,169 @@
+'''
+Gives every tracked thread its own poll time, instead of polling all of them on one fixed loop.
+
+A thread that gained floors is polled again sooner, down to `min_interval`, and a quiet thread is
+polled exponentially less often, up to `max_interval`. The threads wait in a heap ordered by their
+next poll time, so finding the next due thread does not depend on how many threads are tracked.
+A token bucket caps the polls per minute over every thread, due threads past the cap wait for the next call.
+'''
+
+from typing import Dict, Generic, Hashable, List, Optional, Set, Tuple, TypeVar
+import heapq
+import random
+import time
+
+from ratelimit import TokenBucket
+
+ThreadKey = Tuple[int, int, int] # channel_id, bsn, snA
+T = TypeVar("T")
+
+class PollState(Generic[T]):
+
+    def __init__(self, item: T, interval: float, due: float):
+        self.item = item
+        self.interval = interval # Seconds between the polls of the thread
+        self.due = due # Monotonic time of the next poll
+        self.polls = 0
+        self.quiet_polls = 0 # Polls in a row that found no new floors
+
+class PollScheduler(Generic[T]):
+
+    def __init__(
+        self,
+        min_interval: float = 60.0,
+        max_interval: float = 6 * 3600.0,
+        initial_interval: float = 1200.0,
+        backoff: float = 1.5,
+        speedup: float = 0.5,
+        jitter: float = 0.1,
+        max_polls_per_minute: float = 0.0,
+    ):
+        '''
+        ## Parameters:
+        min_interval, max_interval: `float`
+            Bounds of the time in seconds between two polls of a thread
+        initial_interval: `float`
+            Time between polls of a thread that was just added
+        backoff: `float`
+            Factor the interval grows by after a poll that found nothing
+        speedup: `float`
+            Factor the interval shrinks by after a poll that found new floors
+        jitter: `float`
+            Random share added to or taken from every interval, so threads do not stay in step
+        max_polls_per_minute: `float`
+            Polls allowed per minute over every thread, with bursts of up to a tenth of a minute. 0 polls every due thread.
+        '''
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.initial_interval = initial_interval
+        self.backoff = backoff
+        self.speedup = speedup
+        self.jitter = jitter
+        self.states: Dict[Hashable, PollState[T]] = {}
+        self.heap: List[Tuple[float, int, Hashable]] = []
+        self.counter = 0 # Breaks ties in the heap in the order threads were scheduled
+        self.bucket: Optional[TokenBucket] = None
+        if max_polls_per_minute > 0:
+            self.bucket = TokenBucket(max_polls_per_minute / 60.0, max(1, int(max_polls_per_minute / 10)))
+
+    def __len__(self) -> int:
+        return len(self.states)
+
+    def push(self, key: Hashable, state: PollState[T]):
+        self.counter += 1
+        heapq.heappush(self.heap, (state.due, self.counter, key))
+
+    def add(self, key: Hashable, item: T, delay: float = 0.0):
+        '''
+        Schedules a thread, first polled after `delay` seconds. A thread that is already scheduled keeps its state.
+        '''
+        state = self.states.get(key)
+        if state != None:
+            state.item = item
+            return
+        state = PollState(item, self.initial_interval, time.monotonic() + delay)
+        self.states[key] = state
+        self.push(key, state)
+
+    def remove(self, key: Hashable):
+        # The heap entry is dropped when it comes up
+        self.states.pop(key, None)
+
+    def keep(self, keys: Set[Hashable]):
+        '''
+        Removes every thread not in `keys`.
+        '''
+        for key in [key for key in self.states if key not in keys]:
+            self.remove(key)
+
+    def next_due(self) -> Optional[float]:
+        '''
+        ## Returns
+        `Optional[float]`
+            Seconds until the next thread is due, or `None` if no thread is scheduled
+        '''
+        while len(self.heap) > 0:
+            due, _, key = self.heap[0]
+            state = self.states.get(key)
+            if state == None or state.due != due:
+                # Removed or rescheduled since
+                heapq.heappop(self.heap)
+                continue
+            return max(0.0, due - time.monotonic())
+        return None
+
+    def pop_due(self) -> List[Tuple[Hashable, T]]:
+        '''
+        Takes the threads that are due, earliest first, as many as the poll rate cap allows.
+        They are not polled again until `reschedule`.
+        '''
+        now = time.monotonic()
+        due_items: List[Tuple[Hashable, T]] = []
+        while len(self.heap) > 0 and self.heap[0][0] <= now:
+            due, _, key = self.heap[0]
+            state = self.states.get(key)
+            if state == None or state.due != due:
+                heapq.heappop(self.heap)
+                continue
+            if self.bucket != None:
+                if self.bucket.delay() > 0:
+                    break
+                self.bucket.tokens -= 1
+            heapq.heappop(self.heap)
+            state.due = float("inf")
+            due_items.append((key, state.item))
+        return due_items
+
+    def reschedule(self, key: Hashable, new_floors: int, failed: bool = False) -> Optional[float]:
+        '''
+        Sets the next poll of a thread from what its last poll found.
+
+        ## Parameters:
+        key: `Hashable`
+            The thread
+        new_floors: `int`
+            Number of floors the poll found
+        failed: `bool`
+            Whether the poll failed, which backs off like a quiet poll
+
+        ## Returns
+        `Optional[float]`
+            The new interval, or `None` if the thread was removed meanwhile
+        '''
+        state = self.states.get(key)
+        if state == None:
+            return None
+        state.polls += 1
+        if new_floors > 0 and not failed:
+            state.quiet_polls = 0
+            state.interval = max(self.min_interval, state.interval * self.speedup)
+        else:
+            state.quiet_polls += 1
+            state.interval = min(self.max_interval, state.interval * self.backoff)
+        delay = state.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+        state.due = time.monotonic() + delay
+        self.push(key, state)
+        return state.interval
+
+    def intervals(self) -> List[float]:
+        return [state.interval for state in self.states.values()]
@@ -1,23 +1,193 @@
+from typing import Dict, List, Optional
 
-from discord import Intents
-from discord.ext.commands import Bot
+from aiohttp import TraceConfig
+from discord import Intents, MemberCacheFlags
+from discord.ext.commands import AutoShardedBot, Bot
+
+class BotProfile():
+    '''
+    How much of the gateway a bot subscribes to and keeps in memory.
+    - `archiver`: Guilds and guild messages only, enough for prefix commands and forum channels. Nothing else is cached.
+    - `interactive`: The default intents without typing events, for slash commands and components.
+      Members are only cached from interactions.
+    - `full`: Every intent, including the privileged `presences` and `members`, with every member cached.
+    '''
+
+    NAMES = ["archiver", "interactive", "full"]
+
+    def __init__(self, intents: Intents, member_cache_flags: MemberCacheFlags, chunk_guilds_at_startup: bool, max_messages: Optional[int]):
+        self.intents = intents
+        self.member_cache_flags = member_cache_flags
+        self.chunk_guilds_at_startup = chunk_guilds_at_startup
+        self.max_messages = max_messages
+
+    @property
+    def options(self) -> dict:
+        '''
+        The keyword arguments of `Client` and `Bot` for this profile.
+        '''
+        return {
+            "intents": self.intents,
+            "member_cache_flags": self.member_cache_flags,
+            "chunk_guilds_at_startup": self.chunk_guilds_at_startup,
+            "max_messages": self.max_messages,
+        }
+
+    @classmethod
+    def get(cls, name: str) -> "BotProfile":
+        '''
+        ## Parameters:
+        name: `str`
+            One of `NAMES`
+        '''
+        match name:
+            case "archiver":
+                intents = Intents.none()
+                intents.guilds = True
+                intents.guild_messages = True
+                intents.message_content = True
+                return cls(intents, MemberCacheFlags.none(), False, None)
+            case "interactive":
+                intents = Intents.default()
+                intents.typing = False
+                intents.message_content = True
+                return cls(intents, MemberCacheFlags.from_intents(intents), False, 1000)
+            case "full":
+                intents = Intents.default()
+                intents.message_content = True
+                intents.presences = True
+                intents.members = True
+                return cls(intents, MemberCacheFlags.all(), True, 1000)
+            case _:
+                raise ValueError("Unknown bot profile: {}".format(name))
 
 class BotEssentials():
 
     intents: Intents = None
+    profile: BotProfile = None
     bot: Bot = None
 
     @classmethod
-    def setup_bot(self):
+    def setup_bot(
+        self,
+        http_trace: Optional[TraceConfig] = None,
+        profile: str = "full",
+        sharded: bool = False,
+        shard_count: Optional[int] = None,
+        shard_ids: Optional[List[int]] = None,
+    ):
         '''
         Setting up a bot (interactions based on commands)
+
+        ## Parameters:
+        http_trace: `Optional[TraceConfig]`
+            Traces the HTTP requests the bot sends to Discord
+        profile: `str`
+            The intents and caching of the bot, one of `BotProfile.NAMES`
+        sharded: `bool`
+            Connects through an `AutoShardedBot` instead of a single gateway connection
+        shard_count: `Optional[int]`
+            Total number of shards. `None` uses the number recommended by Discord.
+        shard_ids: `Optional[List[int]]`
+            The shards this process connects, all of them if `None`. Needs `shard_count`.
         '''
-        intents = Intents.default()
-        intents.message_content = True
-        intents.presences = True
-        intents.members = True
+        bot_profile = BotProfile.get(profile)
+
+        if sharded or shard_ids != None:
+            bot = AutoShardedBot(command_prefix='!', http_trace=http_trace, shard_count=shard_count, shard_ids=shard_ids, **bot_profile.options)
+        else:
+            bot = Bot(command_prefix='!', http_trace=http_trace, **bot_profile.options)
+
+        BotEssentials.intents = bot_profile.intents
+        BotEssentials.profile = bot_profile
+        BotEssentials.bot = bot
+
+class ArchiverSettings():
+
+    # The intents and caching of the archiver bot, see `BotProfile`
+    bot_profile: str = "archiver"
+
+    # Connects to the gateway through several shards. shard_count None lets Discord choose the number of shards.
+    auto_shard: bool = False
+    shard_count: Optional[int] = None
+    # Runs the shards in this many processes, each connecting a range of the shards and polling the threads
+    # of its guilds. Needs shard_count.
+    shard_processes: int = 1
+
+    # Webpage fetching
+    max_connections: int = 20
+    max_connections_per_host: int = 4
+    fetch_timeout: float = 30.0
+    connect_timeout: float = 10.0
+
+    # How forum pages are parsed: "soup", "targeted" or "lxml"
+    page_parser: str = "targeted"
+
+    # Number of worker processes that parse pages and extract posts. 0 keeps the work on the event loop.
+    process_pool_workers: int = 0
+
+    # The tracked threads and their progress, imported from config/config.csv on first start
+    state_file: str = "config/state.db"
+
+    # Pages that have not changed since they were archived are remembered here
+    page_cache_file: str = "config/page_cache.db"
+
+    # Number of tracked threads fetched at the same time
+    max_concurrent_threads: int = 8
+
+    # How threads are polled: "fixed" polls every thread every 20 minutes, "adaptive" gives every thread its own
+    # interval, halved after a poll that found new floors and grown by half after a quiet one, see `PollScheduler`
+    poll_mode: str = "fixed"
+    poll_min_interval: float = 60.0
+    poll_max_interval: float = 6 * 3600.0
+    poll_initial_interval: float = 1200.0
+    # Seconds between the checks for due threads, in adaptive mode
+    poll_tick: float = 10.0
+    # Thread polls allowed per minute over every thread, in adaptive mode. 0 does not cap the polls.
+    max_polls_per_minute: float = 60.0
+
+    # Fetches the listing (B.php) of every board once per pass and only polls the threads with new replies, see `BoardWatcher`.
+    # Up to board_listing_pages listing pages are fetched per board, and a listing is reused for board_listing_max_age seconds.
+    board_listing: bool = False
+    board_listing_pages: int = 3
+    board_listing_max_age: float = 60.0
+
+    # Threads more than backfill_threshold pages behind are caught up in the background, with up to backfill_prefetch pages
+    # fetched ahead of posting and at most max_backfills threads at a time. 0 catches up 2 pages per pass.
+    backfill_threshold: int = 4
+    backfill_prefetch: int = 8
+    max_backfills: int = 2
+    # Seconds between the progress reports of a backfill
+    backfill_report_interval: float = 60.0
+
+    # Requests per second allowed to the forum, and the largest burst
+    forum_rate: float = 1.0
+    forum_burst: int = 4
+
+    # Long posts are attached as text files built in memory. Files larger than this many bytes are gzip compressed.
+    attachment_compress_threshold: int = 1024 * 1024
+
+    # How posts longer than a message are sent: "attachment" (the post as a text file) or "messages" (the post split into messages in its thread)
+    long_post_mode: str = "attachment"
+
+    # Number of outbox workers posting to Discord in the background, each to a different channel.
+    # 0 posts directly while scraping. The outbox is kept in state_file.
+    outbox_workers: int = 0
+    # Failed posts are retried after outbox_retry_base seconds, doubled after every failure up to outbox_retry_max
+    outbox_retry_base: float = 5.0
+    outbox_retry_max: float = 600.0
+    # Posts that failed this many times are set aside until `!outbox-retry`. 0 retries forever.
+    outbox_max_attempts: int = 0
+
+    # Webhook URLs of forum channels, by channel ID. Threads in these channels are created through the
+    # webhooks in turn, so each webhook's rate limit is used. Needs /src on PYTHONPATH.
+    webhooks: Dict[int, List[str]] = {}
 
-        bot = Bot(command_prefix='!', intents=intents)
+    # Serves the metrics in the Prometheus text format at http://metrics_host:metrics_port/metrics. 0 disables the endpoint.
+    # Shard processes serve on metrics_port plus their first shard ID.
+    metrics_port: int = 0
+    metrics_host: str = "127.0.0.1"
 
-        BotEssentials.intents = intents
-        BotEssentials.bot = bot
\ No newline at end of file
+    # Other hashtags that mean a forum tag, by tag name, e.g. {"情報": ["新聞", "資訊"]}.
+    # Hashtags are matched to tags ignoring case and full/half width.
+    tag_aliases: Dict[str, List[str]] = {}
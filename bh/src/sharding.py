@@ -0,0 +1,55 @@
+'''
+Splits the archiver's work between gateway shards.
+
+Discord assigns every guild to shard `(guild_id >> 22) % shard_count`. A process only receives the
+guilds of the shards it connects, so each process polls the threads of those guilds and nothing else.
+'''
+
+from typing import List, Optional, Set, Tuple
+
+from discord import Client
+from discord.abc import GuildChannel
+
+def shard_of(guild_id: int, shard_count: int) -> int:
+    return (guild_id >> 22) % shard_count
+
+def shard_ranges(shard_count: int, processes: int) -> List[Tuple[int, int]]:
+    '''
+    Splits the shards into `processes` contiguous ranges of about the same size.
+
+    ## Returns
+    `List[Tuple[int, int]]`
+        The first and the last shard ID of every range
+    '''
+    if processes < 1 or processes > shard_count:
+        raise ValueError("Cannot split {} shards between {} processes".format(shard_count, processes))
+    ranges: List[Tuple[int, int]] = []
+    start = 0
+    for i in range(processes):
+        size = shard_count // processes + (1 if i < shard_count % processes else 0)
+        ranges.append((start, start + size - 1))
+        start += size
+    return ranges
+
+def local_shards(client: Client) -> Optional[Set[int]]:
+    '''
+    The shards the client is connected to, or `None` if it is not sharded.
+    '''
+    shard_ids = getattr(client, "shard_ids", None)
+    if shard_ids != None:
+        return set(shard_ids)
+    if client.shard_id != None:
+        return {client.shard_id}
+    return None
+
+def owns_channel(client: Client, channel: Optional[GuildChannel]) -> bool:
+    '''
+    Whether the channel's guild is served by one of the client's shards.
+    '''
+    if channel == None:
+        # Channels of guilds on other shards are never cached
+        return False
+    shards = local_shards(client)
+    if shards == None or client.shard_count == None:
+        return True
+    return shard_of(channel.guild.id, client.shard_count) in shards
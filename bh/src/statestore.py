@@ -0,0 +1,249 @@
+'''
+Crash-safe storage of the tracked threads and their progress.
+
+The threads live in a SQLite database in WAL mode, and `last_floor` is written in its own small
+transaction after every archived post, so stopping or crashing the bot loses no progress.
+The old `config.csv` is imported into the database the first time it is opened.
+'''
+
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+import csv
+import sqlite3
+
+ThreadRow = Tuple[int, int, int, int, int, int] # channel_id, bsn, snA, last_floor, gp_thresh, bp_thresh
+
+class StateStore:
+
+    COLUMNS = ["channel_id", "bsn", "snA", "last_floor", "gp_thresh", "bp_thresh"]
+    KEY_COLUMNS = ["channel_id", "bsn", "snA"]
+
+    def __init__(self, path: Union[Path, str]):
+        '''
+        ## Parameters:
+        path: `Union[Path, str]`
+            The SQLite database file. Use ":memory:" for a store that is not persisted.
+        '''
+        self.path = str(path)
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS threads ("
+            "channel_id INTEGER, bsn INTEGER, snA INTEGER, last_floor INTEGER, gp_thresh INTEGER, bp_thresh INTEGER, "
+            "PRIMARY KEY (channel_id, bsn, snA))"
+        )
+        self.connection.execute("CREATE TABLE IF NOT EXISTS imports (path TEXT PRIMARY KEY)")
+        self.connection.commit()
+
+    def import_csv(self, csv_path: Union[Path, str], force: bool = False) -> int:
+        '''
+        Imports the threads of a config CSV.
+        Threads already in the store keep the furthest `last_floor` and take the thresholds from the CSV.
+        A forced import also stops tracking the threads that are no longer in the CSV.
+        Blank progress and thresholds count as 0, rows that cannot be read are skipped and logged.
+
+        ## Parameters:
+        csv_path: `Union[Path, str]`
+            The config CSV, with the columns of `COLUMNS`
+        force: `bool`
+            Import again even if the file was imported before, and remove the threads missing from it
+
+        ## Returns
+        `int`
+            Number of rows imported
+        '''
+        csv_path = Path(csv_path)
+        key = str(csv_path.resolve())
+        if not csv_path.exists():
+            return 0
+        if not force and self.connection.execute("SELECT 1 FROM imports WHERE path = ?", (key,)).fetchone() != None:
+            return 0
+
+        rows: List[ThreadRow] = []
+        unread: List[Tuple[int, int, int]] = [] # Threads of the rows skipped, which a forced import keeps
+        with csv_path.open(encoding="utf8", newline="") as fp:
+            # Line 1 is the header
+            for line, row in enumerate(csv.DictReader(fp), start=2):
+                try:
+                    rows.append(self.parse_row(row))
+                except ValueError as e:
+                    print("[CONFIG] Skipped line {} of {}: {}".format(line, csv_path, e))
+                    try:
+                        unread.append(tuple(int(row[column]) for column in self.KEY_COLUMNS))
+                    except (TypeError, ValueError):
+                        pass
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO threads ({}) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (channel_id, bsn, snA) DO UPDATE SET "
+                "last_floor = MAX(last_floor, excluded.last_floor), "
+                "gp_thresh = excluded.gp_thresh, bp_thresh = excluded.bp_thresh".format(", ".join(self.COLUMNS)),
+                rows,
+            )
+            self.connection.execute("INSERT OR IGNORE INTO imports (path) VALUES (?)", (key,))
+            num_removed = 0
+            if force:
+                kept = {row[:3] for row in rows} | set(unread)
+                removed = [thread for thread in self.connection.execute("SELECT channel_id, bsn, snA FROM threads") if thread not in kept]
+                self.connection.executemany("DELETE FROM threads WHERE channel_id = ? AND bsn = ? AND snA = ?", removed)
+                num_removed = len(removed)
+        print("[CONFIG] Imported {} threads from {}".format(len(rows), csv_path))
+        if num_removed > 0:
+            print("[CONFIG] Removed {} threads that are no longer in {}".format(num_removed, csv_path))
+        return len(rows)
+
+    def parse_row(self, row: dict) -> ThreadRow:
+        '''
+        Reads a row of the config CSV. Raises `ValueError` if a value is not an integer or the thread is not given.
+        '''
+        values = []
+        for column in self.COLUMNS:
+            value = (row.get(column) or "").strip()
+            if value == "":
+                if column in self.KEY_COLUMNS:
+                    raise ValueError("{} is blank".format(column))
+                value = "0"
+            try:
+                values.append(int(value))
+            except ValueError:
+                raise ValueError("{} is not an integer: {!r}".format(column, value)) from None
+        return tuple(values)
+
+    def load_threads(self) -> List[ThreadRow]:
+        return self.connection.execute("SELECT {} FROM threads ORDER BY rowid".format(", ".join(self.COLUMNS))).fetchall()
+
+    def set_last_floor(self, channel_id: int, bsn: int, snA: int, last_floor: int):
+        with self.connection:
+            self.connection.execute(
+                "UPDATE threads SET last_floor = ? WHERE channel_id = ? AND bsn = ? AND snA = ?",
+                (last_floor, channel_id, bsn, snA),
+            )
+
+    def save_threads(self, rows: List[ThreadRow]):
+        with self.connection:
+            self.connection.executemany(
+                "UPDATE threads SET last_floor = ?, gp_thresh = ?, bp_thresh = ? WHERE channel_id = ? AND bsn = ? AND snA = ?",
+                [(last_floor, gp_thresh, bp_thresh, channel_id, bsn, snA) for channel_id, bsn, snA, last_floor, gp_thresh, bp_thresh in rows],
+            )
+
+    def close(self):
+        self.connection.close()
+
+class ArchiveLedger:
+    '''
+    Remembers which Discord thread every archived floor was posted as, so that retries and restarts
+    do not create the same thread twice.
+
+    Lookups go through the primary key of a `WITHOUT ROWID` table, so a duplicate check is a single
+    index probe no matter how many floors have been archived.
+    '''
+
+    def __init__(self, path: Union[Path, str]):
+        '''
+        ## Parameters:
+        path: `Union[Path, str]`
+            The SQLite database file, which may be shared with a `StateStore`
+        '''
+        self.path = str(path)
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS archived ("
+            "bsn INTEGER, snA INTEGER, floor INTEGER, channel_id INTEGER, thread_id INTEGER, "
+            "PRIMARY KEY (bsn, snA, floor, channel_id)) WITHOUT ROWID"
+        )
+        self.connection.commit()
+
+    def get(self, channel_id: int, bsn: int, snA: int, floor: int) -> Optional[int]:
+        '''
+        ## Returns
+        `Optional[int]`
+            The ID of the Discord thread the floor was archived as, or `None` if it was not archived
+        '''
+        row = self.connection.execute(
+            "SELECT thread_id FROM archived WHERE bsn = ? AND snA = ? AND floor = ? AND channel_id = ?",
+            (bsn, snA, floor, channel_id),
+        ).fetchone()
+        return row[0] if row != None else None
+
+    def record(self, channel_id: int, bsn: int, snA: int, floor: int, thread_id: int):
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO archived (bsn, snA, floor, channel_id, thread_id) VALUES (?, ?, ?, ?, ?)",
+                (bsn, snA, floor, channel_id, thread_id),
+            )
+
+    def forget(self, channel_id: int, bsn: int, snA: int, floor: int):
+        with self.connection:
+            self.connection.execute(
+                "DELETE FROM archived WHERE bsn = ? AND snA = ? AND floor = ? AND channel_id = ?",
+                (bsn, snA, floor, channel_id),
+            )
+
+    def close(self):
+        self.connection.close()
+
+class FloorIndex:
+    '''
+    Remembers the first and last floor of every page of a thread, learned while its pages are parsed.
+
+    Pages hold 20 posts, but deleted floors are not shown, so a floor is often on an earlier page than
+    `floor // 20 + 1`. Looking up a floor only reads the pages of its thread, through the primary key.
+    '''
+
+    POSTS_PER_PAGE = 20
+
+    def __init__(self, path: Union[Path, str]):
+        '''
+        ## Parameters:
+        path: `Union[Path, str]`
+            The SQLite database file, which may be shared with a `StateStore`
+        '''
+        self.path = str(path)
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS page_floors ("
+            "bsn INTEGER, snA INTEGER, page INTEGER, first_floor INTEGER, last_floor INTEGER, num_posts INTEGER, "
+            "PRIMARY KEY (bsn, snA, page)) WITHOUT ROWID"
+        )
+        self.connection.commit()
+
+    def record(self, bsn: int, snA: int, page: int, first_floor: int, last_floor: int, num_posts: int):
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO page_floors (bsn, snA, page, first_floor, last_floor, num_posts) VALUES (?, ?, ?, ?, ?, ?)",
+                (bsn, snA, page, first_floor, last_floor, num_posts),
+            )
+
+    def page_of(self, bsn: int, snA: int, floor: int) -> Optional[int]:
+        '''
+        ## Returns
+        `Optional[int]`
+            The page that holds the floor, or would hold it once it is posted.
+            `None` if no page at or before the floor has been indexed.
+        '''
+        row = self.connection.execute(
+            "SELECT page, last_floor, num_posts FROM page_floors WHERE bsn = ? AND snA = ? AND first_floor <= ? "
+            "ORDER BY page DESC LIMIT 1",
+            (bsn, snA, floor),
+        ).fetchone()
+        if row == None:
+            return None
+        page, last_floor, num_posts = row
+        if floor > last_floor and num_posts >= self.POSTS_PER_PAGE:
+            # The page was full, later floors are on the next one
+            return page + 1
+        return page
+
+    def close(self):
+        self.connection.close()
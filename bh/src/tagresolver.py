@@ -0,0 +1,102 @@
+'''
+Matches the hashtags of posts to the tags of forum channels.
+
+A channel's tags are compiled once into a dictionary keyed by normalized name, so a post's tags are
+found with one lookup per hashtag instead of a scan over the channel's tags. Names are compared after
+NFKC normalization and case folding, so `#VTuber`, `#vtuber` and `#ＶＴｕｂｅｒ` all match the same tag.
+A resolver is only rebuilt when the tags of its channel change.
+'''
+
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+import unicodedata
+
+from discord import ForumChannel, ForumTag
+from discord.abc import GuildChannel
+from discord.ext.commands import Bot
+
+MAX_APPLIED_TAGS = 5 # Discord allows at most 5 tags on a thread
+
+def normalize(name: str) -> str:
+    '''
+    Folds width and case, and drops a leading `#`.
+    '''
+    return unicodedata.normalize("NFKC", name).strip().lstrip("#").strip().casefold()
+
+class TagResolver:
+
+    def __init__(self, tags: Sequence[ForumTag], aliases: Optional[Dict[str, List[str]]] = None):
+        '''
+        ## Parameters:
+        tags: `Sequence[ForumTag]`
+            The available tags of the channel, in the channel's order
+        aliases: `Optional[Dict[str, List[str]]]`
+            Other hashtags that mean a tag, by tag name
+        '''
+        self.keys: Dict[str, ForumTag] = {}
+        self.priority: Dict[int, int] = {}
+        normalized_aliases = {normalize(name): names for name, names in (aliases or {}).items()}
+        for index, tag in enumerate(tags):
+            self.priority[tag.id] = index
+            for key in [tag.name] + normalized_aliases.get(normalize(tag.name), []):
+                # The first tag keeps a key that several tags normalize to
+                self.keys.setdefault(normalize(key), tag)
+
+    def resolve(self, hashtags: Sequence[str]) -> List[ForumTag]:
+        '''
+        Finds the tags of a post's hashtags.
+        If more tags match than a thread can have, the ones listed first in the channel are kept.
+
+        ## Parameters:
+        hashtags: `Sequence[str]`
+            The hashtags of the post
+
+        ## Returns
+        `List[ForumTag]`
+            At most `MAX_APPLIED_TAGS` tags, in the channel's order
+        '''
+        found: Dict[int, ForumTag] = {}
+        for hashtag in hashtags:
+            tag = self.keys.get(normalize(hashtag))
+            if tag != None:
+                found[tag.id] = tag
+        return sorted(found.values(), key=lambda tag: self.priority[tag.id])[:MAX_APPLIED_TAGS]
+
+def tag_signature(channel: GuildChannel) -> List[Tuple[int, str]]:
+    return [(tag.id, tag.name) for tag in getattr(channel, "available_tags", [])]
+
+class TagResolvers:
+    '''
+    The resolvers of every channel, dropped when the channel's tags are edited.
+    '''
+
+    def __init__(self, aliases: Optional[Dict[str, List[str]]] = None):
+        self.aliases = aliases if aliases != None else {}
+        self.resolvers: Dict[int, TagResolver] = {}
+        self.attached: Set[int] = set()
+
+    def attach(self, bot: Bot):
+        '''
+        Keeps the resolvers up to date with the channel events of the bot. Attaching the same bot twice does nothing.
+        '''
+        if id(bot) in self.attached:
+            return
+        self.attached.add(id(bot))
+        bot.add_listener(self.on_guild_channel_update)
+        bot.add_listener(self.on_guild_channel_delete)
+
+    def get(self, channel: ForumChannel) -> TagResolver:
+        resolver = self.resolvers.get(channel.id)
+        if resolver == None:
+            resolver = TagResolver(channel.available_tags, self.aliases)
+            self.resolvers[channel.id] = resolver
+        return resolver
+
+    def resolve(self, channel: ForumChannel, hashtags: Sequence[str]) -> List[ForumTag]:
+        return self.get(channel).resolve(hashtags)
+
+    async def on_guild_channel_update(self, before: GuildChannel, after: GuildChannel):
+        if tag_signature(before) != tag_signature(after):
+            self.resolvers.pop(after.id, None)
+
+    async def on_guild_channel_delete(self, channel: GuildChannel):
+        self.resolvers.pop(channel.id, None)
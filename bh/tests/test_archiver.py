@@ -0,0 +1,76 @@
+'''
+Polls `BHThread` against synthetic forum pages served from memory, with the fake channel of the bench harness.
+
+Run with: python -m pytest bh/tests
+'''
+
+from pathlib import Path
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlparse
+import asyncio
+import sys
+import unittest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "bench"))
+
+from archiver import BHThread
+from fetcher import FetchResult
+from harness import BSN, CallLog, FakeForumChannel
+from forumpages import make_page
+from pagecache import PageCache
+import fetcher
+
+SNA = 1000
+
+class PageFetcher:
+    '''
+    Serves the pages of one synthetic thread, as `AsyncFetcher` does.
+    '''
+
+    def __init__(self, num_floors: int, deleted: int = 0):
+        self.num_floors = num_floors
+        self.deleted = deleted
+
+    async def fetch(self, url: str, headers: Optional[Dict[str, str]] = None) -> FetchResult:
+        page = int(parse_qs(urlparse(url).query).get("page", ["1"])[0])
+        html = make_page(BSN, SNA, page, self.num_floors, "plain", title="討論串", deleted=self.deleted)
+        return FetchResult(url, 200, html, {})
+
+class FetchThreadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.shared_fetcher = fetcher.shared_fetcher
+        self.log = CallLog()
+        self.channel = FakeForumChannel(1, self.log, latency=0.0)
+
+    def tearDown(self):
+        fetcher.shared_fetcher = self.shared_fetcher
+
+    def archived_floors(self):
+        return [int(name.split()[-1].rstrip("樓")) for _, name in self.log.created]
+
+    def poll(self, bh_thread: BHThread):
+        asyncio.run(bh_thread.fetch_thread_posts())
+
+    def test_estimate_past_the_only_page(self):
+        # 29 floors with every 3rd one deleted fit on one page, the estimate from floor 21 points to page 2
+        fetcher.shared_fetcher = PageFetcher(29, deleted=3)
+        bh_thread = BHThread(self.channel, BSN, SNA, 21, 0, 0, page_cache=PageCache(":memory:"))
+        self.assertEqual(bh_thread.start_page, 2)
+        self.poll(bh_thread)
+        self.assertEqual(self.archived_floors(), [22, 23, 25, 26, 28, 29])
+        self.assertEqual(bh_thread.last_floor, 29)
+
+        # Nothing new, and nothing posted twice
+        self.poll(bh_thread)
+        self.assertEqual(len(self.log.created), 6)
+
+    def test_first_page(self):
+        fetcher.shared_fetcher = PageFetcher(5)
+        bh_thread = BHThread(self.channel, BSN, SNA, 2, 0, 0)
+        self.poll(bh_thread)
+        self.assertEqual(self.archived_floors(), [3, 4, 5])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -14,9 +14,11 @@ import basiccommands
 import forumcommands
 import countercommand
 import bahamutarchiver
+from ratelimit import get_rate_limiter
 
 # Setting up the bot
-BotEssentials.setup_bot()
+# None of the cogs need member or presence events
+BotEssentials.setup_bot(http_trace=get_rate_limiter().trace_config(), profile="interactive")
 bot = BotEssentials.bot
 
 @BotEssentials.bot.event
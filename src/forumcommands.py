@@ -10,6 +10,7 @@ from discord.app_commands import CommandTree, ContextMenu, Command, Group, descr
 from discord.channel import ForumChannel
 
 from settings import SharedVariables
+from channelcache import get_channel_cache
 
 class ChannelDropdown(discord.ui.Select):
 
@@ -84,12 +85,7 @@ class ForumCommands(commands.Cog):
         `abc.GuildChannel`
             The first channel object that matches in both criteria
         '''
-        channels = await ctx.guild.fetch_channels()
-        if type != None:
-            found_channel = discord.utils.get(channels, name=channel_name, type=type)
-        else:
-            found_channel = discord.utils.get(channels, name=channel_name)
-        return found_channel
+        return await get_channel_cache().find(ctx.guild, channel_name, type)
 
     @commands.hybrid_command(name="get-channel-info")
     @describe(channel_name="Channel Name")
@@ -130,7 +126,8 @@ class ForumCommands(commands.Cog):
             return f"(ID: {tag.id}) {emoji}{tag.name}"
 
         if found_channel != None:
-            await ctx.send("\n".join([tag2str(tag)  for tag in found_channel.available_tags]))
+            tags = await get_channel_cache().available_tags(ctx.guild, found_channel.id)
+            await ctx.send("\n".join([tag2str(tag)  for tag in tags]))
         else:
             await ctx.send("Channel {} is not a forum channel.")
 
@@ -141,8 +138,7 @@ class ForumCommands(commands.Cog):
         Create a forum post through a sequence of interactions
         '''
         print("[LOG] User {} wants to interactively create a thread.".format(interaction.user))
-        all_channels = await interaction.guild.fetch_channels()
-        forum_channels = [channel for channel in all_channels if type(channel) is ForumChannel]
+        forum_channels = await get_channel_cache().forum_channels(interaction.guild)
 
         # Prompt user to enter thread title and content
         modal = ThreadContentDialogue(title="Create Thread Content...")
@@ -181,7 +177,7 @@ class ForumCommands(commands.Cog):
         return selected_channel
     
     async def ask_select_tags(self, interaction: Interaction, selected_channel: ForumChannel):
-        all_tags = selected_channel.available_tags
+        all_tags = await get_channel_cache().available_tags(interaction.guild, selected_channel.id)
         
         # Prompt user to select the forum channel they want to create the thread in
         view = SelectMessage()
@@ -199,7 +195,7 @@ class ForumCommands(commands.Cog):
         
         # Edit out the dropdown box after user selects
         # selected_channel: ForumChannel = interaction.guild.get_channel(channel_id)
-        selected_tags = [tag for tag in selected_channel.available_tags if str(tag.id) in selected_ids]
+        selected_tags = await get_channel_cache().get_tags(interaction.guild, selected_channel.id, [int(tag_id) for tag_id in selected_ids])
         tags_str = ", ".join([tag.name for tag in selected_tags])
         await interaction.followup.edit_message(message_id=response1.id, content="Tags: {}".format(tags_str), view=None)
 
@@ -229,4 +225,5 @@ class ForumCommands(commands.Cog):
 
 
 async def setup(bot: commands.Bot) -> None:
+  get_channel_cache().attach(bot)
   await bot.add_cog(ForumCommands(bot))
\ No newline at end of file
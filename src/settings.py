@@ -1,42 +1,125 @@
 
-from discord import Intents, Client
-from discord.ext.commands import Bot
+from typing import List, Optional
+
+from aiohttp import TraceConfig
+from discord import Intents, Client, MemberCacheFlags
+from discord.ext.commands import AutoShardedBot, Bot
+
+class BotProfile():
+    '''
+    How much of the gateway a bot subscribes to and keeps in memory.
+    - `archiver`: Guilds and guild messages only, enough for prefix commands and forum channels. Nothing else is cached.
+    - `interactive`: The default intents without typing events, for slash commands and components.
+      Members are only cached from interactions.
+    - `full`: Every intent, including the privileged `presences` and `members`, with every member cached.
+    '''
+
+    NAMES = ["archiver", "interactive", "full"]
+
+    def __init__(self, intents: Intents, member_cache_flags: MemberCacheFlags, chunk_guilds_at_startup: bool, max_messages: Optional[int]):
+        self.intents = intents
+        self.member_cache_flags = member_cache_flags
+        self.chunk_guilds_at_startup = chunk_guilds_at_startup
+        self.max_messages = max_messages
+
+    @property
+    def options(self) -> dict:
+        '''
+        The keyword arguments of `Client` and `Bot` for this profile.
+        '''
+        return {
+            "intents": self.intents,
+            "member_cache_flags": self.member_cache_flags,
+            "chunk_guilds_at_startup": self.chunk_guilds_at_startup,
+            "max_messages": self.max_messages,
+        }
+
+    @classmethod
+    def get(cls, name: str) -> "BotProfile":
+        '''
+        ## Parameters:
+        name: `str`
+            One of `NAMES`
+        '''
+        match name:
+            case "archiver":
+                intents = Intents.none()
+                intents.guilds = True
+                intents.guild_messages = True
+                intents.message_content = True
+                return cls(intents, MemberCacheFlags.none(), False, None)
+            case "interactive":
+                intents = Intents.default()
+                intents.typing = False
+                intents.message_content = True
+                return cls(intents, MemberCacheFlags.from_intents(intents), False, 1000)
+            case "full":
+                intents = Intents.default()
+                intents.message_content = True
+                intents.presences = True
+                intents.members = True
+                return cls(intents, MemberCacheFlags.all(), True, 1000)
+            case _:
+                raise ValueError("Unknown bot profile: {}".format(name))
 
 class BotEssentials():
 
     intents: Intents = None
+    profile: BotProfile = None
     client: Client = None
     bot: Bot = None
 
     @classmethod
-    def setup_bot(self):
+    def setup_bot(
+        self,
+        http_trace: Optional[TraceConfig] = None,
+        profile: str = "full",
+        sharded: bool = False,
+        shard_count: Optional[int] = None,
+        shard_ids: Optional[List[int]] = None,
+    ):
         '''
         Setting up a bot (interactions based on commands)
+
+        ## Parameters:
+        http_trace: `Optional[TraceConfig]`
+            Traces the HTTP requests the bot sends to Discord
+        profile: `str`
+            The intents and caching of the bot, one of `BotProfile.NAMES`
+        sharded: `bool`
+            Connects through an `AutoShardedBot` instead of a single gateway connection
+        shard_count: `Optional[int]`
+            Total number of shards. `None` uses the number recommended by Discord.
+        shard_ids: `Optional[List[int]]`
+            The shards this process connects, all of them if `None`. Needs `shard_count`.
         '''
-        intents = Intents.default()
-        intents.message_content = True
-        intents.presences = True
-        intents.members = True
+        bot_profile = BotProfile.get(profile)
 
-        bot = Bot(command_prefix='!', intents=intents)
+        if sharded or shard_ids != None:
+            bot = AutoShardedBot(command_prefix='!', http_trace=http_trace, shard_count=shard_count, shard_ids=shard_ids, **bot_profile.options)
+        else:
+            bot = Bot(command_prefix='!', http_trace=http_trace, **bot_profile.options)
 
-        BotEssentials.intents = intents
+        BotEssentials.intents = bot_profile.intents
+        BotEssentials.profile = bot_profile
         BotEssentials.bot = bot
 
     @classmethod
-    def setup_client(self):
+    def setup_client(self, profile: str = "full"):
         '''
         Setting up a client (interaction based on messages)
+
+        ## Parameters:
+        profile: `str`
+            The intents and caching of the client, one of `BotProfile.NAMES`
         '''
-        intents = Intents.default()
-        intents.message_content = True
-        intents.presences = True
-        intents.members = True
+        bot_profile = BotProfile.get(profile)
 
-        client = Client(intents=intents)
+        client = Client(**bot_profile.options)
 
         BotEssentials.client = client
-        BotEssentials.intents = intents
+        BotEssentials.intents = bot_profile.intents
+        BotEssentials.profile = bot_profile
 
 class SharedVariables():
 
@@ -2,12 +2,19 @@
 References:
     https://realpython.com/api-integration-in-python/
     https://discord.com/developers/docs/resources/webhook
+    https://discord.com/developers/docs/topics/rate-limits
 '''
 
+from typing import Dict, List, Optional, Union
+import asyncio
+import json
+from urllib.parse import urlparse
+
+import aiohttp
 import requests
-from typing import Union
+from discord import File
 
-from mycredentials import WEBHOOK_ID, WEBHOOK_TOKEN
+from ratelimit import RateLimiter, discord_route, get_rate_limiter
 
 class Webhook():
 
@@ -17,6 +24,22 @@ class Webhook():
         self.id = id
         self.token = token
 
+    @classmethod
+    def from_url(cls, url: str) -> "Webhook":
+        """
+        Creates a webhook from its URL, as copied from the channel settings.
+        """
+        id, token = urlparse(url).path.rstrip("/").split("/")[-2:]
+        return cls(id, token)
+
+    @property
+    def route(self) -> str:
+        """
+        The rate limit key of the webhook. Discord limits every webhook separately.
+        The token is left out so it does not show up in logs.
+        """
+        return discord_route("POST", "/webhooks/{}".format(self.id))
+
     def generate_url(self, wait: bool=False, thread_id: Union[int, str]=""):
         """
         Generates an URL for API calls.
@@ -48,7 +71,7 @@ class Webhook():
         )
 
         return url
-    
+
     def get_info(self) -> dict:
         """
         Retrieves the basic info of the webhook.
@@ -63,38 +86,307 @@ class Webhook():
 
         return response.json()
 
-def demo():
+class WebhookError(Exception):
+
+    def __init__(self, webhook: Webhook, status: int, body: str):
+        super().__init__("Webhook {} returned status {}: {}".format(webhook.id, status, body))
+        self.webhook = webhook
+        self.status = status
+        self.body = body
+
+class WebhookClient():
+    """
+    Executes webhooks over one pooled `aiohttp` session.
+
+    Every request waits on the bucket of its webhook in a `RateLimiter`, and the bucket is corrected
+    by the `X-RateLimit-*` headers of the response, so webhooks are used at the highest rate Discord
+    allows without running into 429s. Requests that are limited anyway are retried after `Retry-After`.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 10,
+        timeout: float = 30.0,
+        max_retries: int = 3,
+        rate_limiter: Optional[RateLimiter] = None,
+    ):
+        """
+        Parameters:
+            max_connections: Size of the connection pool
+            timeout: Total time in seconds a request may take
+            max_retries: Number of times a rate limited request is sent again
+            rate_limiter: (optional) Defaults to the limiter shared with the bot
+        """
+        self.max_connections = max_connections
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.max_retries = max_retries
+        self.rate_limiter = rate_limiter if rate_limiter != None else get_rate_limiter()
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.waited = 0.0 # Seconds spent waiting on buckets
+
+    async def open(self):
+        if self.session == None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+
+    async def close(self):
+        if self.session != None:
+            await self.session.close()
+            self.session = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    @staticmethod
+    def build_form(payload: dict, files: List[File]) -> aiohttp.FormData:
+        form = aiohttp.FormData()
+        payload = dict(payload)
+        payload["attachments"] = [{"id": i, "filename": file.filename} for i, file in enumerate(files)]
+        form.add_field("payload_json", json.dumps(payload), content_type="application/json")
+        for i, file in enumerate(files):
+            file.fp.seek(0)
+            form.add_field("files[{}]".format(i), file.fp.read(), filename=file.filename)
+        return form
+
+    async def request(
+        self,
+        method: str,
+        webhook: Webhook,
+        payload: Optional[dict] = None,
+        files: Optional[List[File]] = None,
+        wait: bool = True,
+        thread_id: Union[int, str] = "",
+    ) -> Optional[dict]:
+        """
+        Sends a request to a webhook, waiting for its bucket first.
+
+        Parameters:
+            method: The HTTP method
+            webhook: The webhook to execute
+            payload: (optional) The JSON body
+            files: (optional) Attachments, sent as multipart form data along with the payload
+            wait: Whether Discord returns the created message
+            thread_id: (optional) The thread to post in
+
+        Returns:
+            The JSON response as `dict`, or `None` if there is no body
+        """
+        await self.open()
+        url = webhook.generate_url(wait=wait, thread_id=thread_id)
+        for attempt in range(self.max_retries + 1):
+            self.waited += await self.rate_limiter.wait(webhook.route)
+            kwargs = {}
+            if files:
+                kwargs["data"] = self.build_form(payload or {}, files)
+            elif payload != None:
+                kwargs["json"] = payload
+            async with self.session.request(method, url, **kwargs) as response:
+                self.rate_limiter.update(webhook.route, response.status, response.headers)
+                body = await response.text()
+                if response.status == 429 and attempt < self.max_retries:
+                    # The bucket is blocked for Retry-After, so the next wait covers it
+                    continue
+                if response.status >= 400:
+                    raise WebhookError(webhook, response.status, body)
+                return json.loads(body) if body else None
+
+    async def get_info(self, webhook: Webhook) -> dict:
+        """
+        Retrieves the basic info of the webhook.
+        """
+        return await self.request("GET", webhook, wait=False)
+
+    async def send(
+        self,
+        webhook: Webhook,
+        content: str = "",
+        thread_id: Union[int, str] = "",
+        thread_name: Optional[str] = None,
+        applied_tags: Optional[List[int]] = None,
+        files: Optional[List[File]] = None,
+        username: Optional[str] = None,
+        avatar_url: Optional[str] = None,
+    ) -> dict:
+        """
+        Sends a message through a webhook.
+
+        Parameters:
+            webhook: The webhook to execute
+            content: The message
+            thread_id: (optional) Send the message in an existing thread of the webhook's channel
+            thread_name: (optional) Create a thread with this name in a forum channel, starting with the message
+            applied_tags: (optional) IDs of the forum tags of the new thread
+            files: (optional) Attachments
+            username, avatar_url: (optional) Override the name and avatar of the webhook
+
+        Returns:
+            The created message as `dict`. For a new thread, its `channel_id` is the ID of the thread.
+        """
+        payload: Dict[str, object] = {"content": content}
+        if thread_name != None:
+            payload["thread_name"] = thread_name
+        if applied_tags:
+            payload["applied_tags"] = [str(tag) for tag in applied_tags]
+        if username != None:
+            payload["username"] = username
+        if avatar_url != None:
+            payload["avatar_url"] = avatar_url
+        return await self.request("POST", webhook, payload, files, wait=True, thread_id=thread_id)
+
+    async def create_thread(self, webhook: Webhook, thread_name: str, content: str = "", **kwargs) -> dict:
+        """
+        Creates a thread in the forum channel of the webhook. Takes the same options as `send`.
+        """
+        return await self.send(webhook, content, thread_name=thread_name, **kwargs)
+
+    async def send_many(self, webhook: Webhook, contents: List[str], thread_id: Union[int, str] = "", **kwargs) -> List[dict]:
+        """
+        Sends messages one after another, so they appear in the given order.
+        """
+        messages: List[dict] = []
+        for content in contents:
+            messages.append(await self.send(webhook, content, thread_id=thread_id, **kwargs))
+        return messages
+
+    async def send_to_threads(self, webhook: Webhook, contents: Dict[int, List[str]], **kwargs) -> Dict[int, List[dict]]:
+        """
+        Sends messages to several threads at the same time, keeping their order within each thread.
+
+        Parameters:
+            contents: The messages of every thread, by thread ID
+        """
+        thread_ids = list(contents)
+        results = await asyncio.gather(*[self.send_many(webhook, contents[thread_id], thread_id, **kwargs) for thread_id in thread_ids])
+        return dict(zip(thread_ids, results))
+
+class WebhookPublisher():
+    """
+    Creates threads in one forum channel through a pool of that channel's webhooks.
+
+    Every webhook has its own rate limit bucket, so taking turns between them raises the rate at which
+    threads can be created. Threads are still created strictly in the order `publish` is called:
+    each creation is awaited before the next one starts, so only the waits on the buckets are saved.
+    """
+
+    def __init__(self, webhooks: List[Webhook], client: Optional[WebhookClient] = None):
+        """
+        Parameters:
+            webhooks: Webhooks of the same forum channel
+            client: (optional) Defaults to the shared client
+        """
+        if len(webhooks) == 0:
+            raise ValueError("A publisher needs at least one webhook")
+        self.webhooks = webhooks
+        self.client = client if client != None else get_webhook_client()
+        self.next_index = 0
+        self.lock = asyncio.Lock()
+        self.published = 0
+
+    def next_webhook(self) -> Webhook:
+        """
+        Picks the next webhook in turn, passing over webhooks whose bucket is empty if another has room.
+        """
+        best_index, best_delay = self.next_index, None
+        for offset in range(len(self.webhooks)):
+            index = (self.next_index + offset) % len(self.webhooks)
+            delay = self.client.rate_limiter.bucket(self.webhooks[index].route).delay()
+            if best_delay == None or delay < best_delay:
+                best_index, best_delay = index, delay
+            if delay == 0:
+                break
+        self.next_index = (best_index + 1) % len(self.webhooks)
+        return self.webhooks[best_index]
+
+    async def publish(
+        self,
+        thread_name: str,
+        content: str = "",
+        applied_tags: Optional[List[int]] = None,
+        files: Optional[List[File]] = None,
+        followups: Optional[List[str]] = None,
+    ) -> int:
+        """
+        Creates a thread, then sends the follow up messages in it.
+        Follow ups do not hold up the creation of the next thread.
+
+        Returns:
+            The ID of the new thread
+        """
+        async with self.lock:
+            webhook = self.next_webhook()
+            message = await self.client.create_thread(webhook, thread_name, content, applied_tags=applied_tags, files=files)
+        thread_id = int(message["channel_id"])
+        self.published += 1
+        if followups:
+            await self.send_followups(thread_id, followups)
+        return thread_id
+
+    async def send_followups(self, thread_id: int, messages: List[str]):
+        """
+        Sends messages to a thread in order, each through the next webhook in turn.
+        """
+        for message in messages:
+            await self.client.send(self.next_webhook(), message, thread_id=thread_id)
+
+    async def close(self):
+        await self.client.close()
+
+# The client shared by every webhook user in the process
+shared_client: Optional[WebhookClient] = None
+
+def configure_webhook_client(**kwargs) -> WebhookClient:
+    """
+    Replaces the shared client with one built from the given `WebhookClient` arguments.
+    Must be called before the first webhook is executed.
+    """
+    global shared_client
+    shared_client = WebhookClient(**kwargs)
+    return shared_client
+
+def get_webhook_client() -> WebhookClient:
+    global shared_client
+    if shared_client == None:
+        shared_client = WebhookClient()
+    return shared_client
+
+async def close_webhook_client():
+    if shared_client != None:
+        await shared_client.close()
+
+async def demo():
+    from mycredentials import WEBHOOK_ID, WEBHOOK_TOKEN
+
     msg = "A simple demo of using webhook in forum channels.\nFor more details, visit https://discord.com/developers/docs/resources/webhook"
     print(msg)
 
     # Create webhook object
     webhook = Webhook(WEBHOOK_ID, WEBHOOK_TOKEN)
 
-    # GET Webhook
-    webhook_info = webhook.get_info()
-    print(webhook_info)
-
-    # Send message by creating a new thread
-    # You need to specify a "thread_name" to create a thread 
-    params = {
-        "content": "test",
-        "thread_name": "Test",
-        "avatar_url": "https://i.imgur.com/dGOpgPp.png", # Override Webhook avatar 
-        "username": "I Changed My Name!", # Override Webhook name
-    }
-    print(webhook.generate_url(wait=True))
-    response: requests.Response = requests.post(webhook.generate_url(wait=True), json=params)
-    print(response.status_code, response.json())
-
-    # Send message at a existing thread
-    # You need to specify the thread id in the url, not in the JSON params
-    print(response.json()["id"]) # Using the thread we just created
-    params = {
-        "content": "Hello World!",
-    }
-    thread_id = response.json()["id"]
-    response: requests.Response = requests.post(webhook.generate_url(wait=True, thread_id=thread_id), json=params)
-    print(response.status_code, response.json())
+    async with WebhookClient() as client:
+        # GET Webhook
+        webhook_info = await client.get_info(webhook)
+        print(webhook_info)
+
+        # Send message by creating a new thread
+        # You need to specify a "thread_name" to create a thread
+        message = await client.create_thread(
+            webhook,
+            "Test",
+            "test",
+            avatar_url="https://i.imgur.com/dGOpgPp.png", # Override Webhook avatar
+            username="I Changed My Name!", # Override Webhook name
+        )
+        print(message)
+
+        # Send messages at a existing thread
+        # The thread id goes in the url, not in the JSON params
+        thread_id = message["channel_id"] # Using the thread we just created
+        messages = await client.send_many(webhook, ["Hello World!", "Hello again!"], thread_id=thread_id)
+        print([message["id"] for message in messages])
 
 if __name__ == "__main__":
-    demo()
\ No newline at end of file
+    asyncio.run(demo())